@@ -7,7 +7,7 @@ from alembic import context
 
 # Import our models so Alembic can autogenerate migrations
 from app.db.base_class import Base
-from app.models import user, document, chat_session, jurisprudence, usage
+from app.models import user, document, chat_session, jurisprudence, usage, credit_ledger
 from app.core.config import settings
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,29 @@
+"""add chat messages session index
+
+Revision ID: 5f1b8e3a6c47
+Revises: d2a7f4c9b813
+Create Date: 2026-10-17 15:22:31.604218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1b8e3a6c47'
+down_revision: Union[str, None] = 'd2a7f4c9b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_chat_messages_session_created_at_id',
+        'chat_messages',
+        ['session_id', 'created_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_messages_session_created_at_id', table_name='chat_messages')
@@ -0,0 +1,35 @@
+"""add chat session last_message_at
+
+Revision ID: 8c3f5a1e7d20
+Revises: 4b7e2d9c1a36
+Create Date: 2026-10-17 11:40:02.734519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f5a1e7d20'
+down_revision: Union[str, None] = '4b7e2d9c1a36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    # Sessões existentes: último envio do usuário (mantém NULL nas que ainda não têm mensagens)
+    op.execute(
+        """
+        UPDATE chat_sessions SET last_message_at = (
+            SELECT MAX(chat_messages.created_at) FROM chat_messages
+            WHERE chat_messages.session_id = chat_sessions.id AND chat_messages.role = 'user'
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('chat_sessions', 'last_message_at')
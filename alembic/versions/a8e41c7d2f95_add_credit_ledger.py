@@ -0,0 +1,85 @@
+"""add credit ledger
+
+Revision ID: a8e41c7d2f95
+Revises: 5f1b8e3a6c47
+Create Date: 2026-10-17 17:48:12.390561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e41c7d2f95'
+down_revision: Union[str, None] = '5f1b8e3a6c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Parte inteira dos créditos comprados (users.available_credits é Float)
+PURCHASED_CREDITS = "CAST(FLOOR(COALESCE(available_credits, 0)) AS INTEGER)"
+
+
+def upgrade() -> None:
+    op.create_table(
+        'credit_ledger',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('reference', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_credit_ledger_user_created_at', 'credit_ledger', ['user_id', 'created_at'])
+
+    # Saldo de abertura de cada usuário no ledger. Os créditos comprados
+    # (available_credits) têm uma linha própria, usada pelo downgrade
+    op.execute(
+        """
+        INSERT INTO credit_ledger (id, user_id, amount, kind, reference, created_at)
+        SELECT 'opening-' || id, id, COALESCE(token_credits, 0), 'opening', NULL, CURRENT_TIMESTAMP
+        FROM users
+        WHERE COALESCE(token_credits, 0) <> 0
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO credit_ledger (id, user_id, amount, kind, reference, created_at)
+        SELECT 'opening-purchased-' || id, id, {PURCHASED_CREDITS}, 'opening', 'available_credits', CURRENT_TIMESTAMP
+        FROM users
+        WHERE {PURCHASED_CREDITS} > 0
+        """
+    )
+    # Saldo único em token_credits: créditos comprados passam para ele
+    op.execute(
+        f"""
+        UPDATE users SET
+            token_credits = COALESCE(token_credits, 0) + {PURCHASED_CREDITS},
+            available_credits = 0
+        """
+    )
+
+
+def downgrade() -> None:
+    # Devolver a available_credits os créditos comprados (saldo de abertura + compras
+    # feitas depois do upgrade), limitados ao saldo atual: o consumo desde o upgrade
+    # é descontado primeiro dos demais créditos. O total do usuário não muda.
+    purchased = """
+        (SELECT COALESCE(SUM(l.amount), 0) FROM credit_ledger l
+         WHERE l.user_id = users.id
+           AND (l.kind = 'purchase' OR (l.kind = 'opening' AND l.reference = 'available_credits')))
+    """
+    moved = f"CASE WHEN {purchased} > token_credits THEN token_credits ELSE {purchased} END"
+    op.execute(
+        f"""
+        UPDATE users SET
+            available_credits = COALESCE(available_credits, 0) + {moved},
+            token_credits = token_credits - {moved}
+        WHERE token_credits > 0
+        """
+    )
+    op.drop_index('ix_credit_ledger_user_created_at', table_name='credit_ledger')
+    op.drop_table('credit_ledger')
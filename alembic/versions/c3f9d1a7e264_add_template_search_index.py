@@ -0,0 +1,48 @@
+"""add template search index
+
+Revision ID: c3f9d1a7e264
+Revises: a8e41c7d2f95
+Create Date: 2026-10-17 19:05:47.218334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# DDL compartilhada com TemplateSearch.ensure_index (bancos criados sem o Alembic)
+from app.services.template_search import (
+    POSTGRES_DROP_DDL,
+    POSTGRES_INDEX_DDL,
+    SQLITE_DROP_DDL,
+    SQLITE_INDEX_DDL,
+    SQLITE_REBUILD,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f9d1a7e264'
+down_revision: Union[str, None] = 'a8e41c7d2f95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Nome (A) > descrição (B) > texto (C), com stemming em português
+        for statement in POSTGRES_INDEX_DDL:
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_INDEX_DDL:
+            op.execute(statement)
+        op.execute(SQLITE_REBUILD)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_DROP_DDL:
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DROP_DDL:
+            op.execute(statement)
@@ -0,0 +1,56 @@
+"""add chat session list fields
+
+Revision ID: d2a7f4c9b813
+Revises: 8c3f5a1e7d20
+Create Date: 2026-10-17 14:05:48.120937
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7f4c9b813'
+down_revision: Union[str, None] = '8c3f5a1e7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('chat_sessions', sa.Column('total_tokens', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('chat_sessions', sa.Column('last_message_preview', sa.String(length=200), nullable=True))
+    op.create_index(
+        'ix_chat_sessions_user_updated_at_id',
+        'chat_sessions',
+        ['user_id', 'updated_at', 'id']
+    )
+    # Sessões existentes: contadores e prévia calculados a partir das mensagens
+    op.execute(
+        """
+        UPDATE chat_sessions SET
+            message_count = (
+                SELECT COUNT(*) FROM chat_messages
+                WHERE chat_messages.session_id = chat_sessions.id
+            ),
+            total_tokens = (
+                SELECT COALESCE(SUM(chat_messages.tokens_used), 0) FROM chat_messages
+                WHERE chat_messages.session_id = chat_sessions.id
+            ),
+            last_message_preview = (
+                SELECT SUBSTR(chat_messages.content, 1, 200) FROM chat_messages
+                WHERE chat_messages.session_id = chat_sessions.id
+                ORDER BY chat_messages.created_at DESC
+                LIMIT 1
+            )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_sessions_user_updated_at_id', table_name='chat_sessions')
+    op.drop_column('chat_sessions', 'last_message_preview')
+    op.drop_column('chat_sessions', 'total_tokens')
+    op.drop_column('chat_sessions', 'message_count')
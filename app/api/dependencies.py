@@ -71,6 +71,23 @@ def get_current_user(
         
         return test_user
         
+    return get_user_from_token(db, token)
+
+
+def get_user_from_token(db: Session, token: Optional[str]) -> User:
+    """
+    Resolve the user from a JWT access token
+
+    Shared by the HTTP dependency and the chat WebSocket, which receives the
+    token as a query parameter and authenticates only once per connection.
+    """
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[ALGORITHM]
@@ -10,6 +10,15 @@ from app.models.notification import Notification as NotificationModel, UserNotif
 from app.schemas.notification import NotificationCreate, NotificationRead
 from app.db.session import get_db
 from app.api.dependencies import get_admin_user
+from app.core.response_cache import response_cache
+from app.core.ai_providers import provider_router, ai_manager
+from app.core.admission import admission_controller
+from app.core.single_flight import single_flight, idempotency_store
+from app.services.usage_aggregator import usage_aggregator
+from app.services.stream_replay import stream_registry
+from app.core.token_estimator import token_meter
+from app.services.template_catalog import template_catalog
+from app.db.session import pool_monitor
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -46,7 +55,8 @@ async def get_all_users(
                     "plan": user.plan if hasattr(user, 'plan') else "basic",
                     "plano": user.plano if hasattr(user, 'plano') else "basic",
                     "token_credits": int(user.token_credits) if hasattr(user, 'token_credits') and user.token_credits is not None else 0,
-                    "creditos_disponiveis": float(user.available_credits) if hasattr(user, 'available_credits') and user.available_credits is not None else 0,
+                    # Saldo único desde o ledger de créditos (antes: available_credits); nome mantido para o frontend
+                    "creditos_disponiveis": int(user.token_credits) if hasattr(user, 'token_credits') and user.token_credits is not None else 0,
                     "is_verified": bool(user.is_verified) if hasattr(user, 'is_verified') else False,
                     "verificado": bool(user.is_verified) if hasattr(user, 'is_verified') else False,
                     "numero_oab": user.oab_number if hasattr(user, 'oab_number') else None,
@@ -471,4 +481,37 @@ async def get_system_stats(
                 "version": "2.1.8",
                 "database_status": "error"
             }
-        } 
\ No newline at end of file
+        }
+
+
+@router.get("/ai/metrics", response_model=Dict[str, Any])
+async def get_ai_metrics(
+    admin: UserModel = Depends(get_admin_user)
+) -> Dict[str, Any]:
+    """
+    Get in-process AI layer metrics (response cache, provider health, rate limits, admission queue) - admin only
+    """
+    return {
+        "response_cache": response_cache.stats(),
+        "providers": provider_router.stats(),
+        "rate_limits": ai_manager.rate_governor.stats(),
+        "token_usage": token_meter.stats(),
+        "template_catalog": template_catalog.stats(),
+        "admission": admission_controller.stats(),
+        "single_flight": single_flight.stats(),
+        "idempotency": idempotency_store.stats(),
+        "usage_writer": usage_aggregator.stats(),
+        "chat_streams": stream_registry.stats(),
+        "db_pool": pool_monitor.stats()
+    }
+
+
+@router.delete("/ai/cache")
+async def clear_ai_cache(
+    admin: UserModel = Depends(get_admin_user)
+):
+    """
+    Clear the AI response cache - admin only
+    """
+    response_cache.clear()
+    return {"message": "AI response cache cleared"}
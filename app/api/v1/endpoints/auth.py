@@ -11,6 +11,7 @@ from app.core.config import settings
 from app.core.security import create_access_token, get_password_hash, verify_password
 from app.api.v1.schemas.user import User, UserCreate, UserInDB
 from app.models.user import User as UserModel
+from app.services.credit_ledger import credit_ledger
 import requests
 import secrets
 import string
@@ -20,6 +21,9 @@ router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
+# Free credits for new accounts
+SIGNUP_CREDITS = 10
+
 @router.post("/login")
 async def login_access_token(
     db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
@@ -122,10 +126,12 @@ async def register_user(
         phone=user_in.phone,
         is_active=True,
         is_admin=False,
-        token_credits=10,  # Initial free credits
+        token_credits=0,
         plan="basic",
     )
     db.add(db_user)
+    db.flush()
+    credit_ledger.credit(db, db_user.id, SIGNUP_CREDITS, "signup")  # Initial free credits
     db.commit()
     db.refresh(db_user)
     
@@ -195,10 +201,12 @@ async def login_with_google(
                 hashed_password=get_password_hash(password),
                 is_active=True,
                 is_admin=False,
-                token_credits=10,  # Créditos iniciais
+                token_credits=0,
                 plan="basic",
             )
             db.add(user)
+            db.flush()
+            credit_ledger.credit(db, user.id, SIGNUP_CREDITS, "signup")  # Créditos iniciais
             db.commit()
             db.refresh(user)
         
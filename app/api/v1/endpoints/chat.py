@@ -1,49 +1,73 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-import json
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
 import asyncio
+import time
 
-from app.api.dependencies import get_current_user, get_db
+from app.api.dependencies import get_current_user, get_db, get_user_from_token
+from app.api.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from app.models.user import User
 from app.models.chat_session import ChatSession as ChatSessionModel
 from app.models.chat_message import ChatMessage as ChatMessageModel
-from app.models.usage import Usage
-from app.api.v1.schemas.chat import ChatSession, ChatMessageCreate, ChatMessage, ChatRequest, ChatResponse, ChatSessionCreate, ChatSessionUpdate
-from app.core.ai_providers import AIProviderManager, AIProvider
-from datetime import datetime
-from app.api.v1.endpoints.usage import calcular_creditos_consumidos
+from app.api.v1.schemas.chat import ChatSession, ChatSessionSummary, ChatMessageCreate, ChatMessage, ChatRequest, ChatResponse, ChatSessionCreate, ChatSessionUpdate
+from app.core.ai_providers import ai_manager, AIProvider
+from app.core.config import settings
+from app.core.admission import admission_controller, AdmissionRejected
+from app.core.single_flight import run_once, IdempotencyConflict
+from app.db.session import SessionLocal
+from app.services.chat_context import context_builder, schedule_summary_refresh
+from app.services.chat_socket import ChatSocket
+from app.services.chat_stream import save_partial_turn, sse_replay
+from app.services.stream_replay import parse_event_id, stream_registry
+from app.services.chat_turn import ChatTurn, message_preview
+from app.services.credit_ledger import InsufficientCredits
 
 router = APIRouter()
-ai_manager = AIProviderManager()
 
 PROVIDER_MAP = {
     "openai": AIProvider.OPENAI,
     "claude": AIProvider.CLAUDE,
-    "deepseek": AIProvider.DEEPSEEK
+    "deepseek": AIProvider.DEEPSEEK,
+    "local": AIProvider.LOCAL
 }
 
-@router.get("/", response_model=List[ChatSession])
+@router.get("/", response_model=List[ChatSessionSummary])
 async def get_chat_sessions(
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    skip: int = 0
 ):
     """
-    Retrieve chat sessions for the current user
+    Retrieve chat sessions for the current user, most recently updated first
+
+    Returns summaries (no messages). Pagination is by keyset on
+    (updated_at, id): pass the X-Next-Cursor response header as `cursor`
+    to get the next page. `skip` is only honoured when no cursor is given.
     """
-    query = db.query(ChatSessionModel).options(
-        joinedload(ChatSessionModel.messages)
-    ).filter(ChatSessionModel.user_id == current_user.id)
+    query = db.query(ChatSessionModel).filter(ChatSessionModel.user_id == current_user.id)
+    
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor, 2)
+        query = query.filter(or_(
+            ChatSessionModel.updated_at < updated_at,
+            and_(ChatSessionModel.updated_at == updated_at, ChatSessionModel.id < session_id)
+        ))
+    elif skip:
+        query = query.offset(skip)
     
-    sessions = query.order_by(ChatSessionModel.updated_at.desc()).offset(skip).limit(limit).all()
+    sessions = query.order_by(
+        ChatSessionModel.updated_at.desc(), ChatSessionModel.id.desc()
+    ).limit(limit + 1).all()
     
-    # Sort messages by created_at for each session
-    for session in sessions:
-        if session.messages:
-            session.messages.sort(key=lambda x: x.created_at)
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        last = sessions[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.updated_at, last.id)
     
     return sessions
 
@@ -56,9 +80,13 @@ async def create_chat_session(
     """
     Create a new chat session
     """
+    welcome = "Olá! Sou a Advogada Parceira, sua assistente jurídica especializada no sistema legal brasileiro. Como posso ajudar você hoje?"
+    
     db_session = ChatSessionModel(
         user_id=current_user.id,
-        title=session_data.title
+        title=session_data.title,
+        message_count=1,
+        last_message_preview=message_preview(welcome)
     )
     
     db.add(db_session)
@@ -68,7 +96,7 @@ async def create_chat_session(
     # Add system welcome message
     welcome_message = ChatMessageModel(
         session_id=db_session.id,
-        content="Olá! Sou a Advogada Parceira, sua assistente jurídica especializada no sistema legal brasileiro. Como posso ajudar você hoje?",
+        content=welcome,
         role="assistant",
         tokens_used=0
     )
@@ -81,15 +109,21 @@ async def create_chat_session(
 @router.get("/{session_id}", response_model=ChatSession)
 async def get_chat_session(
     session_id: str,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
 ):
     """
-    Get a specific chat session with messages
+    Get a specific chat session with its most recent messages
+
+    Messages are paginated by keyset on (created_at, id), newest page first,
+    and returned in chronological order within the page. To load older
+    messages pass `next_cursor` (also sent in the X-Next-Cursor header) as
+    `cursor`; it is null when there are no older messages.
     """
-    db_session = db.query(ChatSessionModel).options(
-        joinedload(ChatSessionModel.messages)
-    ).filter(
+    db_session = db.query(ChatSessionModel).filter(
         ChatSessionModel.id == session_id,
         ChatSessionModel.user_id == current_user.id
     ).first()
@@ -100,11 +134,35 @@ async def get_chat_session(
             detail="Chat session not found"
         )
     
-    # Sort messages by created_at
-    if db_session.messages:
-        db_session.messages.sort(key=lambda x: x.created_at)
+    query = db.query(ChatMessageModel).filter(ChatMessageModel.session_id == session_id)
+    if cursor:
+        created_at, message_id = decode_cursor(cursor, 2)
+        query = query.filter(or_(
+            ChatMessageModel.created_at < created_at,
+            and_(ChatMessageModel.created_at == created_at, ChatMessageModel.id < message_id)
+        ))
     
-    return db_session
+    messages = query.order_by(
+        ChatMessageModel.created_at.desc(), ChatMessageModel.id.desc()
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        oldest = messages[-1]
+        next_cursor = encode_cursor(oldest.created_at, oldest.id)
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    # Não atribuir a db_session.messages: com delete-orphan, a página substituiria a coleção
+    return ChatSession(
+        id=db_session.id,
+        user_id=db_session.user_id,
+        title=db_session.title,
+        created_at=db_session.created_at,
+        updated_at=db_session.updated_at,
+        messages=[ChatMessage.model_validate(message) for message in reversed(messages)],
+        next_cursor=next_cursor
+    )
 
 @router.patch("/{session_id}", response_model=ChatSession)
 async def update_chat_session(
@@ -168,10 +226,14 @@ async def delete_chat_session(
 async def send_message(
     request: ChatRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Send a message to the AI and get a response
+
+    Identical concurrent requests share a single provider call; with an
+    Idempotency-Key header, retries replay the stored response.
     """
     # Get the session
     db_session = db.query(ChatSessionModel).filter(
@@ -185,98 +247,121 @@ async def send_message(
             detail="Chat session not found"
         )
     
-    # Save the user message
-    user_message = ChatMessageModel(
-        session_id=db_session.id,
-        content=request.message,
-        role="user",
-        tokens_used=0
-    )
-    
-    db.add(user_message)
-    db.commit()
+    # process() only gets plain values: with single-flight it may outlive this request
+    session_id = db_session.id
+    user_id = current_user.id
     
-    # Check if this is the first user message and update the title
-    # Count the messages in the session
-    message_count = db.query(ChatMessageModel).filter(
-        ChatMessageModel.session_id == db_session.id,
-        ChatMessageModel.role == 'user'
-    ).count()
-    
-    # If this is the first user message (message_count would be 1 including the one we just added)
-    if message_count == 1:
-        # Create a title from the first 30 chars of the message
-        title = request.message[:30]
-        if len(request.message) > 30:
-            title += "..."
-        
-        # Update the session title
-        db_session.title = title
-        db.commit()
-    
-    # Get AI response
-    try:
-        provider = PROVIDER_MAP.get(request.provider, AIProvider.DEEPSEEK)
-        ai_response = ai_manager.get_response(
-            user_message=request.message,
-            session_id=db_session.id,
-            provider=provider
-        )
-        
-        # Save the AI response
-        assistant_message = ChatMessageModel(
-            session_id=db_session.id,
-            content=ai_response.message,
-            role="assistant",
-            tokens_used=ai_response.tokens_used,
-            provider=request.provider
-        )
-        
-        db.add(assistant_message)
-        db.commit()
-        
-        # Update session timestamp
-        db_session.updated_at = datetime.utcnow()
+    # Set by process(): a fallback apology must not be replayed for the Idempotency-Key
+    outcome = {"failed": False}
+
+    async def process() -> ChatResponse:
+        # The whole turn (both messages, session, credits) is written in one transaction below
+        turn = ChatTurn(session_id, user_id, request.message)
+        deadline = time.monotonic() + settings.AI_REQUEST_DEADLINE_SECONDS
+        db = SessionLocal()
         
-        # Update user's credits
-        if ai_response.tokens_used > 0 and current_user.token_credits is not None:
-            # Calcular créditos a serem consumidos usando a função comum
-            creditos_a_consumir = calcular_creditos_consumidos(ai_response.tokens_used)
-            current_user.token_credits = max(0, current_user.token_credits - creditos_a_consumir)
-            print(f"Tokens usados: {ai_response.tokens_used}, Créditos consumidos: {creditos_a_consumir}")
+        # Get AI response
+        try:
+            user = db.get(User, user_id)
+            chat_session = db.get(ChatSessionModel, session_id)
+            provider = PROVIDER_MAP.get(request.provider, AIProvider.DEEPSEEK)
+            context = context_builder.build(db, chat_session, request.message, provider)
+            max_tokens = turn.reserve_credits(provider.value, context.messages)
+            async with admission_controller.slot(user_id, user.plan):
+                ai_response = await ai_manager.get_response(
+                    user_message=request.message,
+                    session_id=session_id,
+                    provider=provider,
+                    history=context.messages,
+                    use_cache=not request.bypass_cache,
+                    deadline=deadline,
+                    max_tokens=max_tokens
+                )
             
-            # Update usage statistics
-            usage = db.query(Usage).filter(Usage.user_id == current_user.id).first()
-            if usage:
-                usage.total_tokens = usage.total_tokens + ai_response.tokens_used
-                usage.updated_at = datetime.utcnow()
+            turn.commit(db, ai_response.message, ai_response.tokens_used, request.provider)
+            outcome["failed"] = ai_response.failed
             
-            db.commit()
-        
-        db.commit()
-        
-        return ChatResponse(
-            message=ai_response.message,
-            session_id=db_session.id,
-            tokens_used=ai_response.tokens_used
+            schedule_summary_refresh(session_id, context, provider)
+            
+            return ChatResponse(
+                message=ai_response.message,
+                session_id=session_id,
+                tokens_used=ai_response.tokens_used
+            )
+        except InsufficientCredits:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail="Insufficient credits"
+            )
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e)
+            )
+        except Exception as e:
+            # Log the error
+            print(f"Error getting AI response: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error processing message: {str(e)}"
+            )
+        finally:
+            # Nothing was saved: give the reserved credits back
+            turn.release_credits()
+            db.close()
+
+    try:
+        return await run_once(
+            f"{user_id}:chat.message", request.dict(), process, idempotency_key,
+            store_if=lambda _: not outcome["failed"]
         )
-    except Exception as e:
-        # Log the error
-        print(f"Error getting AI response: {str(e)}")
+    except IdempotencyConflict as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing message: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
         )
 
 @router.post("/stream")
 async def stream_chat(
     request: ChatRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
 ):
     """
     Stream chat responses from the AI
+
+    All database reads happen before the stream starts, and the turn is saved
+    afterwards in a fresh short-lived session, so no pool connection is held
+    while waiting on the provider.
+
+    Every event carries an id (`<stream_id>:<seq>`). After a dropped
+    connection, repeat the request with the last received id in the
+    Last-Event-ID header to resume from the next event without a new provider
+    call. If nobody reconnects within the grace period, the provider request
+    is aborted and the partial answer is saved, billing only the tokens
+    actually generated.
     """
+    if last_event_id:
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Last-Event-ID"
+            )
+        stream_id, after = parsed
+        replay = stream_registry.get(stream_id, current_user.id)
+        if replay is None or not replay.can_resume(after):
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Stream is no longer available; reload the chat session"
+            )
+        return StreamingResponse(
+            sse_replay(replay, after, http_request),
+            media_type="text/event-stream"
+        )
+    
     # Get the session
     db_session = db.query(ChatSessionModel).filter(
         ChatSessionModel.id == request.session_id,
@@ -289,124 +374,129 @@ async def stream_chat(
             detail="Chat session not found"
         )
     
-    # Save the user message
-    user_message = ChatMessageModel(
-        session_id=db_session.id,
-        content=request.message,
-        role="user",
-        tokens_used=0
-    )
+    provider = PROVIDER_MAP.get(request.provider, AIProvider.DEEPSEEK)
+    context = context_builder.build(db, db_session, request.message, provider)
     
-    db.add(user_message)
-    db.commit()
+    # The producer only gets plain values; the request session is released now
+    session_id = db_session.id
+    user_id = current_user.id
+    plan = current_user.plan
+    db.close()
     
-    # Check if this is the first user message and update the title
-    # Count the messages in the session
-    message_count = db.query(ChatMessageModel).filter(
-        ChatMessageModel.session_id == db_session.id,
-        ChatMessageModel.role == 'user'
-    ).count()
-    
-    # If this is the first user message (message_count would be 1 including the one we just added)
-    if message_count == 1:
-        # Create a title from the first 30 chars of the message
-        title = request.message[:30]
-        if len(request.message) > 30:
-            title += "..."
-        
-        # Update the session title
-        db_session.title = title
-        db.commit()
+    # The whole turn (both messages, session, credits) is written in one transaction at the end
+    turn = ChatTurn(session_id, user_id, request.message)
+    try:
+        max_tokens = turn.reserve_credits(provider.value, context.messages)
+    except InsufficientCredits:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Insufficient credits"
+        )
+    deadline = time.monotonic() + settings.AI_REQUEST_DEADLINE_SECONDS
     
-    # Define the streaming response function
-    async def generate():
+    # Runs in its own task: the answer keeps being generated (and buffered) if the client drops
+    async def produce(replay):
+        ticket = None
+        ai_stream = None
+        saved = False
         try:
-            provider = PROVIDER_MAP.get(request.provider, AIProvider.DEEPSEEK)
+            ticket = await admission_controller.acquire(user_id, plan)
             
-            # Get AI response (non-streaming for now, but we'll simulate streaming)
-            ai_response = ai_manager.get_response(
+            ai_stream = ai_manager.stream_response(
                 user_message=request.message,
-                session_id=db_session.id,
-                provider=provider
+                session_id=session_id,
+                provider=provider,
+                history=context.messages,
+                use_cache=not request.bypass_cache,
+                deadline=deadline,
+                max_tokens=max_tokens
             )
             
-            # Save the AI response
-            assistant_message = ChatMessageModel(
-                session_id=db_session.id,
-                content=ai_response.message,
-                role="assistant",
-                tokens_used=ai_response.tokens_used,
-                provider=request.provider
-            )
-            
-            db.add(assistant_message)
-            db.commit()
-            
-            # Update session timestamp
-            db_session.updated_at = datetime.utcnow()
-            
-            # Update user's credits
-            if ai_response.tokens_used > 0 and current_user.token_credits is not None:
-                # Calcular créditos a serem consumidos usando a função comum
-                creditos_a_consumir = calcular_creditos_consumidos(ai_response.tokens_used)
-                current_user.token_credits = max(0, current_user.token_credits - creditos_a_consumir)
-                print(f"Tokens usados: {ai_response.tokens_used}, Créditos consumidos: {creditos_a_consumir}")
-                
-                # Update usage statistics
-                usage = db.query(Usage).filter(Usage.user_id == current_user.id).first()
-                if usage:
-                    usage.total_tokens = usage.total_tokens + ai_response.tokens_used
-                    usage.updated_at = datetime.utcnow()
-                
-                db.commit()
-            
-            db.commit()
-            
-            # Stream the response by words
-            words = ai_response.message.split()
-            current_chunk = ""
+            async for delta in ai_stream:
+                replay.append({
+                    "content": delta,
+                    "done": False
+                })
             
-            for i, word in enumerate(words):
-                current_chunk += word + " "
-                
-                # Send chunks of 3-5 words
-                if i % 4 == 0 and i > 0:
-                    # Create SSE format
-                    data = {
-                        "content": current_chunk,
-                        "done": False
-                    }
-                    yield f"data: {json.dumps(data)}\n\n"
-                    await asyncio.sleep(0.1)  # Simulate network delay
-                    current_chunk = ""
+            # Save the turn once the stream is complete
+            turn.commit_in_new_session(ai_stream.message, ai_stream.tokens_used, ai_stream.provider.value)
+            saved = True
             
-            # Send any remaining text
-            if current_chunk:
-                data = {
-                    "content": current_chunk,
-                    "done": False
-                }
-                yield f"data: {json.dumps(data)}\n\n"
+            schedule_summary_refresh(session_id, context, provider)
             
             # Send completion message
-            data = {
+            replay.append({
                 "content": "",
                 "done": True,
-                "tokens_used": ai_response.tokens_used,
-                "provider": request.provider
-            }
-            yield f"data: {json.dumps(data)}\n\n"
+                "tokens_used": ai_stream.tokens_used,
+                "provider": ai_stream.provider.value
+            })
             
+        except asyncio.CancelledError:
+            # Nobody reconnected within the grace period: the provider request is already aborted
+            if ai_stream is not None and not saved:
+                save_partial_turn(turn, ai_stream)
+            raise
+        except AdmissionRejected as e:
+            replay.append({
+                "error": str(e),
+                "done": True
+            })
         except Exception as e:
             # Log the error
             print(f"Error streaming AI response: {str(e)}")
-            data = {
+            replay.append({
                 "error": f"Error processing message: {str(e)}",
                 "done": True
-            }
-            yield f"data: {json.dumps(data)}\n\n"
+            })
+        finally:
+            if ticket is not None:
+                admission_controller.release(ticket)
+            # No-op once the turn (or its partial answer) is saved
+            turn.release_credits()
     
+    replay = stream_registry.start(user_id, produce)
     return StreamingResponse(
-        generate(),
+        sse_replay(replay, 0, http_request),
         media_type="text/event-stream"
     )
+
+@router.websocket("/ws/{session_id}")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: str,
+    token: Optional[str] = None
+):
+    """
+    Chat over a persistent WebSocket connection
+
+    The access token is passed as the `token` query parameter (browsers can't
+    set headers on WebSocket requests) and checked once, together with the
+    session ownership. Each turn then streams deltas over the same connection
+    and can be cancelled mid-flight; see app.services.chat_socket for the
+    message protocol.
+    """
+    # Short-lived session: no pool connection is held for the lifetime of the socket
+    db = SessionLocal()
+    try:
+        try:
+            user = get_user_from_token(db, token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        db_session = db.query(ChatSessionModel).filter(
+            ChatSessionModel.id == session_id,
+            ChatSessionModel.user_id == user.id
+        ).first()
+        if not db_session:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        user_id = user.id
+        plan = user.plan
+    finally:
+        db.close()
+    
+    await websocket.accept()
+    await ChatSocket(websocket, session_id, user_id, plan).run()
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Body, UploadFile, File, Form, Header, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 import csv
@@ -6,43 +6,34 @@ import os
 import json
 from datetime import datetime
 import pandas as pd
-import openai
 import uuid
-import re
 from sqlalchemy.sql import func
 
 from app.api.dependencies import get_current_user, get_db
+from app.api.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from app.models.user import User
 from app.models.document import Document, Template, DocumentFolder
-from app.core.config import settings
+from app.core.ai_providers import ai_manager, AIProvider, AIProviderError, MAX_COMPLETION_TOKENS
+from app.core.admission import admission_controller, AdmissionRejected
+from app.core.single_flight import run_once, IdempotencyConflict
+from app.core.token_estimator import estimate_tokens
+from app.db.session import SessionLocal
+from app.services.credit_ledger import InsufficientCredits, credit_ledger, credits_for_tokens
+from app.services.template_catalog import index_after, template_catalog
+from app.services.template_search import SearchUnavailable, template_search
+from app.utils.templates import render_template, serialize_variables
 
 router = APIRouter()
 
-# Configuração da API OpenAI
-openai.api_key = settings.OPENAI_API_KEY
-
 # Caminho para o arquivo CSV de petições (mantido para compatibilidade)
 PETICOES_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))), "data", "peticoes.csv")
 
 def get_template_types(db: Session):
     """
-    Extrai os tipos de templates disponíveis do banco de dados
+    Extrai os tipos de templates disponíveis (árvore montada no catálogo em memória)
     """
     try:
-        # Consulta as categorias distintas
-        categorias = db.query(Template.category).distinct().all()
-        categorias = [cat[0] for cat in categorias if cat[0]]
-        
-        # Consulta as subcategorias para cada categoria
-        subcategorias = {}
-        for categoria in categorias:
-            subs = db.query(Template.type).filter(Template.category == categoria).distinct().all()
-            subcategorias[categoria] = [sub[0] for sub in subs if sub[0]]
-        
-        return {
-            "categorias": categorias,
-            "subcategorias": subcategorias
-        }
+        return template_catalog.snapshot(db).categories
     except Exception as e:
         return {"error": f"Erro ao obter categorias: {str(e)}"}
 
@@ -99,6 +90,40 @@ async def get_template_categories(
         "data": result
     }
 
+@router.get("/templates/search")
+async def search_templates(
+    q: str = Query(..., min_length=2, max_length=200),
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca textual nos templates (nome, descrição e texto), do mais relevante para o menos
+
+    Cada resultado traz um trecho do texto com os termos encontrados entre <mark> e </mark>.
+    Declarada antes de /templates/{template_id} para não ser capturada por ela.
+    """
+    try:
+        results = template_search.search(db, q, categoria, subcategoria, skip, limit)
+        return {
+            "status": "success",
+            "count": len(results),
+            "data": results
+        }
+    except SearchUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar templates: {str(e)}"
+        )
+
 @router.get("/templates/{template_id}")
 async def get_template_details(
     template_id: str,
@@ -109,12 +134,8 @@ async def get_template_details(
     Obtém detalhes de um template específico para geração de documento
     """
     try:
-        # Buscar template do banco de dados
-        template = db.query(Template).filter(Template.id == template_id).first()
-        
-        # Se não encontrou pelo ID, tenta pelo nome
-        if not template:
-            template = db.query(Template).filter(Template.name == template_id).first()
+        # Buscar template no catálogo (pelo ID ou, se não encontrar, pelo nome)
+        template = template_catalog.find(db, template_id)
         
         if not template:
             raise HTTPException(
@@ -122,26 +143,6 @@ async def get_template_details(
                 detail=f"Template não encontrado: {template_id}"
             )
         
-        # Obter o texto do template
-        template_text = template.content
-        
-        # Obter variáveis do campo variables se existir, ou extrair do texto
-        variables = []
-        if template.variables and template.variables.strip():
-            try:
-                variables = json.loads(template.variables)
-            except json.JSONDecodeError:
-                # Se não conseguir decodificar, deixa a lista vazia para extrair do texto
-                pass
-        
-        # Se não temos variáveis, extraímos do texto como fallback
-        if not variables:
-            import re
-            matches = re.findall(r'\[([^\]]+)\]', template_text)
-            for var in matches:
-                if var not in variables:
-                    variables.append(var)
-        
         return {
             "status": "success",
             "data": {
@@ -149,8 +150,10 @@ async def get_template_details(
                 "name": template.name,
                 "categoria": template.category,
                 "subcategoria": template.type,
-                "text": template_text,
-                "variables": variables
+                "text": template_catalog.content(db, template),
+                # Variáveis gravadas na importação (ver app.utils.templates)
+                "variables": list(template.variables),
+                "variable_metadata": template.variable_metadata
             }
         }
     except HTTPException:
@@ -163,51 +166,46 @@ async def get_template_details(
 
 @router.get("/templates")
 async def list_templates(
+    response: Response,
     categoria: Optional[str] = None,
     subcategoria: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 50,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Lista os templates disponíveis com filtros opcionais e paginação
+
+    Ordem: categoria, tipo, nome, id. Com `cursor` (valor de `next_cursor` /
+    header X-Next-Cursor da página anterior), a página começa depois do último
+    item visto e `skip` é ignorado.
     """
     try:
-        # Criar consulta base
-        query = db.query(Template)
-        
-        # Aplicar filtros se fornecidos
-        if categoria:
-            query = query.filter(Template.category == categoria)
-        
-        if subcategoria:
-            query = query.filter(Template.type == subcategoria)
-        
-        # Contar o total antes de aplicar paginação
-        total = query.count()
-        
-        # Aplicar paginação
-        templates_db = query.offset(skip).limit(limit).all()
-        
-        # Converter para o formato esperado pela API
-        templates = [
-            {
-                "document_name": t.name,
-                "subfolder_1": t.category,
-                "subfolder_2": t.type,
-                "subfolder_3": None,
-                "id": t.id
-            }
-            for t in templates_db
-        ]
-        
+        # Listas por filtro já ordenadas no catálogo em memória (sem o texto dos templates):
+        # o total é o tamanho da lista e a página é localizada por busca binária
+        matches = template_catalog.snapshot(db).filter(categoria, subcategoria)
+        if cursor:
+            start = index_after(matches, tuple(str(value) for value in decode_cursor(cursor, 4)))
+        else:
+            start = skip
+        page = matches[start:start + limit]
+
+        next_cursor = None
+        if start + limit < len(matches):
+            next_cursor = encode_cursor(*page[-1].sort_key)
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
         return {
             "status": "success",
-            "total": total,
-            "count": len(templates),
-            "data": templates
+            "total": len(matches),
+            "count": len(page),
+            "next_cursor": next_cursor,
+            "data": [t.list_item for t in page]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -334,12 +332,8 @@ async def generate_document(
                     detail=f"Erro ao decodificar variáveis JSON: {str(e)}. Recebido: {variables}"
                 )
         
-        # Busca o template no banco de dados
-        template = db.query(Template).filter(Template.id == template_id).first()
-        
-        # Se não encontrou pelo ID, tenta pelo nome
-        if not template:
-            template = db.query(Template).filter(Template.name == template_id).first()
+        # Busca o template no catálogo (pelo ID ou, se não encontrar, pelo nome)
+        template = template_catalog.find(db, template_id)
             
         if not template:
             raise HTTPException(
@@ -347,13 +341,9 @@ async def generate_document(
                 detail=f"Template não encontrado: {template_id}"
             )
         
-        # Obter o texto do template
-        document_text = template.content
-        
-        # Substituir as variáveis
-        for var_name, var_value in variables_dict.items():
-            if var_value:  # Só substitui se houver valor
-                document_text = document_text.replace(f"[{var_name}]", var_value)
+        # Substituir as variáveis em uma passada sobre o template compilado (só as que têm valor)
+        rendered = render_template(template_catalog.content(db, template), variables_dict)
+        document_text = rendered.text
         
         # Usar o título formatado se fornecido, ou criar um baseado no nome do template
         document_title = formatted_title if formatted_title else f"{template.name} - {datetime.now().strftime('%d/%m/%Y')}"
@@ -379,7 +369,8 @@ async def generate_document(
                 "id": new_document.id,
                 "title": new_document.title,
                 "created_at": new_document.created_at,
-                "document_type": new_document.document_type
+                "document_type": new_document.document_type,
+                "unfilled_variables": rendered.unfilled
             }
         }
     except HTTPException:
@@ -423,12 +414,8 @@ async def preview_document(
                     detail=f"Erro ao decodificar variáveis JSON: {str(e)}. Recebido: {variables}"
                 )
         
-        # Busca o template no banco de dados
-        template = db.query(Template).filter(Template.id == template_id).first()
-        
-        # Se não encontrou pelo ID, tenta pelo nome
-        if not template:
-            template = db.query(Template).filter(Template.name == template_id).first()
+        # Busca o template no catálogo (pelo ID ou, se não encontrar, pelo nome)
+        template = template_catalog.find(db, template_id)
             
         if not template:
             raise HTTPException(
@@ -436,13 +423,9 @@ async def preview_document(
                 detail=f"Template não encontrado: {template_id}"
             )
         
-        # Obter o texto do template
-        document_text = template.content
-        
-        # Substituir as variáveis
-        for var_name, var_value in variables_dict.items():
-            if var_value:  # Só substitui se houver valor
-                document_text = document_text.replace(f"[{var_name}]", var_value)
+        # Substituir as variáveis em uma passada sobre o template compilado (só as que têm valor)
+        rendered = render_template(template_catalog.content(db, template), variables_dict)
+        document_text = rendered.text
         
         # Usar o título formatado se fornecido, ou criar um baseado no nome do template
         document_title = formatted_title if formatted_title else f"{template.name} - {datetime.now().strftime('%d/%m/%Y')}"
@@ -455,7 +438,8 @@ async def preview_document(
             "data": {
                 "title": document_title,
                 "content": document_text,
-                "document_type": template.category
+                "document_type": template.category,
+                "unfilled_variables": rendered.unfilled
             }
         }
     except HTTPException:
@@ -472,142 +456,172 @@ async def preview_document(
 async def ai_complete_document(
     request_data: dict = Body(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Usa a OpenAI para ajudar a preencher campos do documento a partir de uma descrição
+
+    Requisições idênticas simultâneas compartilham uma única chamada ao provedor;
+    com o header Idempotency-Key, novas tentativas recebem a resposta guardada.
     """
-    try:
-        # Extrair dados do corpo da requisição
-        template_id = request_data.get("template_id")
-        description = request_data.get("description")
-        
-        if not template_id or not description:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Os campos template_id e description são obrigatórios"
-            )
-        
-        # Buscar template do banco de dados
-        template = db.query(Template).filter(Template.id == template_id).first()
-        
-        # Se não encontrou pelo ID, tenta pelo nome
-        if not template:
-            template = db.query(Template).filter(Template.name == template_id).first()
-            
-        if not template:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Template não encontrado: {template_id}"
-            )
-        
-        # Obter o texto do template
-        template_text = template.content
-        
-        # Obter variáveis do campo variables se existir, ou extrair do texto
-        variables = []
-        if template.variables and template.variables.strip():
-            try:
-                variables = json.loads(template.variables)
-            except json.JSONDecodeError:
-                # Se não conseguir decodificar, deixa a lista vazia para extrair do texto
-                pass
-        
-        # Se não temos variáveis, extraímos do texto como fallback
-        if not variables:
-            import re
-            matches = re.findall(r'\[([^\]]+)\]', template_text)
-            for var in matches:
-                if var not in variables:
-                    variables.append(var)
-        
-        # Construir o prompt para a OpenAI
-        prompt = f"""
-        Com base na seguinte descrição de um caso jurídico:
-        
-        "{description}"
-        
-        Por favor, forneça informações para preencher os seguintes campos de um documento jurídico do tipo {template.name}:
-        
-        {', '.join(variables)}
-        
-        Sua resposta deve estar no formato JSON com chaves correspondentes aos campos acima e valores apropriados.
-        Mantenha os valores concisos e relevantes para o caso descrito. Não invente leis ou detalhes que possam prejudicar
-        o processo jurídico. Use apenas informações fornecidas na descrição ou conhecimento jurídico factual.
-        
-        Por exemplo:
-        {{
-          "NOME_COMPLETO": "João da Silva",
-          "NÚMERO_CPF": "123.456.789-00"
-        }}
-        """
-        
-        # Chamar a API da OpenAI
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você é um assistente jurídico especializado em ajudar advogados a preencher documentos legais com base em descrições de casos."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        # Extrair a resposta
-        ai_suggestion = response.choices[0].message.content
-        
-        # Tentar fazer parse do JSON
+    # process() só recebe valores simples: com single-flight, pode durar mais que esta requisição
+    user_id = current_user.id
+
+    async def process():
+        db = SessionLocal()
         try:
-            # Limpar a resposta para garantir que é JSON válido
-            if "```json" in ai_suggestion:
-                ai_suggestion = ai_suggestion.split("```json")[1].split("```")[0].strip()
-            elif "```" in ai_suggestion:
-                ai_suggestion = ai_suggestion.split("```")[1].split("```")[0].strip()
+            # Extrair dados do corpo da requisição
+            template_id = request_data.get("template_id")
+            description = request_data.get("description")
             
-            suggestions = json.loads(ai_suggestion)
-            
-            # Calcular tokens usados
-            tokens_used = response.usage.total_tokens
+            if not template_id or not description:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Os campos template_id e description são obrigatórios"
+                )
             
-            # Atualizar os créditos do usuário
-            from app.api.v1.endpoints.usage import calcular_creditos_consumidos
-            creditos_consumidos = calcular_creditos_consumidos(tokens_used)
+            # Provedor opcional; "local" usa o simulador offline (testes de carga)
+            try:
+                provider = AIProvider(request_data.get("provider", AIProvider.OPENAI.value))
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Provedor de IA inválido: {request_data.get('provider')}"
+                )
             
-            user = db.query(User).filter(User.id == current_user.id).first()
-            if user.creditos_disponiveis < creditos_consumidos:
+            # Buscar template no catálogo (pelo ID ou, se não encontrar, pelo nome)
+            template = template_catalog.find(db, template_id)
+                
+            if not template:
                 raise HTTPException(
-                    status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                    detail="Créditos insuficientes para completar a operação"
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Template não encontrado: {template_id}"
                 )
             
-            user.creditos_disponiveis -= creditos_consumidos
-            db.commit()
+            # Variáveis gravadas na importação (ver app.utils.templates)
+            variables = template.variables
+            
+            # Construir o prompt para a OpenAI
+            prompt = f"""
+            Com base na seguinte descrição de um caso jurídico:
+            
+            "{description}"
+            
+            Por favor, forneça informações para preencher os seguintes campos de um documento jurídico do tipo {template.name}:
+            
+            {', '.join(variables)}
+            
+            Sua resposta deve estar no formato JSON com chaves correspondentes aos campos acima e valores apropriados.
+            Mantenha os valores concisos e relevantes para o caso descrito. Não invente leis ou detalhes que possam prejudicar
+            o processo jurídico. Use apenas informações fornecidas na descrição ou conhecimento jurídico factual.
+            
+            Por exemplo:
+            {{
+              "NOME_COMPLETO": "João da Silva",
+              "NÚMERO_CPF": "123.456.789-00"
+            }}
+            """
             
-            return {
-                "status": "success",
-                "message": "Sugestões geradas com sucesso",
-                "data": {
-                    "suggestions": suggestions,
-                    "tokens_used": tokens_used,
-                    "credits_used": creditos_consumidos
+            messages = [
+                {"role": "system", "content": "Você é um assistente jurídico especializado em ajudar advogados a preencher documentos legais com base em descrições de casos."},
+                {"role": "user", "content": prompt}
+            ]
+            
+            # Reservar o custo máximo antes da chamada: sem saldo, 402 sem custo de provedor
+            reservation = credit_ledger.reserve_tokens(user_id, estimate_tokens(messages, MAX_COMPLETION_TOKENS))
+            
+            # Tentar fazer parse do JSON
+            try:
+                # Chamar o provedor de IA pelo cliente assíncrono compartilhado
+                plan = db.query(User.plan).filter(User.id == user_id).scalar()
+                async with admission_controller.slot(user_id, plan):
+                    ai_suggestion, tokens_used = await ai_manager.complete_chat(
+                        messages=messages,
+                        provider=provider,
+                        use_cache=not request_data.get("bypass_cache", False),
+                        max_tokens=reservation.max_tokens
+                    )
+                
+                # Limpar a resposta para garantir que é JSON válido
+                if "```json" in ai_suggestion:
+                    ai_suggestion = ai_suggestion.split("```json")[1].split("```")[0].strip()
+                elif "```" in ai_suggestion:
+                    ai_suggestion = ai_suggestion.split("```")[1].split("```")[0].strip()
+                
+                suggestions = json.loads(ai_suggestion)
+                
+                # Acertar a reserva com o consumo real
+                creditos_consumidos = credit_ledger.settle(
+                    db, reservation, credits_for_tokens(tokens_used) if tokens_used > 0 else 0, "document", template.id
+                )
+                db.commit()
+                reservation = None
+                
+                return {
+                    "status": "success",
+                    "message": "Sugestões geradas com sucesso",
+                    "data": {
+                        "suggestions": suggestions,
+                        "tokens_used": tokens_used,
+                        "credits_used": creditos_consumidos
+                    }
                 }
-            }
-        except json.JSONDecodeError:
-            # Se o parse falhar, retorna o texto bruto
-            return {
-                "status": "warning",
-                "message": "Não foi possível formatar as sugestões como JSON",
-                "data": {
-                    "raw_suggestion": ai_suggestion,
-                    "variables": variables
+            except json.JSONDecodeError:
+                # Se o parse falhar, retorna o texto bruto; o provedor já consumiu os tokens
+                creditos_consumidos = credit_ledger.settle(
+                    db, reservation, credits_for_tokens(tokens_used) if tokens_used > 0 else 0, "document", template.id
+                )
+                db.commit()
+                reservation = None
+                return {
+                    "status": "warning",
+                    "message": "Não foi possível formatar as sugestões como JSON",
+                    "data": {
+                        "raw_suggestion": ai_suggestion,
+                        "variables": variables,
+                        "tokens_used": tokens_used,
+                        "credits_used": creditos_consumidos
+                    }
                 }
-            }
-    except HTTPException:
-        raise
-    except Exception as e:
+            finally:
+                # Sem resposta do provedor (ou sem gravação): devolver a reserva
+                if reservation is not None:
+                    credit_ledger.release(reservation)
+        except HTTPException:
+            raise
+        except InsufficientCredits:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail="Créditos insuficientes para completar a operação"
+            )
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e)
+            )
+        except AIProviderError as e:
+            # Nenhum provedor respondeu: a reserva já foi devolvida
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Erro ao gerar sugestões com IA: {str(e)}"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Erro ao gerar sugestões com IA: {str(e)}"
+            )
+        finally:
+            db.close()
+
+    try:
+        # Falhas (ex.: nenhum provedor respondeu) são exceções: não ficam guardadas pela Idempotency-Key
+        return await run_once(
+            f"{user_id}:documents.ai-complete", request_data, process, idempotency_key
+        )
+    except IdempotencyConflict as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao gerar sugestões com IA: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
         )
 
 @router.get("/folders")
@@ -962,31 +976,21 @@ async def import_templates_from_csv(
                 existing.category = row["SUBFOLDER_1"] if not pd.isna(row["SUBFOLDER_1"]) else "Sem Categoria"
                 existing.type = row["SUBFOLDER_2"] if not pd.isna(row["SUBFOLDER_2"]) else "Geral"
                 
-                # Extrair variáveis do texto
-                variables = []
-                matches = re.findall(r'\[([^\]]+)\]', row["TEXTO"])
-                if matches:
-                    variables = list(set(matches))  # Remove duplicados
-                
-                existing.variables = json.dumps(variables) if variables else None
+                # Extrair variáveis do texto (com metadados), uma vez na importação
+                existing.variables = serialize_variables(row["TEXTO"])
                 existing.updated_at = func.now()
             else:
                 # Criar novo template
                 category = row["SUBFOLDER_1"] if not pd.isna(row["SUBFOLDER_1"]) else "Sem Categoria"
                 template_type = row["SUBFOLDER_2"] if not pd.isna(row["SUBFOLDER_2"]) else "Geral"
                 
-                # Extrair variáveis do texto
-                variables = []
-                matches = re.findall(r'\[([^\]]+)\]', row["TEXTO"])
-                if matches:
-                    variables = list(set(matches))  # Remove duplicados
-                
                 new_template = Template(
                     name=row["NOME_DOCUMENTO"],
                     content=row["TEXTO"],
                     category=category,
                     type=template_type,
-                    variables=json.dumps(variables) if variables else None
+                    # Extrair variáveis do texto (com metadados), uma vez na importação
+                    variables=serialize_variables(row["TEXTO"])
                 )
                 
                 db.add(new_template)
@@ -994,6 +998,7 @@ async def import_templates_from_csv(
             count += 1
         
         db.commit()
+        template_catalog.invalidate()
         
         return {
             "status": "success",
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
 from typing import List, Optional
+from uuid import uuid4
 from pydantic import BaseModel
 
 from app.api.dependencies import get_current_user, get_db
@@ -13,20 +14,10 @@ from app.models.usage import Usage
 from app.models.payment import Payment
 from app.schemas.usage import UsageResponse
 from app.schemas.payment import PaymentCreate, PaymentResponse
+from app.services.credit_ledger import TOKENS_PER_CREDIT as TOKENS_POR_CREDITO, credit_ledger
 
 router = APIRouter()
 
-# Taxa de conversão: quantos tokens equivalem a 1 crédito
-TOKENS_POR_CREDITO = 20
-
-# Função para calcular quantos créditos serão consumidos por um determinado número de tokens
-def calcular_creditos_consumidos(tokens_usados: int) -> int:
-    """
-    Calcula quantos créditos serão consumidos por um determinado número de tokens.
-    Atualmente, cada 20 tokens consomem 1 crédito.
-    """
-    return max(1, int(tokens_usados / TOKENS_POR_CREDITO))
-
 class AddCreditsRequest(BaseModel):
     amount: float
     payment_method: str
@@ -115,12 +106,8 @@ async def get_usage_stats(
             print(f"Error fetching payment history: {str(payment_e)}")
             # Continue with empty payment history if query fails
 
-        # Obter créditos disponíveis do usuário com segurança
-        available_credits = 0
-        try:
-            available_credits = getattr(current_user, 'available_credits', 0) or 0
-        except Exception as credit_e:
-            print(f"Error getting available credits: {str(credit_e)}")
+        # Saldo em cache do ledger de créditos (ver app.services.credit_ledger)
+        available_credits = current_user.token_credits or 0
 
         # Formatando a resposta para o formato esperado pelo frontend
         response_data = {
@@ -229,6 +216,7 @@ async def add_credits(
         
         # Criar registro de pagamento
         payment = Payment(
+            id=str(uuid4()),
             user_id=current_user.id,
             amount=payment_data.amount,
             payment_method=payment_data.payment_method,
@@ -237,19 +225,8 @@ async def add_credits(
         )
         db.add(payment)
         
-        # Atualizar os créditos do usuário com tratamento de erro
-        try:
-            if hasattr(current_user, 'available_credits'):
-                current_credits = current_user.available_credits or 0
-                current_user.available_credits = current_credits + num_credits
-            else:
-                print("Warning: User model does not have available_credits attribute")
-                # Tenta atualizar outros campos relacionados a créditos se disponíveis
-                if hasattr(current_user, 'token_credits'):
-                    current_user.token_credits = (current_user.token_credits or 0) + tokens_added
-        except Exception as credit_e:
-            print(f"Error updating user credits: {str(credit_e)}")
-            # Continuar mesmo se não conseguir atualizar os créditos
+        # Créditos entram pelo ledger, na mesma transação do pagamento (incremento atômico do saldo)
+        credit_ledger.credit(db, current_user.id, num_credits, "purchase", payment.id)
         
         # Atualizar o registro de uso
         try:
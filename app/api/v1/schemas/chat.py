@@ -41,6 +41,21 @@ class ChatSession(ChatSessionBase):
     created_at: datetime
     updated_at: datetime
     messages: Optional[List[ChatMessage]] = None
+    next_cursor: Optional[str] = Field(None, description="Cursor for the previous (older) page of messages")
+
+    class Config:
+        from_attributes = True
+
+
+class ChatSessionSummary(ChatSessionBase):
+    """Session list item: no messages, only the denormalized counters and preview"""
+    id: str
+    created_at: datetime
+    updated_at: datetime
+    last_message_at: Optional[datetime] = None
+    message_count: int = 0
+    total_tokens: int = 0
+    last_message_preview: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -50,7 +65,8 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="The user's message to the assistant")
     session_id: Optional[str] = Field(None, description="Session ID (None for new session)")
     session_title: Optional[str] = Field(None, description="Title for new session")
-    provider: Literal["openai", "claude", "deepseek"] = Field(default="deepseek", description="The AI provider to use")
+    provider: Literal["openai", "claude", "deepseek", "local"] = Field(default="deepseek", description="The AI provider to use (local = offline simulator, if enabled)")
+    bypass_cache: bool = Field(default=False, description="Skip the response cache and always call the provider")
 
 
 class ChatResponse(BaseModel):
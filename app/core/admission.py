@@ -0,0 +1,201 @@
+"""
+Controle de admissão das chamadas de IA.
+
+Limita quantas chamadas ao AIProviderManager rodam ao mesmo tempo no processo
+e quantas cada usuário pode ter em andamento. Quando não há vaga, a requisição
+entra na fila da faixa (lane) do plano do usuário. As faixas são atendidas por
+weighted fair queueing (cada faixa avança `1/peso` a cada vaga recebida, e a de
+menor valor é atendida primeiro); dentro da faixa, os usuários se revezam em
+round-robin, de modo que ninguém monopoliza a capacidade abrindo várias abas.
+"""
+import asyncio
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+
+
+class AdmissionRejected(Exception):
+    """A requisição esperou demais (ou a fila está cheia) e foi recusada"""
+
+
+def normalize_plan(plan: Optional[str]) -> str:
+    plan = unicodedata.normalize("NFKD", plan or "basic")
+    return "".join(c for c in plan if not unicodedata.combining(c)).strip().lower()
+
+
+class AdmissionTicket:
+    def __init__(self, user_id: str, lane: str):
+        self.user_id = user_id
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.future: Optional[asyncio.Future] = None
+
+
+class Lane:
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = max(1, weight)
+        self.virtual_time = 0.0
+        # user_id -> fila de tickets; a ordem das chaves define o round-robin
+        self.users: "OrderedDict[str, Deque[AdmissionTicket]]" = OrderedDict()
+        self.admitted = 0
+        self.rejected = 0
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.users.values())
+
+
+class AdmissionController:
+    def __init__(self, capacity: int = None, per_user: int = None):
+        self.capacity = capacity or settings.AI_MAX_CONCURRENT_CALLS
+        self.per_user = per_user or settings.AI_MAX_CONCURRENT_PER_USER
+        self.active = 0
+        self.active_by_user: Dict[str, int] = {}
+        self.lanes: Dict[str, Lane] = {}
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+
+    def _lane(self, plan: Optional[str]) -> Lane:
+        name = normalize_plan(plan)
+        lane = self.lanes.get(name)
+        if lane is None:
+            weight = settings.AI_PLAN_WEIGHTS.get(name, settings.AI_PLAN_WEIGHTS.get("default", 1))
+            lane = Lane(name, weight)
+            # Faixa nova começa no tempo virtual das demais, sem crédito acumulado
+            lane.virtual_time = min((l.virtual_time for l in self.lanes.values()), default=0.0)
+            self.lanes[name] = lane
+        return lane
+
+    def _catch_up(self, lane: Lane):
+        """
+        Faixa ociosa que volta a ter fila não reaproveita o tempo virtual que
+        deixou de usar: avança até o menor tempo entre as faixas com espera.
+        """
+        waiting = [l.virtual_time for l in self.lanes.values() if l is not lane and l.users]
+        if waiting:
+            lane.virtual_time = max(lane.virtual_time, min(waiting))
+
+    def queue_depth(self) -> int:
+        return sum(lane.depth() for lane in self.lanes.values())
+
+    def _grant(self, ticket: AdmissionTicket, lane: Lane):
+        self.active += 1
+        self.active_by_user[ticket.user_id] = self.active_by_user.get(ticket.user_id, 0) + 1
+        lane.virtual_time += 1.0 / lane.weight
+        lane.admitted += 1
+        self.wait_times.append(time.monotonic() - ticket.enqueued_at)
+
+    async def acquire(self, user_id: str, plan: Optional[str]) -> AdmissionTicket:
+        """
+        Obter uma vaga para uma chamada de IA.
+
+        Raises:
+            AdmissionRejected: se a fila estiver cheia ou a espera passar de AI_ADMISSION_MAX_WAIT_SECONDS
+        """
+        lane = self._lane(plan)
+        ticket = AdmissionTicket(str(user_id), lane.name)
+
+        if self.queue_depth() >= settings.AI_ADMISSION_MAX_QUEUE:
+            lane.rejected += 1
+            raise AdmissionRejected("Muitas requisições de IA em andamento; tente novamente em instantes")
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        if not lane.users:
+            self._catch_up(lane)
+        lane.users.setdefault(ticket.user_id, deque()).append(ticket)
+        self._dispatch()
+        if ticket.future.done():
+            # Havia vaga livre
+            return ticket
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout=settings.AI_ADMISSION_MAX_WAIT_SECONDS)
+            return ticket
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # A vaga foi concedida no mesmo instante do timeout/cancelamento: devolvê-la
+                self.release(ticket)
+            else:
+                ticket.future.cancel()
+                self._remove(ticket, lane)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            lane.rejected += 1
+            raise AdmissionRejected("Tempo de espera por capacidade de IA esgotado; tente novamente em instantes")
+
+    def release(self, ticket: AdmissionTicket):
+        self.active -= 1
+        remaining = self.active_by_user.get(ticket.user_id, 1) - 1
+        if remaining > 0:
+            self.active_by_user[ticket.user_id] = remaining
+        else:
+            self.active_by_user.pop(ticket.user_id, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, plan: Optional[str]):
+        ticket = await self.acquire(user_id, plan)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _remove(self, ticket: AdmissionTicket, lane: Lane):
+        queue = lane.users.get(ticket.user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            pass
+        if not queue:
+            del lane.users[ticket.user_id]
+
+    def _dispatch(self):
+        """Conceder vagas livres às faixas com menor tempo virtual, revezando usuários"""
+        while self.active < self.capacity:
+            best_lane, best_user = None, None
+            for lane in sorted(self.lanes.values(), key=lambda l: l.virtual_time):
+                for user_id in lane.users:
+                    if self.active_by_user.get(user_id, 0) < self.per_user:
+                        best_lane, best_user = lane, user_id
+                        break
+                if best_lane is not None:
+                    break
+            if best_lane is None:
+                return
+
+            queue = best_lane.users.pop(best_user)
+            ticket = queue.popleft()
+            if queue:
+                # Volta para o fim da faixa: próximo usuário tem a vez
+                best_lane.users[best_user] = queue
+            if ticket.future.done():
+                continue
+            self._grant(ticket, best_lane)
+            ticket.future.set_result(True)
+
+    def stats(self) -> Dict[str, object]:
+        waits = sorted(self.wait_times)
+        return {
+            "capacity": self.capacity,
+            "per_user_limit": self.per_user,
+            "active": self.active,
+            "queue_depth": self.queue_depth(),
+            "wait_p50": round(waits[int(0.5 * (len(waits) - 1))], 3) if waits else 0.0,
+            "wait_p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+            "lanes": {
+                lane.name: {
+                    "weight": lane.weight,
+                    "queue_depth": lane.depth(),
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected,
+                }
+                for lane in self.lanes.values()
+            },
+        }
+
+
+admission_controller = AdmissionController()
@@ -1,25 +1,238 @@
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, AsyncIterator, Awaitable, Optional
+import asyncio
+import logging
+import time
+import httpx
 import openai
 import anthropic
 from enum import Enum
 from app.core.config import settings
+from app.core.response_cache import response_cache
+from app.core.provider_router import ProviderRouter
+from app.core.rate_governor import RateGovernor, build_key_pool, estimate_request_tokens
+from app.core.model_tiering import ModelSelection, select_model, tier_model
+from app.core.local_provider import LOCAL_MODEL, LocalProvider, SimulatedRateLimitError, cassette_recorder
+from app.core.token_estimator import count_prompt_tokens, count_tokens, token_meter, usage_from_response
+
+logger = logging.getLogger(__name__)
 
 class AIProvider(Enum):
     OPENAI = "openai"
     CLAUDE = "claude"
     DEEPSEEK = "deepseek"
+    LOCAL = "local"  # Simulador offline (ver app.core.local_provider)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+# Modelo usado por cada provedor quando nenhum é especificado
+DEFAULT_MODELS = {
+    AIProvider.OPENAI: "gpt-3.5-turbo",
+    AIProvider.CLAUDE: "claude-3-sonnet-20240229",
+    AIProvider.DEEPSEEK: "deepseek-chat",
+    AIProvider.LOCAL: LOCAL_MODEL,
+}
+
+# Janela de contexto (em tokens) de cada modelo
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "claude-3-haiku-20240307": 200000,
+    "claude-3-sonnet-20240229": 200000,
+    "claude-3-opus-20240229": 200000,
+    "deepseek-chat": 64000,
+    LOCAL_MODEL: 128000,
+}
+
+# Limite de tokens da resposta quando a chamada não define um (ver app.core.model_tiering)
+MAX_COMPLETION_TOKENS = 1000
+
+# Erros 429 dos SDKs: a chave usada é pausada pelo governador de taxa
+RATE_LIMIT_ERRORS = (openai.RateLimitError, anthropic.RateLimitError, SimulatedRateLimitError)
+
+# Saúde dos provedores compartilhada pelo processo (circuit breakers, latências, hedging).
+# O simulador fica de fora: nunca é usado como failover de um provedor real.
+provider_router = ProviderRouter([p for p in AIProvider if p != AIProvider.LOCAL])
+
+SYSTEM_PROMPT = """Você é uma assistente jurídica especializada no sistema legal brasileiro.
+                Forneça informações precisas e úteis sobre questões legais no Brasil, citando leis e códigos relevantes.
+                Quando não tiver certeza, seja transparente sobre as limitações do seu conhecimento.
+                Não forneça conselhos jurídicos definitivos, apenas orientações gerais."""
+
+
+class AIProviderError(Exception):
+    """Nenhum provedor conseguiu responder à requisição"""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """O prazo da requisição acabou antes da resposta do provedor"""
+
+    # O prazo é da requisição, não do provedor: o roteador não deve abrir o circuito por isso
+    provider_fault = False
+
+
+def time_left(deadline: Optional[float]) -> Optional[float]:
+    """
+    Segundos até o prazo (time.monotonic()) da requisição; None sem prazo.
+
+    Raises:
+        DeadlineExceeded: se o prazo já passou
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Prazo da requisição esgotado")
+    return remaining
+
+
+async def until_deadline(awaitable: Awaitable, deadline: Optional[float]):
+    """Aguardar `awaitable` no máximo até o prazo da requisição"""
+    try:
+        return await asyncio.wait_for(awaitable, time_left(deadline))
+    except DeadlineExceeded:
+        raise
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Prazo da requisição esgotado")
+
+
+class AIResponse:
+    def __init__(self, message, tokens_used, failed: bool = False):
+        self.message = message
+        self.tokens_used = tokens_used
+        # True quando `message` é a resposta de desculpas (nenhum provedor respondeu)
+        self.failed = failed
+
+
+class AIResponseStream:
+    """
+    Resposta em streaming de um provedor de IA.
+
+    Iterar sobre o objeto produz os trechos de texto à medida que o provedor os
+    envia. Ao final da iteração, `message` contém a resposta completa e
+    `tokens_used` o total informado pelo provedor (ou a contagem local, se ele
+    não informar; 0 para respostas do cache).
+
+    Se o consumidor desistir no meio (ex.: o cliente desconectou), `aclose()`
+    interrompe a requisição ao provedor; `message` fica com a parte recebida e
+    `partial_tokens_used()` estima os tokens efetivamente gerados.
+    """
+
+    def __init__(self, provider: AIProvider):
+        self._chunks: AsyncIterator[Tuple[str, int]] = None
+        self.provider = provider
+        self.message = ""
+        self.tokens_used = 0
+        # Estimativa do prompt enviado ao provedor; 0 enquanto nenhum provedor foi chamado (ex.: cache)
+        self.prompt_tokens = 0
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for delta, tokens_used in self._chunks:
+            if tokens_used:
+                self.tokens_used = tokens_used
+            if delta:
+                self.message += delta
+                yield delta
+        if not self.tokens_used:
+            # Provedor não informou o uso: cobrar pela contagem local
+            self.tokens_used = self.partial_tokens_used()
+
+    async def aclose(self):
+        """Encerrar o streaming e a requisição ao provedor, se ainda estiver aberta"""
+        if self._chunks is not None:
+            await self._chunks.aclose()
+
+    def partial_tokens_used(self) -> int:
+        """Tokens de uma resposta interrompida: o total do provedor, se já veio, ou a estimativa do que foi gerado"""
+        if self.tokens_used:
+            return self.tokens_used
+        if not self.prompt_tokens:
+            return 0
+        return self.prompt_tokens + count_tokens(self.message)
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Criar o cliente HTTP compartilhado pelos SDKs dos provedores.
+    
+    Um único pool de conexões keep-alive atende todos os provedores, de modo que
+    chamadas concorrentes reaproveitam conexões TLS em vez de abrir novas.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.AI_HTTP_READ_TIMEOUT,
+            connect=settings.AI_HTTP_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Valor do header Retry-After de um erro 429, se houver"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 
 class AIProviderManager:
     def __init__(self):
-        # Configurar clientes
-        self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.claude_client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        # Clientes assíncronos de longa duração, um por chave de API, sobre o mesmo pool HTTP
+        self.http_client = build_http_client()
+        self._clients: Dict[Tuple[AIProvider, str], Any] = {}
+        self.rate_governor = RateGovernor({
+            AIProvider.OPENAI.value: build_key_pool(settings.OPENAI_API_KEY, AIProvider.OPENAI.value),
+            AIProvider.CLAUDE.value: build_key_pool(settings.ANTHROPIC_API_KEY, AIProvider.CLAUDE.value),
+            AIProvider.DEEPSEEK.value: build_key_pool(settings.DEEPSEEK_API_KEY, AIProvider.DEEPSEEK.value),
+            AIProvider.LOCAL.value: [AIProvider.LOCAL.value],
+        })
+        self._local: Optional[LocalProvider] = None
+
+    def _client(self, provider: AIProvider, api_key: str):
+        """Cliente do SDK para a chave informada, criado uma única vez"""
+        client = self._clients.get((provider, api_key))
+        if client is not None:
+            return client
+        if provider == AIProvider.CLAUDE:
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                http_client=self.http_client,
+                max_retries=settings.AI_MAX_RETRIES
+            )
+        else:
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=DEEPSEEK_BASE_URL if provider == AIProvider.DEEPSEEK else None,
+                http_client=self.http_client,
+                max_retries=settings.AI_MAX_RETRIES
+            )
+        self._clients[(provider, api_key)] = client
+        return client
+
+    def _local_provider(self) -> LocalProvider:
+        """Simulador local, criado na primeira chamada (carrega o cassete, se configurado)"""
+        if not settings.LOCAL_PROVIDER_ENABLED:
+            raise ValueError("Provedor local desabilitado (LOCAL_PROVIDER_ENABLED)")
+        if self._local is None:
+            self._local = LocalProvider()
+        return self._local
+
+    async def aclose(self):
+        """Fechar o pool de conexões compartilhado (chamado no shutdown da aplicação)"""
+        await self.http_client.aclose()
         
-    def get_chat_completion(
+    async def get_chat_completion(
         self,
         messages: List[Dict[str, str]],
         provider: AIProvider = AIProvider.OPENAI,
-        model: str = None
+        model: str = None,
+        use_cache: bool = True,
+        tier: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
     ) -> Tuple[str, int]:
         """
         Obter uma resposta do modelo de IA baseado no provedor selecionado.
@@ -28,83 +241,204 @@ class AIProviderManager:
             messages: Lista de mensagens no formato esperado pela API
             provider: Provedor de IA a ser usado
             model: Modelo específico a ser usado (opcional)
+            use_cache: Se False, ignora respostas em cache e sempre chama o provedor
+            tier: Faixa de modelo (fast/standard/strong); vale também para o provedor de failover
+            max_tokens: Limite de tokens da resposta (padrão: MAX_COMPLETION_TOKENS)
+            deadline: Prazo da requisição (time.monotonic()); vale para todas as tentativas
             
         Returns:
-            Uma tupla contendo (resposta, tokens_utilizados)
+            Uma tupla contendo (resposta, tokens_utilizados). Respostas vindas do
+            cache retornam 0 tokens, pois não consomem créditos. Se nenhum
+            provedor responder, a resposta é uma mensagem de desculpas com 0
+            tokens (use `complete_chat` para receber o erro).
         """
         try:
-            # Adicionar um sistema prompt para contexto legal brasileiro
-            system_message = {
-                "role": "system",
-                "content": """Você é uma assistente jurídica especializada no sistema legal brasileiro.
-                Forneça informações precisas e úteis sobre questões legais no Brasil, citando leis e códigos relevantes.
-                Quando não tiver certeza, seja transparente sobre as limitações do seu conhecimento.
-                Não forneça conselhos jurídicos definitivos, apenas orientações gerais."""
-            }
-            
-            # Verificar se já existe um sistema prompt
-            has_system = any(msg.get("role") == "system" for msg in messages)
-            
-            if not has_system:
-                messages = [system_message] + messages
-            
-            if provider == AIProvider.OPENAI:
-                return self._get_openai_completion(messages, model)
-            elif provider == AIProvider.CLAUDE:
-                return self._get_claude_completion(messages)
-            elif provider == AIProvider.DEEPSEEK:
-                return self._get_deepseek_completion(messages)
+            return await self.complete_chat(
+                messages, provider, model, use_cache, tier, max_tokens, deadline
+            )
+        except AIProviderError as e:
+            logger.warning(f"Erro ao chamar {provider.value}: {str(e)}")
+            return f"Desculpe, não foi possível processar sua solicitação no momento. Erro: {str(e)}", 0
+    
+    async def complete_chat(
+        self,
+        messages: List[Dict[str, str]],
+        provider: AIProvider = AIProvider.OPENAI,
+        model: str = None,
+        use_cache: bool = True,
+        tier: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> Tuple[str, int]:
+        """
+        Como `get_chat_completion`, mas a falha do provedor é levantada em vez
+        de virar uma resposta de desculpas.
+        
+        Raises:
+            AIProviderError: se nenhum provedor responder (a causa fica em __cause__)
+        """
+        messages = self._with_system_prompt(messages)
+        max_tokens = max_tokens or MAX_COMPLETION_TOKENS
+        if tier and not model:
+            model = tier_model(provider.value, tier)
+        
+        def candidate_model(candidate: AIProvider) -> Optional[str]:
+            if candidate == provider:
+                return model
+            return tier_model(candidate.value, tier) if tier else None
+        
+        if use_cache:
+            cached = response_cache.get(messages, provider.value, model, max_tokens)
+            if cached is not None:
+                return cached[0], 0
+        else:
+            response_cache.record_bypass()
+        
+        try:
+            if provider == AIProvider.LOCAL:
+                # O simulador não passa pelo roteador: sem failover de/para provedores reais
+                provider_used = provider
+                result = await self._complete(provider, messages, model, max_tokens, deadline)
             else:
-                raise ValueError(f"Provedor não suportado: {provider}")
-                
+                # O roteador escolhe a ordem dos provedores pela saúde recente, faz failover e hedging
+                provider_used, result = await provider_router.call(
+                    provider,
+                    lambda candidate: self._complete(candidate, messages, candidate_model(candidate), max_tokens, deadline)
+                )
         except Exception as e:
-            print(f"Erro ao chamar {provider.value}: {str(e)}")
-            # Tentar o próximo provedor disponível
+            raise AIProviderError(f"Falha ao chamar {provider.value}: {str(e)}") from e
+        if provider_used != provider:
+            # Não vai para o cache: a chave é do provedor pedido, não do que respondeu
+            logger.info(f"Resposta obtida de {provider_used.value} no lugar de {provider.value}")
+        else:
+            response_cache.set(messages, provider.value, model, *result, max_tokens=max_tokens)
+        return result
+    
+    async def _complete(
+        self,
+        provider: AIProvider,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS,
+        deadline: Optional[float] = None
+    ) -> Tuple[str, int]:
+        """Chamar o provedor depois de reservar capacidade (RPM/TPM) em uma das suas chaves"""
+        governor = self.rate_governor[provider.value]
+        lease = await governor.acquire(estimate_request_tokens(messages, max_tokens))
+        tokens_used = 0
+        settled = False
+        started_at = time.monotonic()
+        try:
             if provider == AIProvider.OPENAI:
-                return self._get_claude_completion(messages)
+                call = self._get_openai_completion(messages, model, lease.api_key, max_tokens)
             elif provider == AIProvider.CLAUDE:
-                return self._get_deepseek_completion(messages)
+                call = self._get_claude_completion(messages, lease.api_key, model, max_tokens)
+            elif provider == AIProvider.DEEPSEEK:
+                call = self._get_deepseek_completion(messages, lease.api_key, model, max_tokens)
+            elif provider == AIProvider.LOCAL:
+                call = self._local_provider().complete(messages, model, max_tokens)
             else:
-                return f"Desculpe, não foi possível processar sua solicitação no momento. Erro: {str(e)}", 0
+                raise ValueError(f"Provedor não suportado: {provider}")
+            result = await until_deadline(call, deadline)
+            tokens_used = result[1]
+            if not tokens_used:
+                # Provedor não informou o uso: contar localmente para que a resposta seja cobrada
+                tokens_used = count_prompt_tokens(messages) + count_tokens(result[0])
+                result = (result[0], tokens_used)
+            if provider != AIProvider.LOCAL:
+                cassette_recorder.record(provider.value, model, messages, result[0], result[1], started_at)
+            return result
+        except RATE_LIMIT_ERRORS as e:
+            settled = True
+            governor.penalize(lease, retry_after_seconds(e))
+            raise
+        except asyncio.CancelledError:
+            # Cancelada pelo roteador (hedge perdedor) ou pelo cliente: a capacidade reservada volta para a chave
+            settled = True
+            governor.release(lease)
+            raise
+        finally:
+            if not settled:
+                governor.settle(lease, tokens_used)
+    
+    def _with_system_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Adicionar o sistema prompt de contexto legal brasileiro, se ainda não houver um"""
+        has_system = any(msg.get("role") == "system" for msg in messages)
+        if has_system:
+            return messages
+        return [{"role": "system", "content": SYSTEM_PROMPT}] + messages
     
-    def _get_openai_completion(self, messages: List[Dict[str, str]], model: str = None) -> Tuple[str, int]:
+    async def _get_openai_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        api_key: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> Tuple[str, int]:
         """Obter resposta do OpenAI"""
+        client = self._client(AIProvider.OPENAI, api_key or settings.OPENAI_API_KEY)
         try:
-            model = model or "gpt-3.5-turbo"
+            model = model or DEFAULT_MODELS[AIProvider.OPENAI]
             print(f"Calling OpenAI API with model: {model}")
-            response = self.openai_client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=0.7,
-                max_tokens=1000,
+                max_tokens=max_tokens,
                 top_p=0.95,
                 frequency_penalty=0,
                 presence_penalty=0
             )
-            return response.choices[0].message.content, response.usage.total_tokens
+            return response.choices[0].message.content, self._record_usage(AIProvider.OPENAI, messages, response.usage)
+        except openai.RateLimitError:
+            # Outro modelo na mesma chave também seria recusado
+            raise
         except Exception as e:
             print(f"OpenAI API Error: {str(e)}")
             # Try with fallback model if specified model failed
             if model != "gpt-3.5-turbo":
                 print(f"Retrying with fallback model: gpt-3.5-turbo")
                 try:
-                    response = self.openai_client.chat.completions.create(
+                    response = await client.chat.completions.create(
                         model="gpt-3.5-turbo",
                         messages=messages,
                         temperature=0.7,
-                        max_tokens=1000,
+                        max_tokens=max_tokens,
                         top_p=0.95,
                         frequency_penalty=0,
                         presence_penalty=0
                     )
-                    return response.choices[0].message.content, response.usage.total_tokens
+                    return response.choices[0].message.content, self._record_usage(AIProvider.OPENAI, messages, response.usage)
                 except Exception as e2:
                     print(f"Fallback model error: {str(e2)}")
             raise
     
-    def _get_claude_completion(self, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+    async def _get_claude_completion(
+        self,
+        messages: List[Dict[str, str]],
+        api_key: str = None,
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> Tuple[str, int]:
         """Obter resposta do Claude"""
-        # Converter mensagens para o formato do Claude
+        client = self._client(AIProvider.CLAUDE, api_key or settings.ANTHROPIC_API_KEY)
+        response = await client.messages.create(
+            model=model or DEFAULT_MODELS[AIProvider.CLAUDE],
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": self._to_claude_prompt(messages)}]
+        )
+        return response.content[0].text, self._record_usage(AIProvider.CLAUDE, messages, response.usage)
+    
+    def _record_usage(self, provider: AIProvider, messages: List[Dict[str, str]], usage: Any) -> int:
+        """Registrar o uso real informado pelo provedor e retornar o total (0 se ele não informou)"""
+        token_usage = usage_from_response(usage)
+        if token_usage is None:
+            return 0
+        token_meter.record(provider.value, token_usage, count_prompt_tokens(messages))
+        return token_usage.total
+    
+    def _to_claude_prompt(self, messages: List[Dict[str, str]]) -> str:
+        """Converter mensagens para o formato do Claude"""
         prompt = ""
         for msg in messages:
             if msg["role"] == "system":
@@ -113,31 +447,35 @@ class AIProviderManager:
                 prompt += f"Human: {msg['content']}\n\n"
             elif msg["role"] == "assistant":
                 prompt += f"Assistant: {msg['content']}\n\n"
-        
-        response = self.claude_client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.content[0].text, 0  # Claude não retorna contagem de tokens
+        return prompt
     
-    def _get_deepseek_completion(self, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+    async def _get_deepseek_completion(
+        self,
+        messages: List[Dict[str, str]],
+        api_key: str = None,
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> Tuple[str, int]:
         """Obter resposta do DeepSeek"""
-        # Configurar cliente DeepSeek
-        deepseek_client = openai.OpenAI(
-            api_key=settings.DEEPSEEK_API_KEY,
-            base_url="https://api.deepseek.com/v1"
-        )
-        
-        response = deepseek_client.chat.completions.create(
-            model="deepseek-chat",
+        client = self._client(AIProvider.DEEPSEEK, api_key or settings.DEEPSEEK_API_KEY)
+        response = await client.chat.completions.create(
+            model=model or DEFAULT_MODELS[AIProvider.DEEPSEEK],
             messages=messages,
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=max_tokens
         )
-        return response.choices[0].message.content, 0  # DeepSeek não retorna contagem de tokens 
+        return response.choices[0].message.content, self._record_usage(AIProvider.DEEPSEEK, messages, response.usage)
 
-    def get_response(self, user_message: str, session_id: str, provider: AIProvider = AIProvider.OPENAI):
+    async def get_response(
+        self,
+        user_message: str,
+        session_id: str,
+        provider: AIProvider = AIProvider.OPENAI,
+        history: Optional[List[Dict[str, str]]] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ):
         """
         Obter uma resposta do modelo de IA baseado na mensagem do usuário
         
@@ -145,43 +483,284 @@ class AIProviderManager:
             user_message: Mensagem enviada pelo usuário
             session_id: ID da sessão de chat
             provider: Provedor de IA a ser usado
+            history: Mensagens anteriores da conversa (ver app.services.chat_context)
+            use_cache: Se False, ignora o cache de respostas
+            deadline: Prazo da requisição (time.monotonic()), repassado até o provedor
+            max_tokens: Teto para o limite de resposta da faixa (ex.: reduzido para caber no saldo)
             
         Returns:
             Um objeto contendo a resposta do assistente
         """
         try:
-            messages = [
+            messages = (history or []) + [
                 {"role": "user", "content": user_message}
             ]
             
-            print(f"Processing message with provider: {provider.value}")
+            # Faixa de modelo e limite de resposta conforme a complexidade da mensagem
+            selection = select_model(provider.value, user_message, history)
+            logger.debug(f"Processing message with provider: {provider.value}, tier: {selection.tier}")
             
             # Obter completions do provedor
-            ai_message, tokens_used = self.get_chat_completion(
+            ai_message, tokens_used = await self.complete_chat(
                 messages=messages,
-                provider=provider
+                provider=provider,
+                use_cache=use_cache,
+                tier=selection.tier,
+                max_tokens=min(selection.max_tokens, max_tokens or selection.max_tokens),
+                deadline=deadline
             )
             
-            # Criar objeto de resposta
-            class AIResponse:
-                def __init__(self, message, tokens_used):
-                    self.message = message
-                    self.tokens_used = tokens_used
-            
             return AIResponse(message=ai_message, tokens_used=tokens_used)
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Error in get_response: {str(e)}")
-            print(f"Error details: {error_trace}")
-            print(f"Provider: {provider.value}, Message: {user_message[:50]}...")
+            # Sem o conteúdo da mensagem: pode conter dados do caso do cliente
+            logger.exception(f"Error in get_response (provider: {provider.value}, session: {session_id})")
             
             # Fornecer uma resposta de fallback para não quebrar a UI
             error_msg = f"Desculpe, não foi possível processar sua solicitação no momento. Erro: {str(e)[:100]}"
+            return AIResponse(message=error_msg, tokens_used=0, failed=True)
+
+    def stream_response(
+        self,
+        user_message: str,
+        session_id: str,
+        provider: AIProvider = AIProvider.OPENAI,
+        history: Optional[List[Dict[str, str]]] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AIResponseStream:
+        """
+        Obter uma resposta em streaming do modelo de IA
+        
+        Args:
+            user_message: Mensagem enviada pelo usuário
+            session_id: ID da sessão de chat
+            provider: Provedor de IA a ser usado
+            history: Mensagens anteriores da conversa (ver app.services.chat_context)
+            use_cache: Se False, ignora o cache de respostas
+            deadline: Prazo da requisição (time.monotonic()); cada trecho precisa chegar antes dele
+            max_tokens: Teto para o limite de resposta da faixa (ex.: reduzido para caber no saldo)
             
-            class AIResponse:
-                def __init__(self, message, tokens_used):
-                    self.message = message
-                    self.tokens_used = tokens_used
-                    
-            return AIResponse(message=error_msg, tokens_used=0) 
\ No newline at end of file
+        Returns:
+            Um AIResponseStream que produz os trechos de texto à medida que chegam
+        """
+        messages = self._with_system_prompt((history or []) + [
+            {"role": "user", "content": user_message}
+        ])
+        
+        selection = select_model(provider.value, user_message, history)
+        if max_tokens:
+            selection.max_tokens = min(selection.max_tokens, max_tokens)
+        logger.info(f"Streaming message with provider: {provider.value}, tier: {selection.tier}")
+        
+        ai_stream = AIResponseStream(provider=provider)
+        
+        if use_cache:
+            cached = response_cache.get(messages, provider.value, selection.model, selection.max_tokens)
+            if cached is not None:
+                ai_stream._chunks = self._replay_cached(cached[0])
+                return ai_stream
+        else:
+            response_cache.record_bypass()
+        
+        ai_stream._chunks = self._stream_with_fallback(messages, provider, ai_stream, selection, deadline)
+        return ai_stream
+
+    async def _replay_cached(self, message: str) -> AsyncIterator[Tuple[str, int]]:
+        """Entregar uma resposta em cache como um único trecho, sem consumir tokens"""
+        yield message, 0
+
+    async def _stream_with_fallback(
+        self,
+        messages: List[Dict[str, str]],
+        provider: AIProvider,
+        ai_stream: AIResponseStream,
+        selection: ModelSelection,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """
+        Repassar os deltas do provedor; se ele falhar antes do primeiro trecho,
+        tentar o próximo provedor na ordem do roteador.
+        """
+        ai_stream.prompt_tokens = estimate_request_tokens(messages, 0)
+        # O simulador é tentado sozinho: sem failover de/para provedores reais
+        candidates = [provider] if provider == AIProvider.LOCAL else provider_router.candidates(provider)
+        for index, current in enumerate(candidates):
+            ai_stream.provider = current
+            started = False
+            provider_router.begin(current)
+            model = selection.model if current == provider else tier_model(current.value, selection.tier)
+            stream = self._open_stream(current, messages, model, selection.max_tokens, deadline)
+            try:
+                async for delta, tokens_used in stream:
+                    if not started:
+                        started = True
+                        provider_router.record(current, True)
+                    yield delta, tokens_used
+                if not started:
+                    provider_router.record(current, True)
+                if current == provider:
+                    # Respostas de failover não vão para o cache: a chave é do provedor pedido
+                    response_cache.set(
+                        messages, provider.value, selection.model, ai_stream.message, ai_stream.tokens_used,
+                        max_tokens=selection.max_tokens
+                    )
+                return
+            except GeneratorExit:
+                # Consumidor desistiu (ex.: cliente desconectou): não é falha do provedor
+                if not started:
+                    provider_router.abandon(current)
+                raise
+            except Exception as e:
+                logger.warning(f"Erro no streaming de {current.value}: {str(e)}")
+                if getattr(e, "provider_fault", True):
+                    provider_router.record(current, False)
+                else:
+                    provider_router.abandon(current)
+                if started or index == len(candidates) - 1:
+                    raise
+            finally:
+                # Fecha a requisição ao provedor mesmo quando o consumidor para no meio
+                await stream.aclose()
+
+    async def _open_stream(
+        self,
+        provider: AIProvider,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Abrir o streaming depois de reservar capacidade (RPM/TPM) em uma das chaves do provedor"""
+        governor = self.rate_governor[provider.value]
+        lease = await governor.acquire(estimate_request_tokens(messages, max_tokens))
+        tokens_used = 0
+        streamed = []
+        stream = None
+        settled = False
+        started_at = time.monotonic()
+        # Trechos com o instante de chegada, para gravação em cassete
+        recording = [] if cassette_recorder.enabled and provider != AIProvider.LOCAL else None
+        try:
+            if provider == AIProvider.OPENAI:
+                stream = self._stream_openai_completion(messages, model, lease.api_key, max_tokens)
+            elif provider == AIProvider.CLAUDE:
+                stream = self._stream_claude_completion(messages, lease.api_key, model, max_tokens)
+            elif provider == AIProvider.DEEPSEEK:
+                stream = self._stream_deepseek_completion(messages, lease.api_key, model, max_tokens)
+            elif provider == AIProvider.LOCAL:
+                stream = self._local_provider().stream(messages, model, max_tokens)
+            else:
+                raise ValueError(f"Provedor não suportado: {provider}")
+            while True:
+                try:
+                    delta, tokens = await until_deadline(stream.__anext__(), deadline)
+                except StopAsyncIteration:
+                    break
+                tokens_used = tokens or tokens_used
+                if delta:
+                    streamed.append(delta)
+                    if recording is not None:
+                        recording.append((time.monotonic() - started_at, delta))
+                yield delta, tokens
+            if recording is not None:
+                cassette_recorder.record(
+                    provider.value, model, messages, "".join(text for _, text in recording),
+                    tokens_used, started_at, recording
+                )
+        except RATE_LIMIT_ERRORS as e:
+            settled = True
+            governor.penalize(lease, retry_after_seconds(e))
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            if not streamed and not tokens_used:
+                # Abandonado antes do primeiro trecho: nada foi gerado, devolver a reserva
+                settled = True
+                governor.release(lease)
+            raise
+        finally:
+            if stream is not None:
+                await stream.aclose()
+            if not settled:
+                # Interrompido antes do total do provedor: liquidar pelo que foi gerado
+                if not tokens_used and streamed:
+                    tokens_used = estimate_request_tokens(messages + [{"content": "".join(streamed)}], 0)
+                governor.settle(lease, tokens_used)
+
+    async def _stream_openai_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        api_key: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Streaming de resposta do OpenAI, com a contagem de tokens no último chunk"""
+        client = self._client(AIProvider.OPENAI, api_key or settings.OPENAI_API_KEY)
+        stream = await client.chat.completions.create(
+            model=model or DEFAULT_MODELS[AIProvider.OPENAI],
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            top_p=0.95,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content, 0
+                if getattr(chunk, "usage", None):
+                    yield "", self._record_usage(AIProvider.OPENAI, messages, chunk.usage)
+        finally:
+            # Fechar a resposta HTTP aborta a geração no provedor se o streaming parar no meio
+            await stream.close()
+
+    async def _stream_claude_completion(
+        self,
+        messages: List[Dict[str, str]],
+        api_key: str = None,
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Streaming de resposta do Claude"""
+        client = self._client(AIProvider.CLAUDE, api_key or settings.ANTHROPIC_API_KEY)
+        async with client.messages.stream(
+            model=model or DEFAULT_MODELS[AIProvider.CLAUDE],
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": self._to_claude_prompt(messages)}]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text, 0
+            usage = (await stream.get_final_message()).usage
+            yield "", self._record_usage(AIProvider.CLAUDE, messages, usage)
+
+    async def _stream_deepseek_completion(
+        self,
+        messages: List[Dict[str, str]],
+        api_key: str = None,
+        model: str = None,
+        max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Streaming de resposta do DeepSeek (API compatível com a OpenAI)"""
+        client = self._client(AIProvider.DEEPSEEK, api_key or settings.DEEPSEEK_API_KEY)
+        stream = await client.chat.completions.create(
+            model=model or DEFAULT_MODELS[AIProvider.DEEPSEEK],
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content, 0
+                if getattr(chunk, "usage", None):
+                    yield "", self._record_usage(AIProvider.DEEPSEEK, messages, chunk.usage)
+        finally:
+            # Fechar a resposta HTTP aborta a geração no provedor se o streaming parar no meio
+            await stream.close()
+
+
+# Instância compartilhada pelo processo: mantém os clientes e o pool de conexões vivos entre requisições
+ai_manager = AIProviderManager()
@@ -69,6 +69,130 @@ class Settings(BaseSettings):
     DEFAULT_MODEL_NAME: str = "gpt-4"
     FALLBACK_MODEL_NAME: str = "gpt-3.5-turbo"
     
+    # AI Provider HTTP Pool
+    AI_HTTP_MAX_CONNECTIONS: int = 500
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    AI_HTTP_CONNECT_TIMEOUT: float = 5.0
+    AI_HTTP_READ_TIMEOUT: float = 60.0
+    AI_MAX_RETRIES: int = 0  # 429 e falhas são tratados pelo governador de taxa e pelo roteador
+    AI_REQUEST_DEADLINE_SECONDS: float = 120.0  # Prazo total de um turno de chat, do endpoint até o provedor (inclui failover)
+    
+    # Provider Rate Limits (por chave de API)
+    AI_API_KEY_POOLS: Dict[str, List[str]] = {}  # Chaves extras por provedor, ex.: {"openai": ["sk-...", "sk-..."]}
+    AI_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+        "openai": {"rpm": 500, "tpm": 200000},
+        "claude": {"rpm": 50, "tpm": 40000},
+        "deepseek": {"rpm": 300, "tpm": 300000},
+        "local": {"rpm": 1000000, "tpm": 1000000000},
+    }
+    AI_RATE_MAX_WAIT_SECONDS: float = 10.0  # Espera máxima na fila antes de descartar a requisição
+    AI_RATE_MAX_QUEUE: int = 200
+    AI_RATE_LIMIT_PAUSE_SECONDS: float = 20.0  # Pausa de uma chave após 429 sem Retry-After
+    
+    # Provider Router
+    AI_ROUTER_WINDOW_SECONDS: int = 300  # Janela móvel de latências/erros por provedor
+    AI_ROUTER_MIN_REQUESTS: int = 5
+    AI_ROUTER_ERROR_RATE_THRESHOLD: float = 0.5
+    AI_ROUTER_MAX_CONSECUTIVE_FAILURES: int = 3
+    AI_ROUTER_OPEN_SECONDS: int = 30  # Tempo com o circuito aberto antes da requisição de teste
+    AI_HEDGING_ENABLED: bool = True
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    AI_HEDGE_MAX_DELAY_SECONDS: float = 15.0
+    
+    # AI Admission Control
+    AI_MAX_CONCURRENT_CALLS: int = 200  # Chamadas de IA simultâneas por processo
+    AI_MAX_CONCURRENT_PER_USER: int = 3
+    AI_PLAN_WEIGHTS: Dict[str, int] = {
+        "enterprise": 8,
+        "pro": 4,
+        "basico": 2,
+        "basic": 2,
+        "gratuito": 1,
+        "free": 1,
+        "default": 1,
+    }
+    AI_ADMISSION_MAX_QUEUE: int = 500
+    AI_ADMISSION_MAX_WAIT_SECONDS: float = 20.0
+    
+    # Model Tiering
+    AI_MODEL_TIERING_ENABLED: bool = True
+    AI_MODEL_TIERS: Dict[str, Dict[str, str]] = {
+        "openai": {"fast": "gpt-3.5-turbo", "standard": "gpt-3.5-turbo", "strong": "gpt-4"},
+        "claude": {
+            "fast": "claude-3-haiku-20240307",
+            "standard": "claude-3-sonnet-20240229",
+            "strong": "claude-3-opus-20240229",
+        },
+        "deepseek": {"fast": "deepseek-chat", "standard": "deepseek-chat", "strong": "deepseek-chat"},
+    }
+    AI_TIER_MAX_TOKENS: Dict[str, int] = {"fast": 400, "standard": 1000, "strong": 2000}
+    AI_TIER_FAST_MAX_SCORE: int = 0  # Pontuação até a qual a mensagem vai para o modelo rápido
+    AI_TIER_STRONG_MIN_SCORE: int = 4  # Pontuação a partir da qual vai para o modelo forte
+    
+    # Token Estimation
+    AI_TOKENIZER_ENCODING: str = "cl100k_base"  # Encoding do tiktoken (opcional); sem ele, ~4 caracteres por token
+    AI_MIN_COMPLETION_TOKENS: int = 200  # Menor limite de resposta aceito ao reduzir uma requisição para caber no saldo
+    
+    # Local Provider (simulador offline para testes de carga)
+    LOCAL_PROVIDER_ENABLED: bool = False
+    LOCAL_PROVIDER_PROFILE: str = "typical"
+    LOCAL_PROVIDER_PROFILES: Dict[str, Dict[str, float]] = {
+        "instant": {"first_token_ms": 0, "chunk_interval_ms": 0, "tokens_per_chunk": 8, "response_tokens": 200},
+        "typical": {
+            "first_token_ms": 600, "first_token_sigma": 0.4, "chunk_interval_ms": 25,
+            "tokens_per_chunk": 3, "response_tokens": 350,
+        },
+        "slow": {
+            "first_token_ms": 2500, "first_token_sigma": 0.6, "chunk_interval_ms": 60,
+            "tokens_per_chunk": 2, "response_tokens": 600,
+        },
+        "flaky": {
+            "first_token_ms": 800, "first_token_sigma": 0.8, "chunk_interval_ms": 30,
+            "tokens_per_chunk": 3, "response_tokens": 350,
+            "error_rate": 0.05, "rate_limit_rate": 0.05, "stream_error_rate": 0.05, "retry_after": 2,
+        },
+    }
+    LOCAL_PROVIDER_SEED: Optional[int] = None
+    LOCAL_PROVIDER_CASSETTE: str = ""  # Arquivo JSONL gravado com AI_CASSETTE_RECORD_PATH
+    LOCAL_PROVIDER_REPLAY_STRICT: bool = False  # Falhar (em vez de sintetizar) se a interação não estiver no cassete
+    LOCAL_PROVIDER_REPLAY_SPEED: float = 1.0  # Multiplicador dos tempos gravados (0 = sem espera)
+    AI_CASSETTE_RECORD_PATH: str = ""  # Gravar as interações com os provedores reais neste arquivo
+    
+    # Usage Accounting (write-behind)
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_FLUSH_MAX_PENDING: int = 500  # Usuários pendentes que antecipam o flush
+    
+    # Idempotency
+    IDEMPOTENCY_TTL_SECONDS: int = 60 * 60  # Janela de replay das respostas com Idempotency-Key
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    
+    # Response Cache
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2000
+    RESPONSE_CACHE_TTL_SECONDS: int = 60 * 60 * 24  # 1 day
+    RESPONSE_CACHE_SEMANTIC_ENABLED: bool = False
+    RESPONSE_CACHE_SEMANTIC_THRESHOLD: float = 0.9
+    
+    # Chat Context
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 3000  # Tokens de histórico enviados ao modelo por turno
+    CHAT_CONTEXT_BATCH_SIZE: int = 20  # Mensagens carregadas por consulta ao montar o contexto
+    CHAT_SUMMARY_BATCH_SIZE: int = 30  # Mensagens antigas incorporadas ao resumo por atualização
+
+    # Chat WebSocket
+    CHAT_WS_SEND_QUEUE_SIZE: int = 32  # Trechos aguardando envio por conexão; cheio, a leitura do provedor pausa
+    CHAT_WS_MAX_MESSAGE_CHARS: int = 20000  # Tamanho máximo de uma mensagem recebida pelo WebSocket
+
+    # Chat Stream Resume (SSE com Last-Event-ID)
+    CHAT_STREAM_REPLAY_MAX_EVENTS: int = 4000  # Eventos guardados por stream para retomada
+    CHAT_STREAM_REPLAY_MAX_STREAMS: int = 2000  # Streams retomáveis mantidos pelo processo
+    CHAT_STREAM_REPLAY_TTL_SECONDS: int = 300  # Por quanto tempo um stream encerrado pode ser retomado
+    CHAT_STREAM_RESUME_GRACE_SECONDS: float = 20.0  # Sem cliente conectado por esse tempo, a geração é abortada
+    
+    # Template Catalog
+    TEMPLATE_CATALOG_CHECK_SECONDS: float = 30.0  # Intervalo entre verificações de mudança na tabela de templates
+    TEMPLATE_CATALOG_CONTENT_CACHE_SIZE: int = 256  # Textos de templates mantidos em memória
+    
     # AWS S3 Configuration
     AWS_ACCESS_KEY_ID: str = ""
     AWS_SECRET_ACCESS_KEY: str = ""
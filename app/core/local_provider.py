@@ -0,0 +1,221 @@
+"""
+Provedor de IA local (simulador) e gravação/reprodução de interações.
+
+O provedor `local` não faz chamadas de rede. Ele pode:
+- sintetizar respostas seguindo um perfil de latência (tempo até o primeiro
+  token com distribuição log-normal, cadência dos trechos de streaming,
+  tamanho da resposta e taxa de erros/429 injetados);
+- reproduzir interações gravadas de provedores reais a partir de um cassete
+  (arquivo JSONL), respeitando os tempos gravados.
+
+Com `AI_CASSETTE_RECORD_PATH` definido, as chamadas aos provedores reais são
+gravadas nesse arquivo para uso posterior com `LOCAL_PROVIDER_CASSETTE`.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.rate_governor import estimate_request_tokens
+from app.core.response_cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = "local-sim"
+
+# Vocabulário das respostas sintéticas
+WORDS = (
+    "conforme", "o", "artigo", "do", "Código", "Civil", "a", "parte", "pode", "requerer",
+    "tutela", "de", "urgência", "no", "prazo", "legal", "observado", "contraditório", "e",
+    "ampla", "defesa", "nos", "termos", "da", "jurisprudência", "do", "STJ", "sendo",
+    "cabível", "recurso", "quando", "houver", "lesão", "ao", "direito", "processual",
+)
+
+
+class SimulatedProviderError(Exception):
+    """Falha injetada pelo simulador (equivale a um erro 5xx do provedor)"""
+
+
+class SimulatedRateLimitError(Exception):
+    """429 injetado pelo simulador"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        # Mesmo formato lido por retry_after_seconds() nos erros dos SDKs
+        self.response = type("SimulatedResponse", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+def interaction_key(messages: List[Dict[str, str]]) -> str:
+    """Chave de uma interação no cassete: hash das mensagens normalizadas"""
+    parts = [f"{m.get('role')}:{normalize_prompt(m.get('content', ''))}" for m in messages]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class CassetteRecorder:
+    """Grava interações com provedores reais em um arquivo JSONL"""
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else settings.AI_CASSETTE_RECORD_PATH
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(
+        self,
+        provider: str,
+        model: Optional[str],
+        messages: List[Dict[str, str]],
+        response: str,
+        tokens_used: int,
+        started_at: float,
+        chunks: Optional[List[Tuple[float, str]]] = None
+    ):
+        """
+        Gravar uma interação.
+
+        Args:
+            started_at: time.monotonic() do início da chamada
+            chunks: (segundos desde o início, texto) de cada trecho, para streaming
+        """
+        if not self.enabled:
+            return
+        entry = {
+            "key": interaction_key(messages),
+            "provider": provider,
+            "model": model,
+            "response": response,
+            "tokens_used": tokens_used,
+            "duration_ms": round((time.monotonic() - started_at) * 1000, 1),
+            "chunks": [[round(offset * 1000, 1), text] for offset, text in chunks or []],
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not record cassette entry to {self.path}: {str(e)}")
+
+
+class LocalProvider:
+    """Simulador de provedor: respostas sintéticas ou reproduzidas de um cassete"""
+
+    def __init__(self, profile: str = None, cassette_path: str = None, seed: Optional[int] = None):
+        profile_name = profile or settings.LOCAL_PROVIDER_PROFILE
+        if profile_name not in settings.LOCAL_PROVIDER_PROFILES:
+            raise ValueError(f"Perfil de latência desconhecido: {profile_name}")
+        self.profile_name = profile_name
+        self.profile = settings.LOCAL_PROVIDER_PROFILES[profile_name]
+        self.random = random.Random(settings.LOCAL_PROVIDER_SEED if seed is None else seed)
+        self.cassette_path = cassette_path if cassette_path is not None else settings.LOCAL_PROVIDER_CASSETTE
+        # chave -> interações gravadas, reproduzidas em rodízio
+        self.cassette: Dict[str, List[dict]] = {}
+        self._replay_index: Dict[str, int] = {}
+        if self.cassette_path:
+            self._load_cassette(self.cassette_path)
+
+    def _load_cassette(self, path: str):
+        if not os.path.exists(path):
+            logger.warning(f"Cassette file not found: {path}")
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.cassette.setdefault(entry["key"], []).append(entry)
+        logger.info(f"Loaded {sum(len(v) for v in self.cassette.values())} cassette entries from {path}")
+
+    def _recorded(self, messages: List[Dict[str, str]]) -> Optional[dict]:
+        key = interaction_key(messages)
+        entries = self.cassette.get(key)
+        if not entries:
+            if self.cassette and settings.LOCAL_PROVIDER_REPLAY_STRICT:
+                raise SimulatedProviderError("Interação não encontrada no cassete")
+            return None
+        index = self._replay_index.get(key, 0)
+        self._replay_index[key] = index + 1
+        return entries[index % len(entries)]
+
+    def _inject_errors(self):
+        roll = self.random.random()
+        if roll < self.profile.get("rate_limit_rate", 0.0):
+            raise SimulatedRateLimitError("Simulated rate limit", retry_after=self.profile.get("retry_after", 1.0))
+        if roll < self.profile.get("rate_limit_rate", 0.0) + self.profile.get("error_rate", 0.0):
+            raise SimulatedProviderError("Simulated provider error")
+
+    def _first_token_delay(self) -> float:
+        median = self.profile["first_token_ms"] / 1000
+        return self.random.lognormvariate(0, self.profile.get("first_token_sigma", 0.0)) * median
+
+    def _synthesize(self, messages: List[Dict[str, str]], max_tokens: int) -> Tuple[List[str], int]:
+        """Trechos da resposta sintética e total de tokens (prompt + resposta)"""
+        mean = self.profile["response_tokens"]
+        completion_tokens = max(1, min(max_tokens, int(self.random.gauss(mean, mean * 0.25))))
+        words = [self.random.choice(WORDS) for _ in range(completion_tokens)]
+        per_chunk = max(1, int(self.profile.get("tokens_per_chunk", 1)))
+        chunks = [
+            " ".join(words[i:i + per_chunk]) + " "
+            for i in range(0, len(words), per_chunk)
+        ]
+        return chunks, estimate_request_tokens(messages, 0) + completion_tokens
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = 1000
+    ) -> Tuple[str, int]:
+        recorded = self._recorded(messages)
+        if recorded is not None:
+            await asyncio.sleep(recorded["duration_ms"] / 1000 * settings.LOCAL_PROVIDER_REPLAY_SPEED)
+            return recorded["response"], recorded["tokens_used"]
+
+        self._inject_errors()
+        chunks, tokens_used = self._synthesize(messages, max_tokens)
+        # Sem streaming, a resposta chega inteira depois da geração de todos os trechos
+        delay = self._first_token_delay() + len(chunks) * self.profile["chunk_interval_ms"] / 1000
+        await asyncio.sleep(delay)
+        return "".join(chunks).strip(), tokens_used
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = 1000
+    ) -> AsyncIterator[Tuple[str, int]]:
+        recorded = self._recorded(messages)
+        if recorded is not None:
+            speed = settings.LOCAL_PROVIDER_REPLAY_SPEED
+            elapsed = 0.0
+            chunks = recorded["chunks"] or [[recorded["duration_ms"], recorded["response"]]]
+            for offset_ms, text in chunks:
+                await asyncio.sleep(max(0.0, offset_ms / 1000 - elapsed) * speed)
+                elapsed = max(elapsed, offset_ms / 1000)
+                yield text, 0
+            yield "", recorded["tokens_used"]
+            return
+
+        self._inject_errors()
+        chunks, tokens_used = self._synthesize(messages, max_tokens)
+        # Queda no meio do streaming, depois de alguns trechos já entregues
+        fail_at = None
+        if self.random.random() < self.profile.get("stream_error_rate", 0.0):
+            fail_at = self.random.randint(1, max(1, len(chunks) - 1))
+        await asyncio.sleep(self._first_token_delay())
+        interval = self.profile["chunk_interval_ms"] / 1000
+        for index, text in enumerate(chunks):
+            if index == fail_at:
+                raise SimulatedProviderError("Simulated stream interruption")
+            if index:
+                await asyncio.sleep(interval)
+            if index == len(chunks) - 1:
+                text = text.rstrip()
+            yield text, 0
+        yield "", tokens_used
+
+
+cassette_recorder = CassetteRecorder()
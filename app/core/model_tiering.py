@@ -0,0 +1,127 @@
+"""
+Escolha do modelo e do limite de resposta de cada requisição.
+
+Um classificador local (sem chamada externa) dá uma pontuação à mensagem com
+base no tamanho, em termos que indicam trabalho jurídico complexo (redação de
+peças, análise de jurisprudência) ou perguntas factuais curtas, e no volume de
+contexto que a acompanha. A pontuação define a faixa (tier):
+
+- fast: perguntas curtas e diretas, respondidas pelo modelo rápido e barato;
+- standard: o caso comum;
+- strong: redação de peças e análises longas, enviadas ao modelo mais capaz.
+
+Os modelos de cada faixa por provedor vêm de `AI_MODEL_TIERS` e o limite de
+tokens da resposta de `AI_TIER_MAX_TOKENS`.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+FAST = "fast"
+STANDARD = "standard"
+STRONG = "strong"
+
+# Pedidos de redação ou análise aprofundada (sem acentos, ver _normalize)
+COMPLEX_TERMS = (
+    "redija", "redigir", "elabore", "elaborar", "minuta", "peticao", "peticao inicial",
+    "contestacao", "recurso", "apelacao", "agravo", "embargos", "mandado de seguranca",
+    "habeas corpus", "parecer", "contrato", "clausula", "fundamentacao", "fundamente",
+    "jurisprudencia", "precedentes", "sumula", "doutrina", "analise", "analisar",
+    "compare", "estrategia", "tese", "impugnacao", "memoriais", "razoes",
+)
+
+# Perguntas factuais curtas
+SIMPLE_PATTERNS = (
+    r"^(o que e|o que significa|qual (e|o|a)|quais sao|quanto|quando|onde|quem)\b",
+    r"\bprazo\b",
+    r"\bartigo \d+\b",
+    r"\bdefinicao\b",
+)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+class ModelSelection:
+    """Faixa, modelo e limite de resposta escolhidos para uma requisição"""
+
+    def __init__(self, tier: str, model: Optional[str], max_tokens: int, score: int):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.score = score
+
+
+def score_request(user_message: str, context_tokens: int = 0) -> int:
+    """
+    Pontuação de complexidade da mensagem: quanto maior, mais forte o modelo.
+
+    Args:
+        user_message: Mensagem atual do usuário
+        context_tokens: Tokens estimados do histórico/contexto que acompanha a mensagem
+    """
+    text = _normalize(user_message).strip()
+    words = len(text.split())
+    score = 0
+
+    # Tamanho da mensagem
+    if words > 150:
+        score += 3
+    elif words > 60:
+        score += 2
+    elif words > 25:
+        score += 1
+
+    # Termos de trabalho jurídico complexo (no máximo 4 pontos)
+    score += min(4, 2 * sum(1 for term in COMPLEX_TERMS if re.search(rf"\b{term}\b", text)))
+
+    # Contexto anexado (histórico longo, resumo da conversa)
+    if context_tokens > 2000:
+        score += 2
+    elif context_tokens > 800:
+        score += 1
+
+    # Pergunta factual curta
+    if words <= 25 and any(re.search(pattern, text) for pattern in SIMPLE_PATTERNS):
+        score -= 2
+
+    return score
+
+
+def tier_for_score(score: int) -> str:
+    if score <= settings.AI_TIER_FAST_MAX_SCORE:
+        return FAST
+    if score >= settings.AI_TIER_STRONG_MIN_SCORE:
+        return STRONG
+    return STANDARD
+
+
+def tier_model(provider: str, tier: str) -> Optional[str]:
+    """Modelo de uma faixa no provedor; None para usar o padrão do provedor"""
+    return settings.AI_MODEL_TIERS.get(provider, {}).get(tier)
+
+
+def select_model(
+    provider: str,
+    user_message: str,
+    history: Optional[List[Dict[str, str]]] = None
+) -> ModelSelection:
+    """
+    Escolher faixa, modelo e max_tokens para uma mensagem.
+
+    Args:
+        provider: Valor do provedor (ex.: "openai")
+        user_message: Mensagem atual do usuário
+        history: Mensagens que acompanham a mensagem (contexto)
+    """
+    if not settings.AI_MODEL_TIERING_ENABLED:
+        return ModelSelection(STANDARD, None, settings.AI_TIER_MAX_TOKENS[STANDARD], 0)
+
+    context_tokens = sum(len(m.get("content") or "") // 4 for m in history or [])
+    score = score_request(user_message, context_tokens)
+    tier = tier_for_score(score)
+    return ModelSelection(tier, tier_model(provider, tier), settings.AI_TIER_MAX_TOKENS[tier], score)
@@ -0,0 +1,229 @@
+"""
+Roteamento entre provedores de IA com base na saúde de cada um.
+
+Para cada provedor é mantida uma janela móvel de latências e erros. Um
+provedor que falha com frequência tem o circuito aberto e deixa de receber
+requisições até o fim do período de espera, quando uma única requisição de
+teste decide se ele volta (half-open). Para chamadas não-streaming, o
+roteador pode disparar uma requisição "hedge" em um segundo provedor quando a
+primeira passa do p95 de latência, ficando com a que responder primeiro.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderHealth:
+    """Estatísticas móveis e estado do circuit breaker de um provedor"""
+
+    def __init__(self, name: str):
+        self.name = name
+        # (timestamp, latência em segundos ou None, sucesso)
+        self.samples: Deque[Tuple[float, Optional[float], bool]] = deque()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def _trim(self, now: float):
+        cutoff = now - settings.AI_ROUTER_WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        now = time.monotonic()
+        self.samples.append((now, latency, ok))
+        self._trim(now)
+        self.probe_in_flight = False
+
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            return
+
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self._should_open():
+            if self.state != OPEN:
+                logger.warning(f"Circuit for {self.name} opened (error rate {self.error_rate():.0%})")
+            self.state = OPEN
+            self.opened_at = now
+
+    def _should_open(self) -> bool:
+        if self.consecutive_failures >= settings.AI_ROUTER_MAX_CONSECUTIVE_FAILURES:
+            return True
+        return (
+            len(self.samples) >= settings.AI_ROUTER_MIN_REQUESTS
+            and self.error_rate() >= settings.AI_ROUTER_ERROR_RATE_THRESHOLD
+        )
+
+    def available(self) -> bool:
+        """Se o provedor pode receber uma requisição agora"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= settings.AI_ROUTER_OPEN_SECONDS:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probe_in_flight
+        return self.state == CLOSED
+
+    def begin_request(self):
+        """Marcar o início de uma requisição; em half-open, ela é a única requisição de teste"""
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = True
+
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        latencies = sorted(latency for _, latency, ok in self.samples if ok and latency is not None)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile * (len(latencies) - 1))))
+        return latencies[index]
+
+    def hedge_delay(self) -> float:
+        """Quanto esperar antes de disparar o hedge: p95 recente, limitado pela configuração"""
+        p95 = None
+        if len(self.samples) >= settings.AI_ROUTER_MIN_REQUESTS:
+            p95 = self.latency_percentile(0.95)
+        if p95 is None:
+            return settings.AI_HEDGE_MAX_DELAY_SECONDS
+        return min(max(p95, settings.AI_HEDGE_MIN_DELAY_SECONDS), settings.AI_HEDGE_MAX_DELAY_SECONDS)
+
+    def stats(self) -> Dict[str, object]:
+        self._trim(time.monotonic())
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "state": self.state,
+            "requests": len(self.samples),
+            "error_rate": round(self.error_rate(), 4),
+            "consecutive_failures": self.consecutive_failures,
+            "p50_latency": round(p50, 3) if p50 is not None else None,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class ProviderRouter:
+    def __init__(self, providers: List[Hashable]):
+        self.providers = list(providers)
+        self.health: Dict[Hashable, ProviderHealth] = {
+            provider: ProviderHealth(getattr(provider, "value", str(provider))) for provider in self.providers
+        }
+
+    def candidates(self, preferred: Hashable) -> List[Hashable]:
+        """
+        Provedores em ordem de tentativa: o preferido primeiro (se disponível),
+        depois os demais do mais saudável para o menos saudável. Provedores com
+        o circuito aberto ficam de fora; se todos estiverem abertos, o preferido
+        é tentado mesmo assim. Um provedor fora do roteador (ex.: o simulador
+        local) é tentado sozinho, sem failover.
+        """
+        if preferred not in self.health:
+            return [preferred]
+        others = sorted(
+            (p for p in self.providers if p != preferred),
+            key=lambda p: (self.health[p].error_rate(), self.health[p].latency_percentile(0.95) or 0.0)
+        )
+        ordered = [p for p in [preferred] + others if p in self.health and self.health[p].available()]
+        return ordered or [preferred]
+
+    def begin(self, provider: Hashable):
+        if provider in self.health:
+            self.health[provider].begin_request()
+
+    def record(self, provider: Hashable, ok: bool, latency: Optional[float] = None):
+        if provider in self.health:
+            self.health[provider].record(ok, latency)
+
+    def abandon(self, provider: Hashable):
+        """Requisição cancelada sem resultado (ex.: hedge perdedor): libera a vaga de teste"""
+        if provider in self.health:
+            self.health[provider].probe_in_flight = False
+
+    async def call(self, preferred: Hashable, fn: Callable[[Hashable], Awaitable[T]]) -> Tuple[Hashable, T]:
+        """
+        Executar `fn(provedor)` com failover e, se habilitado, hedging.
+
+        Returns:
+            Uma tupla (provedor_que_respondeu, resultado)
+
+        Raises:
+            A última exceção, se todos os provedores falharem
+        """
+        pending_providers = self.candidates(preferred)
+        running: Dict[asyncio.Task, Tuple[Hashable, float]] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            provider = pending_providers.pop(0)
+            self.begin(provider)
+            task = asyncio.create_task(fn(provider))
+            running[task] = (provider, time.monotonic())
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if settings.AI_HEDGING_ENABLED and pending_providers and len(running) == 1:
+                    first_provider, _ = next(iter(running.values()))
+                    timeout = self.health[first_provider].hedge_delay()
+
+                done, _ = await asyncio.wait(running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # O primeiro provedor passou do p95: disparar o hedge
+                    logger.info(f"Hedging request to {getattr(pending_providers[0], 'value', pending_providers[0])}")
+                    launch()
+                    continue
+
+                # Todas as tasks concluídas são lidas, inclusive as que perderam para uma
+                # resposta simultânea: a exceção é consumida e a falha entra na saúde do provedor
+                winner: Optional[Tuple[Hashable, T]] = None
+                for task in done:
+                    provider, started = running.pop(task)
+                    latency = time.monotonic() - started
+                    error = task.exception()
+                    if error is None:
+                        self.record(provider, True, latency)
+                        if winner is None:
+                            winner = (provider, task.result())
+                        continue
+                    if getattr(error, "provider_fault", True):
+                        self.record(provider, False, latency)
+                    else:
+                        # Recusada localmente (ex.: limite de taxa): não conta contra a saúde do provedor
+                        self.abandon(provider)
+                    last_error = error
+                    logger.warning(f"Provider {getattr(provider, 'value', provider)} failed: {str(error)}")
+
+                if winner is not None:
+                    return winner
+
+                # Falha sem nada em andamento: seguir para o próximo provedor
+                if not running and pending_providers:
+                    launch()
+        finally:
+            for task, (provider, _) in running.items():
+                task.cancel()
+                self.abandon(provider)
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {health.name: health.stats() for health in self.health.values()}
@@ -0,0 +1,202 @@
+"""
+Controle de taxa (RPM/TPM) por provedor e por chave de API.
+
+Cada chave tem dois token buckets: requisições por minuto e tokens por minuto.
+Antes de chamar o provedor, a requisição reserva uma requisição e a estimativa
+de tokens na chave com mais folga do pool. Sem folga, ela espera na fila até
+`AI_RATE_MAX_WAIT_SECONDS`; se a espera for maior ou a fila estiver cheia, a
+requisição é descartada localmente em vez de gerar um 429 no provedor. Quando
+o provedor responde 429 mesmo assim, a chave fica em pausa pelo tempo pedido.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.token_estimator import count_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Requisição descartada localmente por falta de capacidade no provedor"""
+
+    # Não é uma falha do provedor: o roteador não deve abrir o circuito por isso
+    provider_fault = False
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Estimativa de tokens de uma requisição: prompt contado (ver app.core.token_estimator) + limite da resposta"""
+    return count_prompt_tokens(messages) + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos até haver `amount` disponível"""
+        missing = min(amount, self.capacity) - self.available()
+        return max(0.0, missing / self.rate) if self.rate else float("inf")
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        """Zerar o saldo (mantendo uma dívida, se houver); volta a encher no ritmo normal"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeyLease:
+    """Reserva de capacidade em uma chave de API para uma requisição"""
+
+    def __init__(self, governor: "ProviderGovernor", key: "ApiKeyState", reserved_tokens: int):
+        self.governor = governor
+        self.key = key
+        self.api_key = key.api_key
+        self.reserved_tokens = reserved_tokens
+
+
+class ApiKeyState:
+    def __init__(self, api_key: str, rpm: int, tpm: int):
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.rate_limited = 0
+
+    def wait_time(self, tokens: int) -> float:
+        pause = max(0.0, self.paused_until - time.monotonic())
+        return max(pause, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class ProviderGovernor:
+    def __init__(self, name: str, api_keys: List[str], rpm: int, tpm: int):
+        self.name = name
+        self.keys = [ApiKeyState(api_key, rpm, tpm) for api_key in api_keys]
+        self.waiting = 0
+        self.shed = 0
+        self.admitted = 0
+
+    async def acquire(self, estimated_tokens: int) -> KeyLease:
+        """Reservar capacidade na chave com mais folga, esperando na fila se necessário"""
+        if not self.keys:
+            raise RateLimitExceeded(f"Nenhuma chave de API configurada para {self.name}")
+
+        deadline = time.monotonic() + settings.AI_RATE_MAX_WAIT_SECONDS
+        queued = False
+        try:
+            while True:
+                key = min(self.keys, key=lambda k: (k.wait_time(estimated_tokens), k.in_flight))
+                wait = key.wait_time(estimated_tokens)
+                if wait <= 0:
+                    key.requests.consume(1)
+                    key.tokens.consume(estimated_tokens)
+                    key.in_flight += 1
+                    self.admitted += 1
+                    return KeyLease(self, key, estimated_tokens)
+
+                if time.monotonic() + wait > deadline or (not queued and self.waiting >= settings.AI_RATE_MAX_QUEUE):
+                    self.shed += 1
+                    raise RateLimitExceeded(
+                        f"Capacidade de {self.name} esgotada; tente novamente em {wait:.1f}s"
+                    )
+                if not queued:
+                    queued = True
+                    self.waiting += 1
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            if queued:
+                self.waiting -= 1
+
+    def settle(self, lease: KeyLease, actual_tokens: int):
+        """Ajustar o bucket de tokens com o consumo real informado pelo provedor"""
+        lease.key.in_flight -= 1
+        if not actual_tokens:
+            return
+        difference = lease.reserved_tokens - actual_tokens
+        if difference > 0:
+            lease.key.tokens.refund(difference)
+        else:
+            lease.key.tokens.consume(-difference)
+
+    def penalize(self, lease: KeyLease, retry_after: Optional[float] = None):
+        """O provedor respondeu 429: pausar a chave e zerar seus buckets"""
+        lease.key.in_flight -= 1
+        lease.key.rate_limited += 1
+        # Sem isso, a chave voltaria da pausa com os buckets cheios e dispararia outra rajada
+        lease.key.requests.drain()
+        lease.key.tokens.drain()
+        pause = retry_after or settings.AI_RATE_LIMIT_PAUSE_SECONDS
+        lease.key.paused_until = time.monotonic() + pause
+        logger.warning(f"Rate limited by {self.name}; pausing key ...{lease.api_key[-4:]} for {pause:.0f}s")
+
+    def release(self, lease: KeyLease):
+        """Requisição cancelada antes da resposta do provedor (ex.: hedge perdedor): devolver a reserva"""
+        lease.key.in_flight -= 1
+        lease.key.requests.refund(1)
+        lease.key.tokens.refund(lease.reserved_tokens)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "keys": len(self.keys),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "key_usage": [
+                {
+                    "key": f"...{k.api_key[-4:]}",
+                    "in_flight": k.in_flight,
+                    "rpm_available": int(k.requests.available()),
+                    "tpm_available": int(k.tokens.available()),
+                    "paused": k.paused_until > time.monotonic(),
+                    "rate_limited": k.rate_limited,
+                }
+                for k in self.keys
+            ],
+        }
+
+
+class RateGovernor:
+    def __init__(self, key_pools: Dict[str, List[str]]):
+        self.providers: Dict[str, ProviderGovernor] = {}
+        for name, api_keys in key_pools.items():
+            limits = settings.AI_RATE_LIMITS.get(name, {})
+            self.providers[name] = ProviderGovernor(
+                name,
+                api_keys,
+                rpm=limits.get("rpm", 60),
+                tpm=limits.get("tpm", 60000),
+            )
+
+    def __getitem__(self, name: str) -> ProviderGovernor:
+        return self.providers[name]
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {name: governor.stats() for name, governor in self.providers.items()}
+
+
+def build_key_pool(primary_key: str, name: str) -> List[str]:
+    """Chave principal + chaves extras de AI_API_KEY_POOLS, sem repetição"""
+    keys = [primary_key] + list(settings.AI_API_KEY_POOLS.get(name, []))
+    return list(dict.fromkeys(k for k in keys if k))
@@ -0,0 +1,205 @@
+"""
+Cache de respostas dos provedores de IA.
+
+Dois níveis:
+- exato: chave derivada do prompt normalizado + provedor + modelo + limite de
+  tokens da resposta, com despejo LRU e TTL;
+- semântico (opcional): para perguntas sem histórico, um índice de vetores
+  esparsos (hashing de palavras e bigramas) encontra perguntas parecidas acima
+  de um limiar de similaridade de cosseno.
+"""
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Palavras muito frequentes que não ajudam a distinguir perguntas
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em",
+    "no", "na", "nos", "nas", "para", "por", "com", "que", "qual", "quais", "se",
+    "ao", "aos", "me", "meu", "minha", "sobre", "como", "ser", "pode", "posso",
+}
+
+VECTOR_DIMENSIONS = 2 ** 18
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalizar texto: minúsculas, sem acentos, espaços colapsados, sem pontuação final"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip(" ?!.")
+
+
+def hashing_vector(text: str) -> Dict[int, float]:
+    """Vetor esparso normalizado (L2) de palavras e bigramas, via hashing"""
+    words = [w for w in re.findall(r"\w+", normalize_prompt(text)) if w not in STOPWORDS]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector: Dict[int, float] = {}
+    for feature in features:
+        digest = hashlib.md5(feature.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % VECTOR_DIMENSIONS
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if norm:
+        for index in vector:
+            vector[index] /= norm
+    return vector
+
+
+def cosine_similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = None,
+        ttl_seconds: int = None,
+        semantic_enabled: bool = None,
+        semantic_threshold: float = None
+    ):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.max_entries = max_entries or settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.RESPONSE_CACHE_TTL_SECONDS
+        self.semantic_enabled = settings.RESPONSE_CACHE_SEMANTIC_ENABLED if semantic_enabled is None else semantic_enabled
+        self.semantic_threshold = semantic_threshold or settings.RESPONSE_CACHE_SEMANTIC_THRESHOLD
+
+        # chave -> (expira_em, resposta, tokens_originais)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        # (provedor, modelo, limite de tokens) -> {chave: vetor}
+        self._vectors: Dict[Tuple[str, str, Optional[int]], Dict[str, Dict[int, float]]] = {}
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def make_key(
+        self,
+        messages: List[Dict[str, str]],
+        provider: str,
+        model: Optional[str],
+        max_tokens: Optional[int] = None
+    ) -> str:
+        # O limite de tokens entra na chave: uma resposta cortada por um limite menor não serve a um maior
+        parts = [provider, model or "", str(max_tokens or "")]
+        parts.extend(f"{m.get('role')}:{normalize_prompt(m.get('content', ''))}" for m in messages)
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _semantic_question(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Pergunta elegível para o nível semântico: só vale para o primeiro turno do usuário"""
+        user_messages = [m for m in messages if m.get("role") == "user"]
+        if len(user_messages) != 1 or messages[-1].get("role") != "user":
+            return None
+        return user_messages[0].get("content")
+
+    def get(
+        self,
+        messages: List[Dict[str, str]],
+        provider: str,
+        model: Optional[str],
+        max_tokens: Optional[int] = None
+    ) -> Optional[Tuple[str, int]]:
+        """Buscar resposta em cache. Retorna (resposta, tokens_originais) ou None"""
+        if not self.enabled:
+            return None
+
+        key = self.make_key(messages, provider, model, max_tokens)
+        entry = self._get_entry(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        question = self._semantic_question(messages) if self.semantic_enabled else None
+        if question:
+            vector = hashing_vector(question)
+            best_key, best_score = None, 0.0
+            for candidate_key, candidate in self._vectors.get((provider, model or "", max_tokens), {}).items():
+                score = cosine_similarity(vector, candidate)
+                if score > best_score:
+                    best_key, best_score = candidate_key, score
+            if best_key is not None and best_score >= self.semantic_threshold:
+                entry = self._get_entry(best_key)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return entry
+
+        self.misses += 1
+        return None
+
+    def set(
+        self,
+        messages: List[Dict[str, str]],
+        provider: str,
+        model: Optional[str],
+        message: str,
+        tokens_used: int,
+        max_tokens: Optional[int] = None
+    ):
+        if not self.enabled or not message:
+            return
+
+        key = self.make_key(messages, provider, model, max_tokens)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, message, tokens_used)
+        self._entries.move_to_end(key)
+
+        question = self._semantic_question(messages) if self.semantic_enabled else None
+        if question:
+            self._vectors.setdefault((provider, model or "", max_tokens), {})[key] = hashing_vector(question)
+
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._drop_vector(old_key)
+            self.evictions += 1
+
+    def record_bypass(self):
+        self.bypasses += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._vectors.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "semantic_enabled": self.semantic_enabled,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _get_entry(self, key: str) -> Optional[Tuple[str, int]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, message, tokens_used = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._drop_vector(key)
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return message, tokens_used
+
+    def _drop_vector(self, key: str):
+        for vectors in self._vectors.values():
+            if vectors.pop(key, None) is not None:
+                return
+
+
+response_cache = ResponseCache()
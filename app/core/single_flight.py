@@ -0,0 +1,144 @@
+"""
+Coalescência de requisições idênticas e suporte ao header `Idempotency-Key`.
+
+Requisições concorrentes com o mesmo (usuário, endpoint, hash do payload)
+aguardam uma única execução compartilhada e recebem o mesmo resultado. Quando
+o cliente envia `Idempotency-Key`, a resposta fica guardada por
+`IDEMPOTENCY_TTL_SECONDS` e é devolvida nas novas tentativas sem chamar o
+provedor nem cobrar créditos outra vez.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class IdempotencyConflict(Exception):
+    """A mesma Idempotency-Key foi reutilizada com um payload diferente"""
+
+
+def payload_hash(payload: Any) -> str:
+    """Hash estável de um payload JSON-serializável"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Uma execução por chave em andamento; chamadas concorrentes aguardam a mesma task"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: se um dos clientes desistir, os demais continuam recebendo o resultado
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
+
+
+class IdempotencyStore:
+    """Respostas por Idempotency-Key, com TTL e despejo LRU"""
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None):
+        self.max_entries = max_entries or settings.IDEMPOTENCY_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.IDEMPOTENCY_TTL_SECONDS
+        # chave -> (expira_em, hash_do_payload, resposta)
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self.replays = 0
+
+    def get(self, key: str, fingerprint: str) -> Optional[Any]:
+        """
+        Resposta guardada para a chave, ou None.
+
+        Raises:
+            IdempotencyConflict: se a chave já foi usada com outro payload
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, stored_fingerprint, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key já utilizada com um conteúdo diferente")
+        self._entries.move_to_end(key)
+        self.replays += 1
+        return response
+
+    def set(self, key: str, fingerprint: str, response: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "replays": self.replays}
+
+
+single_flight = SingleFlight()
+idempotency_store = IdempotencyStore()
+
+
+async def run_once(
+    scope: str,
+    payload: Any,
+    fn: Callable[[], Awaitable[T]],
+    idempotency_key: Optional[str] = None,
+    store_if: Optional[Callable[[T], bool]] = None
+) -> T:
+    """
+    Executar `fn` no máximo uma vez por requisição lógica.
+
+    Só resultados bem-sucedidos ficam guardados pela Idempotency-Key: se `fn`
+    levantar uma exceção (ou `store_if` recusar o resultado), a próxima
+    tentativa com a mesma chave executa de novo.
+
+    Args:
+        scope: Usuário e endpoint, ex.: "<user_id>:chat.message"
+        payload: Corpo da requisição, usado no hash
+        fn: Corrotina que processa a requisição
+        idempotency_key: Valor do header Idempotency-Key, se enviado
+        store_if: Se o resultado pode ser guardado (ex.: não é uma resposta de erro)
+
+    Raises:
+        IdempotencyConflict: se a chave já foi usada com outro payload
+    """
+    fingerprint = payload_hash(payload)
+    if not idempotency_key:
+        return await single_flight.do(f"{scope}:{fingerprint}", fn)
+
+    store_key = f"{scope}:{idempotency_key}"
+    cached = idempotency_store.get(store_key, fingerprint)
+    if cached is not None:
+        return cached
+
+    async def execute_and_store():
+        result = await fn()
+        # Guardado dentro da execução compartilhada: vale mesmo se o cliente original desconectar
+        if store_if is None or store_if(result):
+            idempotency_store.set(store_key, fingerprint, result)
+        return result
+
+    return await single_flight.do(f"{store_key}:{fingerprint}", execute_and_store)
@@ -0,0 +1,141 @@
+"""
+Contagem de tokens offline, antes da chamada ao provedor, e registro do uso real depois dela.
+
+Com o pacote opcional `tiktoken` instalado, o texto é contado pelo encoding
+`AI_TOKENIZER_ENCODING` (o dos modelos da OpenAI, uma boa aproximação para
+Claude e DeepSeek); sem ele, ou se o encoding não puder ser carregado, vale a
+heurística de ~4 caracteres por token. A estimativa serve para reservar
+créditos e capacidade (RPM/TPM) antes da chamada: prompt contado + limite da
+resposta é o custo máximo da requisição.
+
+Depois da chamada, o uso informado pelo provedor (prompt e resposta) é
+registrado em `token_meter`, junto com a estimativa do prompt, para
+acompanhar o erro da estimativa em /admin/ai/metrics.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # dependência opcional
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens fixos por mensagem (papel e separadores) somados à contagem do conteúdo
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(settings.AI_TOKENIZER_ENCODING)
+    except Exception as e:
+        # Sem o arquivo do encoding em cache local, cair para a heurística em vez de falhar a requisição
+        logger.warning(f"Tokenizer {settings.AI_TOKENIZER_ENCODING} unavailable, using character estimate: {str(e)}")
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Tokens de um texto (o histórico se repete entre turnos: as contagens ficam em cache)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Tokens do prompt: conteúdo de cada mensagem + overhead fixo por mensagem"""
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class TokenEstimate:
+    """Estimativa feita antes da chamada: tokens do prompt e limite da resposta"""
+
+    def __init__(self, prompt_tokens: int, max_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+
+    @property
+    def max_total(self) -> int:
+        """Custo máximo da requisição em tokens"""
+        return self.prompt_tokens + self.max_tokens
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> TokenEstimate:
+    return TokenEstimate(count_prompt_tokens(messages), max_tokens)
+
+
+class TokenUsage:
+    """Uso informado pelo provedor"""
+
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def total(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def usage_from_response(usage: Any) -> Optional[TokenUsage]:
+    """
+    Ler o campo `usage` de uma resposta: OpenAI/DeepSeek (`prompt_tokens`,
+    `completion_tokens`) ou Anthropic (`input_tokens`, `output_tokens`).
+    None se o provedor não informou o uso.
+    """
+    if usage is None:
+        return None
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    if prompt_tokens is None:
+        prompt_tokens = getattr(usage, "input_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens is None:
+        completion_tokens = getattr(usage, "output_tokens", None)
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    return TokenUsage(prompt_tokens or 0, completion_tokens or 0)
+
+
+class TokenMeter:
+    """Totais de uso real por provedor e a soma das estimativas de prompt correspondentes"""
+
+    def __init__(self):
+        self._providers: Dict[str, Dict[str, int]] = {}
+
+    def record(self, provider: str, usage: TokenUsage, estimated_prompt_tokens: int):
+        totals = self._providers.setdefault(provider, {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "estimated_prompt_tokens": 0,
+        })
+        totals["requests"] += 1
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["completion_tokens"] += usage.completion_tokens
+        totals["estimated_prompt_tokens"] += estimated_prompt_tokens
+
+    def stats(self) -> Dict[str, object]:
+        providers = {}
+        for provider, totals in self._providers.items():
+            providers[provider] = dict(totals)
+            if totals["prompt_tokens"]:
+                # > 1: a estimativa superestima o prompt (reservas maiores que o consumo)
+                providers[provider]["prompt_estimate_ratio"] = round(
+                    totals["estimated_prompt_tokens"] / totals["prompt_tokens"], 3
+                )
+        return {
+            "tokenizer": "tiktoken" if _encoding() is not None else "chars/4",
+            "providers": providers,
+        }
+
+
+token_meter = TokenMeter()
@@ -5,10 +5,14 @@ from app.db.session import engine
 from app.models.user import User  # User should be first as other models depend on it
 from app.models.usage import Usage  # Changed from usage_tracking import ApiUsage
 from app.models.payment import Payment
+from app.models.credit_ledger import CreditLedgerEntry
 from app.models.chat_session import ChatSession
 from app.models.chat_message import ChatMessage
 from app.models.document import Document, Template, DocumentTemplate, LegalThesis, GeneratedDocument, DocumentThesisAssociation
+from app.services.template_search import template_search
 
 def init_db() -> None:
     """Initialize the database, creating all tables."""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # Full-text index is not an ORM table: created separately (idempotent)
+    template_search.ensure_index(engine)
@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
@@ -10,6 +13,57 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+class PoolMonitor:
+    """
+    Ocupação do pool de conexões: conexões em uso, pico, e por quanto tempo
+    cada conexão fica fora do pool (checkout -> checkin).
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.hold_times = deque(maxlen=max_samples)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checked_out += 1
+        self.checkouts += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+        connection_record.info["checked_out_at"] = time.monotonic()
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is None:
+            return
+        self.checked_out -= 1
+        self.hold_times.append(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        pool = engine.pool
+        hold_times = sorted(self.hold_times)
+
+        def hold_percentile(fraction):
+            if not hold_times:
+                return None
+            return round(hold_times[int(fraction * (len(hold_times) - 1))] * 1000, 2)
+
+        return {
+            "pool_size": getattr(pool, "size", lambda: None)(),
+            "max_overflow": getattr(pool, "_max_overflow", None),
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "hold_p50_ms": hold_percentile(0.5),
+            "hold_p95_ms": hold_percentile(0.95),
+            "hold_max_ms": round(hold_times[-1] * 1000, 2) if hold_times else None,
+        }
+
+
+pool_monitor = PoolMonitor()
+event.listen(engine, "checkout", pool_monitor.on_checkout)
+event.listen(engine, "checkin", pool_monitor.on_checkin)
+
 def get_db():
     """
     Dependency function that yields db sessions
@@ -9,6 +9,9 @@ from app.models.user import User
 from app.core.security import create_access_token, verify_password
 from datetime import timedelta, datetime
 from app.db.base import init_db
+from app.core.ai_providers import ai_manager
+from app.services.usage_aggregator import usage_aggregator
+from app.services.template_catalog import template_catalog
 import logging
 
 # Configure logging
@@ -38,8 +41,10 @@ app.add_middleware(
         "Origin",
         "X-Requested-With",
         "X-CSRF-Token",
+        "Idempotency-Key",
+        "Last-Event-ID",
     ],
-    expose_headers=["Content-Length", "Content-Range"],
+    expose_headers=["Content-Length", "Content-Range", "X-Next-Cursor"],
     max_age=3600,
 )
 
@@ -49,6 +54,26 @@ init_db()
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("startup")
+async def start_usage_aggregator():
+    """Start the periodic write-behind flush of usage counters"""
+    usage_aggregator.start()
+
+@app.on_event("startup")
+async def warm_template_catalog():
+    """Load the template catalog into memory before the first request"""
+    template_catalog.warm()
+
+@app.on_event("shutdown")
+async def close_ai_clients():
+    """Close the shared AI provider connection pool"""
+    await ai_manager.aclose()
+
+@app.on_event("shutdown")
+async def flush_usage_aggregator():
+    """Write pending usage counters before exiting"""
+    await usage_aggregator.stop()
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all requests"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from uuid import uuid4
@@ -17,4 +17,9 @@ class ChatMessage(Base):
     provider = Column(String, nullable=True)
     
     # Relationships
-    session = relationship("ChatSession", back_populates="messages") 
\ No newline at end of file
+    session = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        # Histórico paginado por keyset: mensagens da sessão por (created_at, id)
+        Index("ix_chat_messages_session_created_at_id", "session_id", "created_at", "id"),
+    )
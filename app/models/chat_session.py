@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from uuid import uuid4
@@ -14,7 +14,21 @@ class ChatSession(Base):
     title = Column(String, nullable=True)
     created_at = Column(DateTime, nullable=False, default=func.now())
     updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    # Resumo incremental das mensagens mais antigas (ver app.services.chat_context)
+    summary = Column(Text, nullable=True)
+    summary_until = Column(DateTime, nullable=True)
+    # Último turno de chat; NULL enquanto a sessão não recebeu mensagens do usuário
+    last_message_at = Column(DateTime, nullable=True)
+    # Dados desnormalizados para a listagem de sessões, atualizados a cada turno (ver app.services.chat_turn)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_preview = Column(String(200), nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="chat_sessions")
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan") 
\ No newline at end of file
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Listagem paginada por keyset: sessões do usuário por (updated_at, id)
+        Index("ix_chat_sessions_user_updated_at_id", "user_id", "updated_at", "id"),
+    ) 
\ No newline at end of file
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from uuid import uuid4
+from app.db.base_class import Base
+
+
+class CreditLedgerEntry(Base):
+    """Movimentação de créditos; só recebe inserções (ver app.services.credit_ledger)"""
+    __tablename__ = "credit_ledger"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    amount = Column(Integer, nullable=False)  # positivo: entrada; negativo: consumo ou reserva
+    kind = Column(String(20), nullable=False)  # 'opening', 'signup', 'purchase', 'reserve', 'release', 'chat', 'document', 'summary'
+    reference = Column(String, nullable=True)  # pagamento, mensagem ou reserva relacionada
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        # Extrato do usuário em ordem cronológica
+        Index("ix_credit_ledger_user_created_at", "user_id", "created_at"),
+    )
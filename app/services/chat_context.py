@@ -0,0 +1,292 @@
+"""
+Montagem do contexto de conversa enviado aos provedores de IA.
+
+O histórico de uma sessão é carregado do mais recente para o mais antigo, em
+lotes, até preencher o orçamento de tokens do modelo. As mensagens que ficam de
+fora da janela são condensadas em um resumo incremental, persistido em
+`ChatSession.summary` e mantido em cache no processo, de modo que o tamanho do
+prompt permanece limitado independentemente do tamanho da conversa.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.ai_providers import (
+    AIProvider,
+    DEFAULT_MODELS,
+    MAX_COMPLETION_TOKENS,
+    MODEL_CONTEXT_WINDOWS,
+    SYSTEM_PROMPT,
+    ai_manager,
+)
+from app.core.admission import AdmissionRejected, admission_controller
+from app.core.config import settings
+from app.core.token_estimator import MESSAGE_OVERHEAD_TOKENS, count_tokens, estimate_tokens as estimate_call_tokens
+from app.db.session import SessionLocal
+from app.models.chat_message import ChatMessage as ChatMessageModel
+from app.models.chat_session import ChatSession as ChatSessionModel
+from app.models.user import User
+from app.services.credit_ledger import InsufficientCredits, credit_ledger, credits_for_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Você resume conversas entre um advogado e uma assistente jurídica.
+Atualize o resumo existente incorporando as novas mensagens. Preserve fatos do caso,
+partes, prazos, dispositivos legais citados e decisões já tomadas. Responda apenas com o resumo."""
+
+def estimate_tokens(text: str) -> int:
+    """Tokens de uma mensagem do histórico (conteúdo + overhead fixo)"""
+    return count_tokens(text or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def context_budget(model: str) -> int:
+    """Tokens disponíveis para o histórico, respeitando a janela do modelo"""
+    window = MODEL_CONTEXT_WINDOWS.get(model, settings.CHAT_CONTEXT_TOKEN_BUDGET)
+    # A faixa do modelo é escolhida depois do contexto: reservar o maior limite de resposta
+    completion_tokens = max([MAX_COMPLETION_TOKENS] + list(settings.AI_TIER_MAX_TOKENS.values()))
+    return max(0, min(settings.CHAT_CONTEXT_TOKEN_BUDGET, window - completion_tokens))
+
+
+class SummaryCache:
+    """Cache LRU em memória dos resumos por sessão: session_id -> (resumo, summary_until)"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, datetime]]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[Tuple[str, datetime]]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self._entries.move_to_end(session_id)
+        return entry
+
+    def set(self, session_id: str, summary: str, summary_until: datetime):
+        self._entries[session_id] = (summary, summary_until)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+
+summary_cache = SummaryCache()
+
+
+class ChatContext:
+    """Resultado da montagem do contexto de um turno"""
+
+    def __init__(self, messages: List[Dict[str, str]], tokens: int, window_start: Optional[datetime], overflow: bool):
+        self.messages = messages
+        self.tokens = tokens
+        # created_at da mensagem mais antiga incluída na janela
+        self.window_start = window_start
+        # Há mensagens antigas fora da janela que ainda não estão no resumo
+        self.overflow = overflow
+
+
+class ChatContextBuilder:
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or settings.CHAT_CONTEXT_BATCH_SIZE
+
+    def build(
+        self,
+        db: Session,
+        chat_session: ChatSessionModel,
+        user_message: str,
+        provider: AIProvider,
+        exclude_message_id: Optional[str] = None
+    ) -> ChatContext:
+        """
+        Montar o histórico que acompanha a mensagem do usuário.
+
+        Args:
+            db: Sessão do banco de dados
+            chat_session: Sessão de chat
+            user_message: Mensagem atual (já contabilizada no orçamento)
+            provider: Provedor de IA, usado para escolher o orçamento do modelo
+            exclude_message_id: Mensagem a ignorar (a mensagem atual, se já foi salva)
+
+        Returns:
+            Um ChatContext com as mensagens em ordem cronológica
+        """
+        budget = context_budget(DEFAULT_MODELS[provider]) - estimate_tokens(user_message)
+
+        summary, summary_until = self._get_summary(chat_session)
+        prefix = []
+        if summary:
+            # Vai junto do sistema prompt padrão, que o provedor só adiciona quando não há um
+            prefix.append({
+                "role": "system",
+                "content": f"{SYSTEM_PROMPT}\n\nResumo da conversa até aqui:\n{summary}"
+            })
+            budget -= estimate_tokens(prefix[0]["content"])
+
+        window: List[ChatMessageModel] = []
+        used = 0
+        overflow = False
+        before: Optional[datetime] = None
+
+        # Carregar do mais recente para o mais antigo, um lote por vez, até encher o orçamento
+        while True:
+            query = db.query(ChatMessageModel).filter(
+                ChatMessageModel.session_id == chat_session.id,
+                ChatMessageModel.role.in_(("user", "assistant"))
+            )
+            if exclude_message_id:
+                query = query.filter(ChatMessageModel.id != exclude_message_id)
+            if summary_until is not None:
+                query = query.filter(ChatMessageModel.created_at > summary_until)
+            if before is not None:
+                query = query.filter(ChatMessageModel.created_at < before)
+
+            batch = query.order_by(ChatMessageModel.created_at.desc()).limit(self.batch_size).all()
+
+            for message in batch:
+                cost = estimate_tokens(message.content)
+                if used + cost > budget:
+                    overflow = True
+                    break
+                window.append(message)
+                used += cost
+
+            if overflow or len(batch) < self.batch_size:
+                break
+            before = batch[-1].created_at
+
+        window.reverse()
+        messages = prefix + [{"role": m.role, "content": m.content} for m in window]
+        window_start = window[0].created_at if window else None
+
+        return ChatContext(messages=messages, tokens=used, window_start=window_start, overflow=overflow)
+
+    def _get_summary(self, chat_session: ChatSessionModel) -> Tuple[Optional[str], Optional[datetime]]:
+        cached = summary_cache.get(chat_session.id)
+        if cached is not None:
+            return cached
+        if chat_session.summary:
+            summary_cache.set(chat_session.id, chat_session.summary, chat_session.summary_until)
+        return chat_session.summary, chat_session.summary_until
+
+
+context_builder = ChatContextBuilder()
+
+# Sessões com atualização de resumo em andamento
+_refreshing = set()
+# Referências às tasks de resumo: o event loop só guarda referências fracas
+_refresh_tasks = set()
+
+
+def schedule_summary_refresh(session_id: str, context: ChatContext, provider: AIProvider):
+    """Agendar a atualização do resumo quando houver mensagens fora da janela"""
+    if not context.overflow or context.window_start is None or session_id in _refreshing:
+        return
+    _refreshing.add(session_id)
+    task = asyncio.create_task(refresh_summary(session_id, context.window_start, provider))
+    _refresh_tasks.add(task)
+
+    def done(finished: asyncio.Task):
+        _refresh_tasks.discard(finished)
+        _refreshing.discard(session_id)
+
+    task.add_done_callback(done)
+
+
+async def refresh_summary(session_id: str, window_start: datetime, provider: AIProvider):
+    """
+    Incorporar ao resumo da sessão as mensagens mais antigas que a janela atual.
+
+    Cada atualização processa no máximo CHAT_SUMMARY_BATCH_SIZE mensagens; sessões
+    longas são alcançadas ao longo dos turnos seguintes.
+
+    A chamada ao provedor segue o caminho das mensagens do usuário: reserva de
+    créditos, controle de admissão e cobrança do consumo real. Nenhuma conexão
+    do pool fica presa durante a chamada: as mensagens são lidas em uma sessão
+    curta e o resumo é gravado em outra.
+    """
+    db = SessionLocal()
+    try:
+        chat_session = db.query(ChatSessionModel).filter(ChatSessionModel.id == session_id).first()
+        if not chat_session:
+            return
+        user_id = chat_session.user_id
+        previous_until = chat_session.summary_until
+
+        query = db.query(ChatMessageModel).filter(
+            ChatMessageModel.session_id == session_id,
+            ChatMessageModel.role.in_(("user", "assistant")),
+            ChatMessageModel.created_at < window_start
+        )
+        if previous_until is not None:
+            query = query.filter(ChatMessageModel.created_at > previous_until)
+        pending = query.order_by(ChatMessageModel.created_at.asc()).limit(settings.CHAT_SUMMARY_BATCH_SIZE).all()
+        if not pending:
+            return
+
+        transcript = "\n\n".join(
+            f"{'Usuário' if m.role == 'user' else 'Assistente'}: {m.content}" for m in pending
+        )
+        prompt = f"Resumo atual:\n{chat_session.summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"
+        summary_until = pending[-1].created_at
+        plan = db.query(User.plan).filter(User.id == user_id).scalar()
+    except Exception as e:
+        logger.error(f"Error loading messages to summarize for session {session_id}: {str(e)}")
+        return
+    finally:
+        db.close()
+
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    reservation = None
+    try:
+        reservation = credit_ledger.reserve_tokens(user_id, estimate_call_tokens(messages, MAX_COMPLETION_TOKENS))
+        async with admission_controller.slot(user_id, plan):
+            summary, tokens_used = await ai_manager.complete_chat(
+                messages=messages,
+                provider=provider,
+                max_tokens=reservation.max_tokens
+            )
+        summary = summary.strip()
+
+        db = SessionLocal()
+        try:
+            # Só grava se nenhum outro worker avançou o resumo enquanto o provedor respondia
+            query = db.query(ChatSessionModel).filter(ChatSessionModel.id == session_id)
+            if previous_until is None:
+                query = query.filter(ChatSessionModel.summary_until.is_(None))
+            else:
+                query = query.filter(ChatSessionModel.summary_until == previous_until)
+            updated = 0
+            if summary:
+                updated = query.update(
+                    {ChatSessionModel.summary: summary, ChatSessionModel.summary_until: summary_until},
+                    synchronize_session=False
+                )
+            # O provedor já consumiu os tokens: cobrar mesmo se o resumo não for gravado
+            credit_ledger.settle(
+                db, reservation, credits_for_tokens(tokens_used) if tokens_used > 0 else 0, "summary", session_id
+            )
+            db.commit()
+            reservation = None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if updated:
+            summary_cache.set(session_id, summary, summary_until)
+    except (InsufficientCredits, AdmissionRejected) as e:
+        # O resumo fica para um próximo turno
+        logger.info(f"Summary refresh for session {session_id} skipped: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error refreshing summary for session {session_id}: {str(e)}")
+    finally:
+        if reservation is not None:
+            credit_ledger.release(reservation)
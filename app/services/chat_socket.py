@@ -0,0 +1,210 @@
+"""
+Canal de chat por WebSocket.
+
+A conexão é autenticada uma única vez (ver o endpoint `/chat/ws/{session_id}`)
+e fica associada a uma sessão de chat: cada turno reaproveita o usuário, o
+plano e a sessão já validados, sem repetir a decodificação do JWT nem as
+consultas de usuário e sessão. Nenhuma conexão do pool fica presa à conexão
+WebSocket: o contexto de cada turno é montado em uma sessão de banco curta.
+
+Protocolo (mensagens JSON):
+
+    cliente -> servidor
+        {"type": "message", "message": "...", "provider": "deepseek", "bypass_cache": false}
+        {"type": "cancel"}
+        {"type": "ping"}
+
+    servidor -> cliente
+        {"type": "ready", "session_id": "..."}
+        {"type": "delta", "content": "...", "done": false}
+        {"type": "done", "content": "", "done": true, "tokens_used": 120, "provider": "deepseek"}
+        {"type": "cancelled", "done": true}
+        {"type": "error", "error": "...", "done": true}
+        {"type": "pong"}
+
+Recepção e envio correm em paralelo: um `cancel` é atendido mesmo no meio de
+uma resposta, abortando a requisição ao provedor; a parte já gerada é gravada
+e só os tokens gerados são cobrados (o mesmo vale para uma desconexão). No
+máximo `CHAT_WS_SEND_QUEUE_SIZE` trechos ficam aguardando envio; com a janela
+cheia (cliente lento), a leitura do provedor pausa.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.core.admission import admission_controller, AdmissionRejected
+from app.core.ai_providers import ai_manager, AIProvider
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.chat_session import ChatSession as ChatSessionModel
+from app.services.chat_context import context_builder, schedule_summary_refresh
+from app.services.chat_stream import save_partial_turn
+from app.services.chat_turn import ChatTurn
+from app.services.credit_ledger import InsufficientCredits
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSocket:
+    """Uma conexão WebSocket de chat, já autenticada e associada a uma sessão"""
+
+    def __init__(self, websocket: WebSocket, session_id: str, user_id: str, plan: Optional[str]):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.user_id = user_id
+        self.plan = plan
+        # Eventos de controle não passam pela janela: nunca ficam atrás dos trechos
+        self.outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.window = asyncio.Semaphore(settings.CHAT_WS_SEND_QUEUE_SIZE)
+        self.turn_task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        """Atender a conexão até o cliente desconectar"""
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            self._send_control({"type": "ready", "session_id": self.session_id})
+            while True:
+                raw = await self.websocket.receive_text()
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    self._send_error("Mensagem inválida: esperado um objeto JSON")
+                    continue
+                await self._handle(data)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self._cancel_turn()
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _handle(self, data: Dict[str, Any]):
+        kind = data.get("type")
+        if kind == "message":
+            self._start_turn(data)
+        elif kind == "cancel":
+            await self._cancel_turn()
+        elif kind == "ping":
+            self._send_control({"type": "pong"})
+        else:
+            self._send_error(f"Tipo de mensagem desconhecido: {kind}")
+
+    def _start_turn(self, data: Dict[str, Any]):
+        if self.turn_task is not None and not self.turn_task.done():
+            self._send_error("A mensagem anterior ainda está sendo respondida")
+            return
+
+        message = data.get("message")
+        if not isinstance(message, str) or not message.strip():
+            self._send_error("Mensagem vazia")
+            return
+        if len(message) > settings.CHAT_WS_MAX_MESSAGE_CHARS:
+            self._send_error("Mensagem muito longa")
+            return
+        try:
+            provider = AIProvider(data.get("provider") or AIProvider.DEEPSEEK.value)
+        except ValueError:
+            self._send_error(f"Provedor inválido: {data.get('provider')}")
+            return
+
+        self.turn_task = asyncio.create_task(
+            self._turn(message, provider, bool(data.get("bypass_cache", False)))
+        )
+
+    async def _cancel_turn(self):
+        task = self.turn_task
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _turn(self, message: str, provider: AIProvider, bypass_cache: bool):
+        ticket = None
+        turn = None
+        ai_stream = None
+        saved = False
+        deadline = time.monotonic() + settings.AI_REQUEST_DEADLINE_SECONDS
+        try:
+            db = SessionLocal()
+            try:
+                chat_session = db.get(ChatSessionModel, self.session_id)
+                if chat_session is None:
+                    self._send_error("Chat session not found")
+                    return
+                context = context_builder.build(db, chat_session, message, provider)
+            finally:
+                db.close()
+
+            # O turno inteiro (mensagens, sessão, créditos) é gravado em uma transação no final
+            turn = ChatTurn(self.session_id, self.user_id, message)
+            max_tokens = turn.reserve_credits(provider.value, context.messages)
+            ticket = await admission_controller.acquire(self.user_id, self.plan)
+
+            ai_stream = ai_manager.stream_response(
+                user_message=message,
+                session_id=self.session_id,
+                provider=provider,
+                history=context.messages,
+                use_cache=not bypass_cache,
+                deadline=deadline,
+                max_tokens=max_tokens
+            )
+            async for delta in ai_stream:
+                await self._send_delta({"type": "delta", "content": delta, "done": False})
+
+            turn.commit_in_new_session(ai_stream.message, ai_stream.tokens_used, ai_stream.provider.value)
+            saved = True
+            schedule_summary_refresh(self.session_id, context, provider)
+
+            self._send_control({
+                "type": "done",
+                "content": "",
+                "done": True,
+                "tokens_used": ai_stream.tokens_used,
+                "provider": ai_stream.provider.value
+            })
+        except asyncio.CancelledError:
+            if ai_stream is not None and not saved:
+                # Cancelado esperando a janela de envio: a requisição ao provedor ainda está aberta
+                await ai_stream.aclose()
+                save_partial_turn(turn, ai_stream)
+            self._send_control({"type": "cancelled", "done": True})
+            raise
+        except InsufficientCredits:
+            self._send_error("Créditos insuficientes")
+        except AdmissionRejected as e:
+            self._send_error(str(e))
+        except Exception as e:
+            logger.exception(f"Error streaming AI response over WebSocket: {str(e)}")
+            self._send_error(f"Error processing message: {str(e)}")
+        finally:
+            if ticket is not None:
+                admission_controller.release(ticket)
+            if turn is not None:
+                # Sem efeito depois que o turno (ou a parte já gerada) foi gravado
+                turn.release_credits()
+
+    async def _send_delta(self, event: Dict[str, Any]):
+        # Bloqueia enquanto a janela de envio estiver cheia (contrapressão)
+        await self.window.acquire()
+        self.outbox.put_nowait(event)
+
+    def _send_control(self, event: Dict[str, Any]):
+        self.outbox.put_nowait(event)
+
+    def _send_error(self, error: str):
+        self._send_control({"type": "error", "error": error, "done": True})
+
+    async def _send_loop(self):
+        while True:
+            event = await self.outbox.get()
+            try:
+                await self.websocket.send_json(event)
+            finally:
+                if event["type"] == "delta":
+                    self.window.release()
@@ -0,0 +1,97 @@
+"""
+Streaming de respostas do chat para clientes que podem desconectar no meio.
+
+A conexão SSE acompanha os eventos de um stream retomável (ver
+app.services.stream_replay) e é observada em paralelo: quando o cliente
+desconecta (ex.: fechou a aba ou perdeu o sinal), a conexão é liberada na
+hora. Se ele não reconectar dentro do prazo de tolerância, a requisição ao
+provedor é abortada; a parte já gerada é gravada como resposta do turno e
+apenas os tokens efetivamente gerados são cobrados (ver
+AIResponseStream.partial_tokens_used).
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+
+from starlette.requests import Request
+
+from app.core.ai_providers import AIResponseStream
+from app.services.chat_turn import ChatTurn
+from app.services.stream_replay import ReplayStream, ResumeUnavailable, format_event_id
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """O cliente desconectou antes do fim da resposta"""
+
+
+async def wait_for_disconnect(request: Request):
+    """Retornar quando o cliente HTTP desconectar (o corpo da requisição já foi lido)"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def stream_until_disconnect(chunks: AsyncIterator[Any], request: Request) -> AsyncIterator[Any]:
+    """
+    Repassar os itens de `chunks` enquanto o cliente estiver conectado.
+
+    Raises:
+        ClientDisconnected: se o cliente desconectar; a leitura de `chunks` já foi encerrada
+    """
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    next_chunk = None
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                raise ClientDisconnected()
+            try:
+                item = next_chunk.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        disconnect.cancel()
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        else:
+            # Consumidor parou entre dois itens: fechar o iterador explicitamente
+            await chunks.aclose()
+
+
+def sse_event(data: Dict[str, Any], event_id: str = None) -> str:
+    """Formatar um evento SSE (com `id:` quando o stream é retomável)"""
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def sse_replay(stream: ReplayStream, after: int, request: Request) -> AsyncIterator[str]:
+    """Eventos SSE de `stream` a partir do seq `after`, até o fim ou a desconexão do cliente"""
+    events = stream_until_disconnect(stream.follow(after), request)
+    try:
+        async for seq, data in events:
+            yield sse_event(data, format_event_id(stream.stream_id, seq))
+    except ClientDisconnected:
+        pass
+    except ResumeUnavailable as e:
+        logger.warning(str(e))
+        yield sse_event({"error": "Stream cannot be resumed; reload the chat session", "done": True})
+    finally:
+        # Fechado pelo servidor enquanto esperava para enviar: deixar de acompanhar o stream já
+        await events.aclose()
+
+
+def save_partial_turn(turn: ChatTurn, ai_stream: AIResponseStream):
+    """Gravar a parte já gerada de uma resposta interrompida, cobrando só os tokens gerados"""
+    if not ai_stream.message:
+        return
+    try:
+        turn.commit_in_new_session(ai_stream.message, ai_stream.partial_tokens_used(), ai_stream.provider.value)
+    except Exception as e:
+        logger.error(f"Error saving partial answer for session {turn.session_id}: {str(e)}")
@@ -0,0 +1,151 @@
+"""
+Unidade de trabalho de um turno de chat.
+
+A mensagem do usuário, a resposta do assistente, a atualização da sessão
+(título no primeiro turno, `updated_at`, `last_message_at`) e o acerto de
+créditos são gravados em uma única transação, depois que a resposta do
+provedor chega. Os créditos são reservados antes da chamada ao provedor (ver
+app.services.credit_ledger). O total de tokens em `usage` é contabilizado
+pelo agregador de escrita adiada (ver app.services.usage_aggregator).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy.orm import Session
+
+from app.core.model_tiering import select_model
+from app.db.session import SessionLocal
+from app.models.chat_message import ChatMessage as ChatMessageModel
+from app.models.chat_session import ChatSession as ChatSessionModel
+from app.core.token_estimator import estimate_tokens
+from app.services.credit_ledger import CreditReservation, credit_ledger, credits_for_tokens
+from app.services.usage_aggregator import usage_aggregator
+
+TITLE_LENGTH = 30
+PREVIEW_LENGTH = 200
+
+
+def message_preview(content: str) -> str:
+    """Trecho da última mensagem exibido na listagem de sessões"""
+    preview = " ".join((content or "").split())
+    if len(preview) > PREVIEW_LENGTH:
+        preview = preview[:PREVIEW_LENGTH - 3] + "..."
+    return preview
+
+
+def title_from_message(message: str) -> str:
+    """Título da sessão a partir dos primeiros caracteres da primeira mensagem"""
+    title = message[:TITLE_LENGTH]
+    if len(message) > TITLE_LENGTH:
+        title += "..."
+    return title
+
+
+class ChatTurn:
+    """
+    Um turno (mensagem do usuário + resposta) ainda não gravado.
+
+    Guarda apenas ids, não objetos de uma sessão do banco: o streaming grava o
+    turno em uma sessão nova, aberta só no final (ver commit_in_new_session).
+    """
+
+    def __init__(self, session_id: str, user_id: str, content: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        # created_at definido na chegada: as duas mensagens são gravadas juntas no final
+        self.user_message = ChatMessageModel(
+            id=str(uuid4()),
+            session_id=session_id,
+            content=content,
+            role="user",
+            tokens_used=0,
+            created_at=datetime.utcnow()
+        )
+        self.assistant_message = None
+        self.reservation: Optional[CreditReservation] = None
+
+    def reserve_credits(self, provider: str, history: List[Dict[str, str]]) -> int:
+        """
+        Reservar o custo máximo do turno antes de chamar o provedor.
+
+        Returns:
+            O limite de resposta coberto pela reserva (pode ser menor que o da faixa)
+
+        Raises:
+            InsufficientCredits: se o saldo não cobrir nem o prompt com a resposta mínima
+        """
+        selection = select_model(provider, self.user_message.content, history)
+        messages = history + [{"role": "user", "content": self.user_message.content}]
+        self.reservation = credit_ledger.reserve_tokens(self.user_id, estimate_tokens(messages, selection.max_tokens))
+        return self.reservation.max_tokens
+
+    def release_credits(self):
+        """Devolver a reserva se o turno não foi gravado (sem efeito depois do commit)"""
+        if self.reservation is not None:
+            credit_ledger.release(self.reservation)
+            self.reservation = None
+
+    def commit(self, db: Session, content: str, tokens_used: int, provider: str) -> ChatMessageModel:
+        """
+        Gravar o turno em uma única transação.
+
+        Args:
+            db: Sessão do banco de dados
+            content: Resposta do assistente
+            tokens_used: Tokens consumidos pela resposta
+            provider: Provedor que respondeu
+
+        Returns:
+            A mensagem do assistente gravada
+        """
+        # Na sessão da requisição o objeto já está no identity map e não há nova query
+        chat_session = db.get(ChatSessionModel, self.session_id)
+
+        now = datetime.utcnow()
+        self.assistant_message = ChatMessageModel(
+            id=str(uuid4()),
+            session_id=self.session_id,
+            content=content,
+            role="assistant",
+            tokens_used=tokens_used,
+            provider=provider,
+            created_at=now
+        )
+        db.add(self.user_message)
+        db.add(self.assistant_message)
+
+        # Primeiro turno da sessão: título a partir da mensagem do usuário
+        if chat_session.last_message_at is None:
+            chat_session.title = title_from_message(self.user_message.content)
+        chat_session.updated_at = now
+        chat_session.last_message_at = now
+        # Incrementos no próprio UPDATE: turnos simultâneos na mesma sessão não se sobrescrevem
+        chat_session.message_count = ChatSessionModel.message_count + 2
+        chat_session.total_tokens = ChatSessionModel.total_tokens + tokens_used
+        chat_session.last_message_preview = message_preview(content)
+
+        # Respostas do cache (0 tokens) não consomem créditos
+        credits_used = credits_for_tokens(tokens_used) if tokens_used > 0 else 0
+        if self.reservation is not None:
+            credit_ledger.settle(db, self.reservation, credits_used, "chat", self.assistant_message.id)
+        else:
+            credit_ledger.charge(db, self.user_id, credits_used, "chat", self.assistant_message.id)
+
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        self.reservation = None
+        usage_aggregator.add(self.user_id, tokens_used)
+        return self.assistant_message
+
+    def commit_in_new_session(self, content: str, tokens_used: int, provider: str) -> ChatMessageModel:
+        """Gravar o turno em uma sessão de banco aberta e fechada só para isso"""
+        db = SessionLocal()
+        try:
+            return self.commit(db, content, tokens_used, provider)
+        finally:
+            db.close()
@@ -0,0 +1,225 @@
+"""
+Créditos dos usuários: razão (ledger) só de inserções + saldo em cache.
+
+Cada movimentação (cadastro, compra, reserva, consumo) é uma linha em
+`credit_ledger`. O saldo corrente fica desnormalizado em `users.token_credits`
+e só muda por UPDATEs atômicos, na mesma transação da linha do ledger; o
+débito é condicional:
+
+    UPDATE users SET token_credits = token_credits - :valor
+    WHERE id = :usuario AND token_credits >= :valor
+
+Não há leitura seguida de escrita em Python: requisições simultâneas não
+perdem atualizações e a verificação de saldo é a própria instrução, pela
+chave primária.
+
+Chamadas de IA, cujo custo só é conhecido no fim, reservam antes o custo
+máximo (prompt contado + limite da resposta, ver app.core.token_estimator) em
+uma transação curta própria e acertam a diferença junto com a gravação do
+resultado: `reserve_tokens` -> `settle` (ou `release`, se nada for gravado).
+Sem saldo para o custo máximo, o limite da resposta é reduzido ao que o saldo
+cobre; sem saldo nem para isso, a chamada ao provedor nem é feita.
+"""
+import logging
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.token_estimator import TokenEstimate
+from app.db.session import SessionLocal
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Taxa de conversão: quantos tokens equivalem a 1 crédito
+TOKENS_PER_CREDIT = 20
+
+users = User.__table__
+
+
+def credits_for_tokens(tokens_used: int) -> int:
+    """Créditos consumidos por um número de tokens (mínimo de 1 crédito)"""
+    return max(1, int(tokens_used / TOKENS_PER_CREDIT))
+
+
+class InsufficientCredits(Exception):
+    """Saldo menor que o valor a debitar ou reservar"""
+
+
+class CreditReservation:
+    """Créditos já debitados do saldo, aguardando o acerto com o consumo real"""
+
+    def __init__(self, user_id: str, amount: int, max_tokens: Optional[int] = None):
+        self.id = str(uuid4())
+        self.user_id = user_id
+        self.amount = amount
+        # Limite de resposta coberto pela reserva (ver CreditLedger.reserve_tokens)
+        self.max_tokens = max_tokens
+
+
+class CreditLedger:
+    def _try_debit(self, db: Session, user_id: str, amount: int) -> bool:
+        result = db.execute(
+            users.update()
+            .where(users.c.id == user_id, users.c.token_credits >= amount)
+            .values(token_credits=users.c.token_credits - amount)
+        )
+        return result.rowcount == 1
+
+    def _increment(self, db: Session, user_id: str, amount: int):
+        db.execute(
+            users.update()
+            .where(users.c.id == user_id)
+            .values(token_credits=users.c.token_credits + amount)
+        )
+
+    def _record(self, db: Session, user_id: str, amount: int, kind: str, reference: Optional[str]):
+        db.add(CreditLedgerEntry(user_id=user_id, amount=amount, kind=kind, reference=reference))
+
+    def credit(self, db: Session, user_id: str, amount: int, kind: str, reference: Optional[str] = None):
+        """Adicionar créditos (não faz commit)"""
+        if amount <= 0:
+            return
+        self._increment(db, user_id, amount)
+        self._record(db, user_id, amount, kind, reference)
+
+    def debit(self, db: Session, user_id: str, amount: int, kind: str, reference: Optional[str] = None):
+        """
+        Debitar créditos se houver saldo (não faz commit).
+
+        Raises:
+            InsufficientCredits: se o saldo for menor que `amount`
+        """
+        if amount <= 0:
+            return
+        if not self._try_debit(db, user_id, amount):
+            raise InsufficientCredits(f"Saldo insuficiente para debitar {amount} créditos")
+        self._record(db, user_id, -amount, kind, reference)
+
+    def charge(self, db: Session, user_id: str, amount: int, kind: str, reference: Optional[str] = None) -> int:
+        """
+        Cobrar por algo já entregue: debita `amount` ou, sem saldo, o que houver (não faz commit).
+
+        Returns:
+            Os créditos efetivamente debitados
+        """
+        if amount <= 0:
+            return 0
+        charged = amount
+        if not self._try_debit(db, user_id, amount):
+            # Caminho raro: saldo menor que o consumo; debitar o restante do saldo
+            balance = db.execute(select(users.c.token_credits).where(users.c.id == user_id)).scalar() or 0
+            charged = min(balance, amount)
+            if charged <= 0 or not self._try_debit(db, user_id, charged):
+                charged = 0
+            logger.warning(f"User {user_id} charged {charged} of {amount} credits for {kind}: insufficient balance")
+        if charged:
+            self._record(db, user_id, -charged, kind, reference)
+        return charged
+
+    def reserve(self, user_id: str, amount: int) -> CreditReservation:
+        """
+        Reservar créditos em uma transação própria, antes da chamada ao provedor.
+
+        Raises:
+            InsufficientCredits: se o saldo for menor que `amount`
+        """
+        reservation = CreditReservation(user_id, max(0, amount))
+        db = SessionLocal()
+        try:
+            self.debit(db, user_id, reservation.amount, "reserve", reservation.id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return reservation
+
+    def reserve_tokens(self, user_id: str, estimate: TokenEstimate) -> CreditReservation:
+        """
+        Reservar o custo máximo de uma chamada ao provedor.
+
+        Se o saldo não cobrir o custo máximo, `reservation.max_tokens` é reduzido
+        ao limite de resposta que o saldo cobre, desde que sobrem ao menos
+        `AI_MIN_COMPLETION_TOKENS`.
+
+        Raises:
+            InsufficientCredits: se o saldo não cobrir o prompt com a resposta mínima
+        """
+        try:
+            reservation = self.reserve(user_id, credits_for_tokens(estimate.max_total))
+            reservation.max_tokens = estimate.max_tokens
+            return reservation
+        except InsufficientCredits:
+            pass
+        max_tokens = min(estimate.max_tokens, self.balance(user_id) * TOKENS_PER_CREDIT - estimate.prompt_tokens)
+        if max_tokens < settings.AI_MIN_COMPLETION_TOKENS:
+            raise InsufficientCredits(f"Saldo insuficiente para um prompt de {estimate.prompt_tokens} tokens")
+        reservation = self.reserve(user_id, credits_for_tokens(estimate.prompt_tokens + max_tokens))
+        reservation.max_tokens = max_tokens
+        return reservation
+
+    def balance(self, user_id: str) -> int:
+        """Saldo atual, lido em uma sessão própria"""
+        db = SessionLocal()
+        try:
+            return db.execute(select(users.c.token_credits).where(users.c.id == user_id)).scalar() or 0
+        finally:
+            db.close()
+
+    def settle(
+        self,
+        db: Session,
+        reservation: CreditReservation,
+        amount: int,
+        kind: str,
+        reference: Optional[str] = None
+    ) -> int:
+        """
+        Acertar uma reserva com o consumo real, na transação de quem grava o resultado (não faz commit).
+
+        Depois do commit, a reserva está encerrada e não deve ser liberada.
+
+        Returns:
+            Os créditos efetivamente cobrados
+        """
+        reserved = reservation.amount
+        if reserved:
+            self._record(db, reservation.user_id, reserved, "release", reservation.id)
+        if amount <= reserved:
+            # Devolver a sobra da reserva em um único UPDATE
+            if reserved > amount:
+                self._increment(db, reservation.user_id, reserved - amount)
+            if amount:
+                self._record(db, reservation.user_id, -amount, kind, reference)
+            charged = amount
+        else:
+            # Consumo acima da estimativa: a reserva cobre parte, o excedente é cobrado do saldo
+            extra = self.charge(db, reservation.user_id, amount - reserved, kind, reference)
+            if reserved:
+                self._record(db, reservation.user_id, -reserved, kind, reference)
+            charged = reserved + extra
+        return charged
+
+    def release(self, reservation: CreditReservation):
+        """Devolver uma reserva não utilizada, em uma transação própria"""
+        if not reservation.amount:
+            return
+        db = SessionLocal()
+        try:
+            self.credit(db, reservation.user_id, reservation.amount, "release", reservation.id)
+            db.commit()
+            reservation.amount = 0
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error releasing credit reservation {reservation.id}: {str(e)}")
+        finally:
+            db.close()
+
+
+credit_ledger = CreditLedger()
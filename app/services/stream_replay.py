@@ -0,0 +1,201 @@
+"""
+Streams de chat retomáveis (SSE com `Last-Event-ID`).
+
+A geração da resposta roda em uma task própria (produtor), desacoplada da
+conexão do cliente: cada trecho vira um evento numerado, guardado em um buffer
+limitado por stream. A conexão SSE apenas acompanha o buffer. O id de cada
+evento é `<stream_id>:<seq>`; um cliente que reconecta enviando o último id
+recebido no header `Last-Event-ID` continua de onde parou, sem nova chamada ao
+provedor (e sem nova cobrança).
+
+Sem nenhum cliente conectado, o produtor continua por até
+`CHAT_STREAM_RESUME_GRACE_SECONDS`; se ninguém reconectar nesse prazo, a
+requisição ao provedor é abortada. Streams encerrados ficam disponíveis por
+`CHAT_STREAM_REPLAY_TTL_SECONDS`. O registro é em memória, por processo: a
+reconexão precisa chegar ao mesmo worker (ou falha com 410 e o cliente
+recarrega a sessão, onde o turno já está gravado).
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import uuid4
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResumeUnavailable(Exception):
+    """Os eventos pedidos já saíram do buffer do stream"""
+
+
+def format_event_id(stream_id: str, seq: int) -> str:
+    return f"{stream_id}:{seq}"
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """(stream_id, seq) de um `Last-Event-ID`; None se o formato for inválido"""
+    stream_id, _, seq = (event_id or "").strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ReplayStream:
+    """Eventos de uma resposta em andamento (ou recém-encerrada) e quem a acompanha"""
+
+    def __init__(self, stream_id: str, user_id: str, max_events: int, grace_seconds: float):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.grace_seconds = grace_seconds
+        # (seq, dados) dos eventos mais recentes; os mais antigos saem quando o buffer enche
+        self.events: "deque[Tuple[int, Dict[str, Any]]]" = deque(maxlen=max_events)
+        self.last_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.producer: Optional[asyncio.Task] = None
+        self.listeners = 0
+        self._changed = asyncio.Event()
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def first_seq(self) -> int:
+        return self.events[0][0] if self.events else self.last_seq + 1
+
+    def can_resume(self, after: int) -> bool:
+        return self.first_seq - 1 <= after <= self.last_seq
+
+    def append(self, data: Dict[str, Any]):
+        self.last_seq += 1
+        self.events.append((self.last_seq, data))
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._cancel_abandon()
+        self._notify()
+
+    def _notify(self):
+        # Acorda quem espera no evento atual; as próximas esperas usam um novo
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Produzir os eventos com seq > `after`, em ordem, até o fim do stream.
+
+        Raises:
+            ResumeUnavailable: se algum evento pedido já saiu do buffer
+        """
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                if after < self.first_seq - 1:
+                    raise ResumeUnavailable(f"Stream {self.stream_id}: evento {after + 1} não está mais no buffer")
+                start = after - self.first_seq + 1
+                for seq, data in list(itertools.islice(self.events, start, None)):
+                    yield seq, data
+                    after = seq
+                if self.done and after >= self.last_seq:
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.listeners += 1
+        self._cancel_abandon()
+
+    def _detach(self):
+        self.listeners -= 1
+        if self.listeners == 0 and not self.done:
+            # Ninguém acompanhando: dar um prazo para o cliente reconectar antes de abortar
+            self._abandon_handle = asyncio.get_running_loop().call_later(self.grace_seconds, self._abandon)
+
+    def _cancel_abandon(self):
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+
+    def _abandon(self):
+        self._abandon_handle = None
+        if self.listeners == 0 and not self.done and self.producer is not None:
+            logger.info(f"No client reconnected to stream {self.stream_id}; aborting generation")
+            self.producer.cancel()
+
+
+class StreamRegistry:
+    """Streams retomáveis do processo, por id"""
+
+    def __init__(
+        self,
+        max_streams: int = None,
+        max_events: int = None,
+        ttl_seconds: float = None,
+        grace_seconds: float = None
+    ):
+        self.max_streams = max_streams or settings.CHAT_STREAM_REPLAY_MAX_STREAMS
+        self.max_events = max_events or settings.CHAT_STREAM_REPLAY_MAX_EVENTS
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.CHAT_STREAM_REPLAY_TTL_SECONDS
+        self.grace_seconds = grace_seconds if grace_seconds is not None else settings.CHAT_STREAM_RESUME_GRACE_SECONDS
+        self._streams: "OrderedDict[str, ReplayStream]" = OrderedDict()
+        self.started = 0
+        self.resumed = 0
+        self.abandoned = 0
+
+    def start(self, user_id: str, produce: Callable[[ReplayStream], Awaitable[None]]) -> ReplayStream:
+        """Registrar um stream e iniciar o produtor `produce(stream)`, que publica os eventos com append()"""
+        self._prune()
+        stream = ReplayStream(uuid4().hex, user_id, self.max_events, self.grace_seconds)
+        self._streams[stream.stream_id] = stream
+        stream.producer = asyncio.create_task(self._run(stream, produce))
+        self.started += 1
+        return stream
+
+    async def _run(self, stream: ReplayStream, produce: Callable[[ReplayStream], Awaitable[None]]):
+        try:
+            await produce(stream)
+        except asyncio.CancelledError:
+            self.abandoned += 1
+        except Exception as e:
+            logger.error(f"Stream {stream.stream_id} producer failed: {str(e)}")
+        finally:
+            stream.finish()
+
+    def get(self, stream_id: str, user_id: str) -> Optional[ReplayStream]:
+        """Stream ainda disponível para retomada pelo mesmo usuário"""
+        self._prune()
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id:
+            return None
+        self.resumed += 1
+        return stream
+
+    def _prune(self):
+        now = time.monotonic()
+        for stream_id in [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.done and now - stream.finished_at > self.ttl_seconds
+        ]:
+            del self._streams[stream_id]
+        # Acima do limite: descartar os mais antigos (a geração em andamento continua, só não é mais retomável)
+        while len(self._streams) >= self.max_streams:
+            self._streams.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "streams": len(self._streams),
+            "live": sum(1 for stream in self._streams.values() if not stream.done),
+            "buffered_events": sum(len(stream.events) for stream in self._streams.values()),
+            "started": self.started,
+            "resumed": self.resumed,
+            "abandoned": self.abandoned,
+        }
+
+
+stream_registry = StreamRegistry()
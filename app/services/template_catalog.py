@@ -0,0 +1,226 @@
+"""
+Catálogo de templates em memória.
+
+O catálogo (árvore de categorias, metadados e variáveis de cada template) só
+muda quando `/documents/templates/import` roda, então as leituras são servidas
+de um snapshot em memória, montado com duas consultas e substituído por
+inteiro a cada nova versão. O texto dos templates não entra no snapshot: fica
+em um cache LRU limitado (`TEMPLATE_CATALOG_CONTENT_CACHE_SIZE`), carregado
+sob demanda.
+
+Versionamento: a importação chama `invalidate()`, que incrementa a versão e
+descarta o snapshot neste processo. Para os demais workers, a cada
+`TEMPLATE_CATALOG_CHECK_SECONDS` uma consulta agregada barata (quantidade e
+maior `updated_at`) compara a impressão digital da tabela com a do snapshot;
+se mudou, o catálogo é recarregado. O snapshot é aquecido no startup.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Template
+from app.utils.templates import extract_variables, load_variables
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateInfo:
+    """Metadados de um template no catálogo (sem o texto)"""
+
+    __slots__ = (
+        "id", "name", "category", "type", "description", "is_premium", "variables", "variable_metadata",
+        "sort_key", "list_item"
+    )
+
+    def __init__(self, id: str, name: str, category: str, type: str, description: Optional[str],
+                 is_premium: bool, variable_metadata: List[Dict[str, Any]]):
+        self.id = id
+        self.name = name
+        self.category = category
+        self.type = type
+        self.description = description
+        self.is_premium = is_premium
+        self.variable_metadata = variable_metadata
+        self.variables = [entry["name"] for entry in variable_metadata]
+        # Chave de ordenação da listagem (e do cursor de paginação): categoria, tipo, nome, id
+        self.sort_key = (category or "", type or "", name or "", id)
+        # Item de listagem no formato da API, montado uma vez por versão
+        self.list_item = {
+            "document_name": name,
+            "subfolder_1": category,
+            "subfolder_2": type,
+            "subfolder_3": None,
+            "id": id
+        }
+
+
+class CatalogSnapshot:
+    """Uma versão imutável do catálogo"""
+
+    def __init__(self, version: int, fingerprint: Tuple[Any, ...], templates: List[TemplateInfo]):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.loaded_at = time.monotonic()
+        # Ordem estável de listagem: categoria, tipo, nome, id
+        self.templates = sorted(templates, key=lambda t: t.sort_key)
+        self.by_id: Dict[str, TemplateInfo] = {t.id: t for t in self.templates}
+        self.by_name: Dict[str, TemplateInfo] = {}
+        # Listas por filtro, já ordenadas: o total de cada filtro é o tamanho da lista
+        self.by_category: Dict[str, List[TemplateInfo]] = {}
+        self.by_type: Dict[str, List[TemplateInfo]] = {}
+        self.by_category_type: Dict[Tuple[str, str], List[TemplateInfo]] = {}
+        for template in self.templates:
+            self.by_name.setdefault(template.name, template)
+            self.by_category.setdefault(template.category, []).append(template)
+            self.by_type.setdefault(template.type, []).append(template)
+            self.by_category_type.setdefault((template.category, template.type), []).append(template)
+        categories = [category for category in self.by_category if category]
+        self.categories = {
+            "categorias": categories,
+            "subcategorias": {
+                category: list(dict.fromkeys(t.type for t in self.by_category[category] if t.type))
+                for category in categories
+            }
+        }
+
+    def filter(self, category: Optional[str] = None, template_type: Optional[str] = None) -> List[TemplateInfo]:
+        """Templates de uma categoria e/ou tipo, na ordem de listagem"""
+        if category and template_type:
+            return self.by_category_type.get((category, template_type), [])
+        if category:
+            return self.by_category.get(category, [])
+        if template_type:
+            return self.by_type.get(template_type, [])
+        return self.templates
+
+
+def index_after(templates: List[TemplateInfo], sort_key: Tuple[str, ...]) -> int:
+    """Posição do primeiro template depois de `sort_key` em uma lista ordenada (busca binária)"""
+    low, high = 0, len(templates)
+    while low < high:
+        middle = (low + high) // 2
+        if templates[middle].sort_key <= sort_key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class TemplateCatalog:
+    def __init__(self, check_seconds: float = None, content_cache_size: int = None):
+        self.check_seconds = check_seconds if check_seconds is not None else settings.TEMPLATE_CATALOG_CHECK_SECONDS
+        self.content_cache_size = content_cache_size or settings.TEMPLATE_CATALOG_CONTENT_CACHE_SIZE
+        self.version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        # template_id -> texto, para a versão atual
+        self._contents: "OrderedDict[str, str]" = OrderedDict()
+        self.loads = 0
+        self.content_hits = 0
+        self.content_misses = 0
+
+    def _fingerprint(self, db: Session) -> Tuple[Any, ...]:
+        count, last_updated = db.query(func.count(Template.id), func.max(Template.updated_at)).one()
+        return count, last_updated
+
+    def _load(self, db: Session, fingerprint: Tuple[Any, ...]) -> CatalogSnapshot:
+        rows = db.query(
+            Template.id, Template.name, Template.category, Template.type,
+            Template.description, Template.is_premium, Template.variables
+        ).all()
+        templates = []
+        unparsed = []
+        for row in rows:
+            variables = load_variables(row.variables)
+            if variables is None:
+                unparsed.append(row.id)
+            templates.append((row, variables))
+        # Linhas ainda sem variáveis gravadas (antes do backfill): analisar o texto uma vez por versão
+        contents = {}
+        for start in range(0, len(unparsed), 500):
+            batch = unparsed[start:start + 500]
+            contents.update(db.query(Template.id, Template.content).filter(Template.id.in_(batch)).all())
+        if unparsed:
+            logger.warning(f"{len(unparsed)} templates without stored variables; run scripts/backfill_template_variables.py")
+        for index, (row, variables) in enumerate(templates):
+            if variables is None:
+                variables = extract_variables(contents.get(row.id))
+            templates[index] = TemplateInfo(
+                row.id, row.name, row.category, row.type, row.description, bool(row.is_premium), variables
+            )
+        self.loads += 1
+        return CatalogSnapshot(self.version, fingerprint, templates)
+
+    def snapshot(self, db: Session) -> CatalogSnapshot:
+        """Versão atual do catálogo; recarrega se a tabela mudou (verificado no máximo a cada `check_seconds`)"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.check_seconds:
+            return snapshot
+        fingerprint = self._fingerprint(db)
+        self._checked_at = now
+        if snapshot is None or snapshot.fingerprint != fingerprint:
+            if snapshot is not None:
+                # Alterado por outro worker
+                self.version += 1
+            self._contents.clear()
+            snapshot = self._snapshot = self._load(db, fingerprint)
+        return snapshot
+
+    def find(self, db: Session, template_id: str) -> Optional[TemplateInfo]:
+        """Template pelo id ou, se não houver, pelo nome"""
+        snapshot = self.snapshot(db)
+        return snapshot.by_id.get(template_id) or snapshot.by_name.get(template_id)
+
+    def content(self, db: Session, template: TemplateInfo) -> str:
+        """Texto de um template (cache LRU da versão atual)"""
+        content = self._contents.get(template.id)
+        if content is not None:
+            self.content_hits += 1
+            self._contents.move_to_end(template.id)
+            return content
+        self.content_misses += 1
+        content = db.query(Template.content).filter(Template.id == template.id).scalar() or ""
+        self._contents[template.id] = content
+        while len(self._contents) > self.content_cache_size:
+            self._contents.popitem(last=False)
+        return content
+
+    def invalidate(self):
+        """Descartar o catálogo após importar ou alterar templates (nova versão)"""
+        self.version += 1
+        self._snapshot = None
+        self._contents.clear()
+
+    def warm(self):
+        """Carregar o catálogo no startup, em uma sessão própria"""
+        db = SessionLocal()
+        try:
+            snapshot = self.snapshot(db)
+            logger.info(f"Template catalog loaded: {len(snapshot.templates)} templates (version {snapshot.version})")
+        except Exception as e:
+            # Sem o catálogo, a primeira leitura carrega sob demanda
+            logger.error(f"Error warming template catalog: {str(e)}")
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, object]:
+        snapshot = self._snapshot
+        return {
+            "version": self.version,
+            "templates": len(snapshot.templates) if snapshot is not None else 0,
+            "loaded": snapshot is not None,
+            "loads": self.loads,
+            "cached_contents": len(self._contents),
+            "content_hits": self.content_hits,
+            "content_misses": self.content_misses,
+        }
+
+
+template_catalog = TemplateCatalog()
@@ -0,0 +1,214 @@
+"""
+Busca textual na biblioteca de templates.
+
+Postgres: coluna gerada `templates.search_vector` (tsvector com a configuração
+`portuguese`, que aplica stemming: "contestar" encontra "contestação") e índice
+GIN. Pesos: nome (A) > descrição (B) > texto (C). Ranking por `ts_rank_cd` e
+trechos destacados por `ts_headline`, calculados só para a página retornada.
+
+SQLite (desenvolvimento local): tabela virtual FTS5 `templates_fts`, mantida
+por triggers, com o `id` do template em uma coluna não indexada. Não usa
+conteúdo externo ligado pelo rowid: `templates` tem chave primária texto, e o
+rowid implícito pode ser renumerado por um VACUUM. O FTS5 não tem stemmer para
+português: os acentos são ignorados e cada termo é buscado como prefixo
+("contest" encontra "contestação"). Ranking por `bm25` e trechos por
+`snippet`.
+
+O índice é criado pela migração do Alembic e, para bancos criados com
+`init_db()`, por `ensure_index()`, que é idempotente; as duas usam a DDL
+definida aqui.
+"""
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+POSTGRES_INDEX_DDL = [
+    """
+    ALTER TABLE templates ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('portuguese', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('portuguese', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('portuguese', coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_templates_search_vector ON templates USING GIN (search_vector)",
+]
+
+POSTGRES_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_templates_search_vector",
+    "ALTER TABLE templates DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts5(
+        template_id UNINDEXED, name, description, content,
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_ai AFTER INSERT ON templates BEGIN
+        INSERT INTO templates_fts(template_id, name, description, content)
+        VALUES (new.id, new.name, new.description, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_ad AFTER DELETE ON templates BEGIN
+        DELETE FROM templates_fts WHERE template_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_au AFTER UPDATE ON templates BEGIN
+        DELETE FROM templates_fts WHERE template_id = old.id;
+        INSERT INTO templates_fts(template_id, name, description, content)
+        VALUES (new.id, new.name, new.description, new.content);
+    END
+    """,
+]
+
+# Indexar os templates que já existiam quando a tabela FTS5 foi criada
+SQLITE_REBUILD = """
+    INSERT INTO templates_fts(template_id, name, description, content)
+    SELECT id, name, description, content FROM templates
+"""
+
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS templates_fts_au",
+    "DROP TRIGGER IF EXISTS templates_fts_ad",
+    "DROP TRIGGER IF EXISTS templates_fts_ai",
+    "DROP TABLE IF EXISTS templates_fts",
+]
+
+POSTGRES_SEARCH = f"""
+    SELECT t.id, t.name, t.category, t.type, ranked.rank,
+           ts_headline(
+               'portuguese', t.content, ranked.query,
+               'MaxFragments=2, MinWords=8, MaxWords=30, FragmentDelimiter=" … ", StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}'
+           ) AS snippet
+    FROM (
+        SELECT templates.id, query, ts_rank_cd(search_vector, query) AS rank
+        FROM templates, websearch_to_tsquery('portuguese', :query) AS query
+        WHERE search_vector @@ query {{filters}}
+        ORDER BY rank DESC, templates.id
+        LIMIT :limit OFFSET :skip
+    ) AS ranked
+    JOIN templates t ON t.id = ranked.id
+    ORDER BY ranked.rank DESC, t.id
+"""
+
+SQLITE_SEARCH = f"""
+    SELECT t.id, t.name, t.category, t.type,
+           -bm25(templates_fts, 0.0, 10.0, 5.0, 1.0) AS rank,
+           snippet(templates_fts, 3, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', ' … ', 24) AS snippet
+    FROM templates_fts
+    JOIN templates t ON t.id = templates_fts.template_id
+    WHERE templates_fts MATCH :query {{filters}}
+    ORDER BY rank DESC, t.id
+    LIMIT :limit OFFSET :skip
+"""
+
+
+class SearchUnavailable(Exception):
+    """Busca textual não suportada no banco configurado"""
+
+
+def fts5_query(query: str) -> str:
+    """Termos do usuário como uma consulta FTS5 segura: todos obrigatórios, cada um como prefixo"""
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", query))
+
+
+class TemplateSearch:
+    def ensure_index(self, engine: Engine):
+        """Criar o índice de busca se ainda não existir (bancos criados sem o Alembic)"""
+        try:
+            with engine.begin() as connection:
+                dialect = connection.dialect.name
+                if dialect == "postgresql":
+                    exists = connection.execute(text(
+                        "SELECT 1 FROM information_schema.columns "
+                        "WHERE table_name = 'templates' AND column_name = 'search_vector'"
+                    )).first()
+                    # ALTER TABLE bloqueia a tabela: só quando a coluna ainda não existe
+                    if not exists:
+                        for statement in POSTGRES_INDEX_DDL:
+                            connection.execute(text(statement))
+                elif dialect == "sqlite":
+                    table_sql = connection.execute(
+                        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'templates_fts'")
+                    ).scalar()
+                    exists = table_sql is not None
+                    if exists and "template_id" not in table_sql:
+                        # Índice antigo, ligado pelo rowid de templates: recriar
+                        for statement in SQLITE_DROP_DDL:
+                            connection.execute(text(statement))
+                        exists = False
+                    for statement in SQLITE_INDEX_DDL:
+                        connection.execute(text(statement))
+                    if not exists:
+                        connection.execute(text(SQLITE_REBUILD))
+        except Exception as e:
+            # Sem índice, só a busca fica indisponível
+            logger.error(f"Error creating template search index: {str(e)}")
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        category: Optional[str] = None,
+        template_type: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Templates que correspondem à busca, do mais relevante para o menos, com trechos destacados
+
+        Raises:
+            SearchUnavailable: se o banco não for Postgres nem SQLite
+        """
+        dialect = db.get_bind().dialect.name
+        params: Dict[str, Any] = {"query": query, "skip": skip, "limit": limit}
+        if dialect == "postgresql":
+            sql = POSTGRES_SEARCH
+            column_prefix = "templates."
+        elif dialect == "sqlite":
+            params["query"] = fts5_query(query)
+            if not params["query"]:
+                return []
+            sql = SQLITE_SEARCH
+            column_prefix = "t."
+        else:
+            raise SearchUnavailable(f"Busca de templates não suportada no banco {dialect}")
+
+        filters = ""
+        if category:
+            filters += f" AND {column_prefix}category = :category"
+            params["category"] = category
+        if template_type:
+            filters += f" AND {column_prefix}type = :template_type"
+            params["template_type"] = template_type
+
+        rows = db.execute(text(sql.format(filters=filters)), params).all()
+        return [
+            {
+                "id": row.id,
+                "document_name": row.name,
+                "subfolder_1": row.category,
+                "subfolder_2": row.type,
+                "subfolder_3": None,
+                "rank": float(row.rank or 0),
+                "snippet": row.snippet
+            }
+            for row in rows
+        ]
+
+
+template_search = TemplateSearch()
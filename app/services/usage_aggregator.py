@@ -0,0 +1,112 @@
+"""
+Contabilização de uso com escrita adiada (write-behind).
+
+Os turnos de chat não atualizam mais a linha de `usage` do usuário na mesma
+transação: os tokens consumidos são somados em memória e gravados em lote a
+cada `USAGE_FLUSH_INTERVAL_SECONDS` (ou antes, quando muitos usuários têm
+valores pendentes), com um único UPDATE incremental por usuário. Os totais em
+`usage` podem ficar até um intervalo atrasados em relação às mensagens.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, func
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.usage import Usage
+
+logger = logging.getLogger(__name__)
+
+
+class UsageAggregator:
+    def __init__(self, interval_seconds: float = None, max_pending: int = None):
+        self.interval_seconds = interval_seconds or settings.USAGE_FLUSH_INTERVAL_SECONDS
+        self.max_pending = max_pending or settings.USAGE_FLUSH_MAX_PENDING
+        # user_id -> tokens ainda não gravados
+        self._pending: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def add(self, user_id: str, tokens_used: int):
+        if not tokens_used:
+            return
+        self._pending[user_id] = self._pending.get(user_id, 0) + tokens_used
+        if self._wakeup is not None and len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def start(self):
+        """Iniciar o flush periódico (chamado no startup da aplicação)"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Parar o flush periódico e gravar o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._write, pending)
+            self.flushes += 1
+            self.rows_written += len(pending)
+        except Exception as e:
+            logger.error(f"Error flushing usage for {len(pending)} users: {str(e)}")
+            # Devolver os valores para a próxima tentativa
+            for user_id, tokens in pending.items():
+                self._pending[user_id] = self._pending.get(user_id, 0) + tokens
+
+    def _write(self, pending: Dict[str, int]):
+        usage = Usage.__table__
+        statement = (
+            usage.update()
+            .where(usage.c.user_id == bindparam("b_user_id"))
+            .values(
+                total_tokens=func.coalesce(usage.c.total_tokens, 0) + bindparam("b_tokens"),
+                updated_at=func.now()
+            )
+        )
+        db = SessionLocal()
+        try:
+            db.execute(statement, [
+                {"b_user_id": user_id, "b_tokens": tokens} for user_id, tokens in pending.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_users": len(self._pending),
+            "pending_tokens": sum(self._pending.values()),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+usage_aggregator = UsageAggregator()
@@ -0,0 +1,151 @@
+"""
+Compilação e renderização de templates de petição.
+
+Um template é texto com marcadores `[NOME_DA_VARIAVEL]`. Em vez de um
+`str.replace` por variável (cada um percorre o texto inteiro), o texto é
+analisado uma única vez e compilado em segmentos: literais intercalados com
+marcadores. A renderização monta a lista de partes e faz um único `join`.
+
+A forma compilada fica em cache pelo digest (SHA-1) do conteúdo, então cada
+texto é analisado uma vez por processo, e não a cada geração ou preview, sem
+que o cache guarde uma cópia de cada texto como chave.
+
+As variáveis de cada template são extraídas na importação (ou alteração) e
+gravadas em `Template.variables` como JSON, com metadados por variável:
+
+    [{"name": "NOME_DO_AUTOR", "occurrences": 3, "first_position": 412}, ...]
+
+`first_position` é o índice (em caracteres) do primeiro marcador no texto.
+"""
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r'\[([^\]]+)\]')
+
+# Templates compilados mantidos em memória
+COMPILED_CACHE_SIZE = 512
+
+
+class RenderedTemplate:
+    """Texto renderizado e os marcadores que ficaram sem valor (mantidos como `[NOME]` no texto)"""
+
+    def __init__(self, text: str, unfilled: List[str]):
+        self.text = text
+        self.unfilled = unfilled
+
+
+class CompiledTemplate:
+    """
+    Template analisado: `literals[i]` precede `placeholders[i]`; o último
+    literal vem depois do último marcador.
+    """
+
+    __slots__ = ("literals", "placeholders", "variables")
+
+    def __init__(self, literals: Tuple[str, ...], placeholders: Tuple[str, ...]):
+        self.literals = literals
+        self.placeholders = placeholders
+        # Variáveis distintas, na ordem da primeira ocorrência
+        self.variables = tuple(dict.fromkeys(placeholders))
+
+    def render(self, values: Dict[str, Any]) -> RenderedTemplate:
+        """
+        Substituir os marcadores em uma passada.
+
+        Valores vazios ou ausentes mantêm o marcador no texto, como antes;
+        eles são informados em `unfilled`.
+        """
+        literals = self.literals
+        parts = [literals[0]]
+        unfilled = {}
+        for index, name in enumerate(self.placeholders):
+            value = values.get(name)
+            if value:
+                parts.append(value if isinstance(value, str) else str(value))
+            else:
+                parts.append(f"[{name}]")
+                unfilled[name] = None
+            parts.append(literals[index + 1])
+        return RenderedTemplate("".join(parts), list(unfilled))
+
+
+def parse_template(content: str) -> CompiledTemplate:
+    """Analisar o texto em literais e marcadores (sem cache)"""
+    pieces = PLACEHOLDER_PATTERN.split(content or "")
+    # re.split com um grupo alterna: literal, marcador, literal, ..., literal
+    return CompiledTemplate(tuple(pieces[0::2]), tuple(pieces[1::2]))
+
+
+# digest do conteúdo -> template compilado, em ordem de uso (LRU)
+_compiled: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+
+
+def compile_template(content: str) -> CompiledTemplate:
+    """Forma compilada de um template, em cache pelo digest do conteúdo"""
+    digest = hashlib.sha1((content or "").encode("utf-8")).hexdigest()
+    compiled = _compiled.get(digest)
+    if compiled is None:
+        compiled = parse_template(content)
+        _compiled[digest] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    else:
+        _compiled.move_to_end(digest)
+    return compiled
+
+
+def render_template(content: str, values: Dict[str, Any]) -> RenderedTemplate:
+    return compile_template(content or "").render(values)
+
+
+def extract_variables(content: str) -> List[Dict[str, Any]]:
+    """Variáveis de um texto, na ordem da primeira ocorrência, com ocorrências e posição da primeira"""
+    found: Dict[str, Dict[str, Any]] = {}
+    for match in PLACEHOLDER_PATTERN.finditer(content or ""):
+        name = match.group(1)
+        entry = found.get(name)
+        if entry is None:
+            found[name] = {"name": name, "occurrences": 1, "first_position": match.start()}
+        else:
+            entry["occurrences"] += 1
+    return list(found.values())
+
+
+def serialize_variables(content: str) -> str:
+    """Valor de `Template.variables` para um texto (lista vazia se não houver marcadores)"""
+    return json.dumps(extract_variables(content), ensure_ascii=False)
+
+
+def load_variables(raw: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Variáveis gravadas em `Template.variables`.
+
+    Aceita também o formato antigo (lista de nomes), sem metadados. None se
+    não houver variáveis gravadas ou o valor for ilegível: o texto precisa ser
+    analisado (ver scripts/backfill_template_variables.py).
+    """
+    if not raw or not raw.strip():
+        return None
+    try:
+        stored = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(stored, list):
+        return None
+    variables = []
+    for entry in stored:
+        if isinstance(entry, str):
+            variables.append({"name": entry})
+        elif isinstance(entry, dict) and entry.get("name"):
+            variables.append(entry)
+        else:
+            return None
+    return variables
+
+
+def has_variable_metadata(variables: Optional[List[Dict[str, Any]]]) -> bool:
+    """Se as variáveis gravadas já estão no formato atual (com metadados)"""
+    return variables is not None and all("occurrences" in entry for entry in variables)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backfill de `Template.variables` para templates já existentes.
+
+Grava em cada template as variáveis extraídas do texto, com metadados
+(ocorrências e posição da primeira), no formato de app.utils.templates.
+Templates que já estão no formato atual são pulados (use --force para
+recalcular todos).
+
+A tabela é percorrida em lotes pela chave primária (keyset), com um commit por
+lote. O último id processado fica em um arquivo de checkpoint: se o processo
+for interrompido, a próxima execução continua do lote seguinte. O checkpoint é
+removido ao final.
+
+Uso:
+    python scripts/backfill_template_variables.py
+    python scripts/backfill_template_variables.py --batch-size 200 --dry-run
+    python scripts/backfill_template_variables.py --restart --force
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import app modules
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from app.db.session import SessionLocal
+from app.models.document import Template
+from app.utils.templates import has_variable_metadata, load_variables, serialize_variables
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+)
+
+CHECKPOINT_FILE = os.path.join(ROOT_DIR, 'tmp_files', 'backfill_template_variables.checkpoint')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill das variáveis dos templates")
+    parser.add_argument("--batch-size", type=int, default=500, help="Templates por lote (um commit por lote)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="Arquivo com o último id processado")
+    parser.add_argument("--restart", action="store_true", help="Ignorar o checkpoint e começar do início")
+    parser.add_argument("--force", action="store_true", help="Recalcular também templates já no formato atual")
+    parser.add_argument("--dry-run", action="store_true", help="Não gravar nada (nem o checkpoint)")
+    return parser.parse_args()
+
+
+def read_checkpoint(path: str) -> str:
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def write_checkpoint(path: str, last_id: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Escrita atômica: um checkpoint pela metade faria o backfill pular ou repetir lotes
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(last_id)
+    os.replace(tmp_path, path)
+
+
+def backfill(args) -> int:
+    last_id = "" if args.restart else read_checkpoint(args.checkpoint)
+    if last_id:
+        logging.info(f"Continuando após o template {last_id}")
+
+    scanned = updated = 0
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        while True:
+            rows = (
+                db.query(Template.id, Template.variables, Template.content)
+                .filter(Template.id > last_id)
+                .order_by(Template.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            for row in rows:
+                if not args.force and has_variable_metadata(load_variables(row.variables)):
+                    continue
+                value = serialize_variables(row.content)
+                if value == row.variables:
+                    continue
+                if not args.dry_run:
+                    db.query(Template).filter(Template.id == row.id).update(
+                        {Template.variables: value}, synchronize_session=False
+                    )
+                updated += 1
+
+            scanned += len(rows)
+            last_id = rows[-1].id
+            if not args.dry_run:
+                db.commit()
+                write_checkpoint(args.checkpoint, last_id)
+            logging.info(f"{scanned} templates verificados, {updated} atualizados (último id: {last_id})")
+    except Exception:
+        db.rollback()
+        logging.error(f"Backfill interrompido; a próxima execução continua após {last_id or 'o início'}")
+        raise
+    finally:
+        db.close()
+
+    if not args.dry_run and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    logging.info(
+        f"Backfill concluído em {time.monotonic() - started:.1f}s: "
+        f"{scanned} templates verificados, {updated} {'a atualizar' if args.dry_run else 'atualizados'}"
+    )
+    return updated
+
+
+if __name__ == "__main__":
+    backfill(parse_args())
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de carga ponta a ponta do chat.
+
+Executa a aplicação FastAPI no próprio processo (sem servidor HTTP), contra um
+banco SQLite semeado e o provedor de IA local (simulador, ver
+app.core.local_provider). Cada usuário virtual faz login, cria uma sessão,
+envia mensagens por /chat/message e/ou /chat/stream e lê a sessão no final.
+
+Relatório por endpoint: vazão, latência p50/p95/p99, tempo até o primeiro
+trecho (SSE) e queries SQL por requisição. O resultado pode ser salvo como
+baseline JSON e comparado com uma baseline anterior.
+
+Uso:
+    python scripts/benchmark_chat.py --users 50 --turns 4 --scenario mixed
+    python scripts/benchmark_chat.py --profile instant --output benchmarks/chat-2.1.8.json
+    python scripts/benchmark_chat.py --compare benchmarks/chat-2.1.8.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+# Add the parent directory to the path so we can import app modules
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+PASSWORD = "benchmark123"
+
+PROMPTS = [
+    "Qual o prazo para contestação no procedimento comum?",
+    "O que é tutela de urgência?",
+    "Explique a diferença entre prescrição e decadência no direito civil.",
+    "Meu cliente foi demitido sem justa causa depois de 10 anos. Quais verbas rescisórias são devidas?",
+    "Redija uma petição inicial de ação de alimentos com fundamentação na jurisprudência do STJ.",
+]
+
+# Contador de queries da requisição em andamento (herdado pelas tasks e threads da requisição)
+current_queries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("current_queries", default=None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de carga ponta a ponta do chat")
+    parser.add_argument("--users", type=int, default=20, help="Usuários virtuais simultâneos")
+    parser.add_argument("--turns", type=int, default=3, help="Mensagens enviadas por usuário")
+    parser.add_argument("--scenario", choices=["message", "stream", "mixed"], default="mixed")
+    parser.add_argument("--profile", default="typical", help="Perfil de latência do provedor local")
+    parser.add_argument("--cassette", default="", help="Cassete JSONL a reproduzir no provedor local")
+    parser.add_argument("--database-url", default="", help="Banco a usar (padrão: SQLite temporário)")
+    parser.add_argument("--cache", action="store_true", help="Manter o cache de respostas ligado")
+    parser.add_argument("--name", default="", help="Nome da execução (padrão: VERSION)")
+    parser.add_argument("--output", default="", help="Salvar o resultado como baseline JSON")
+    parser.add_argument("--compare", default="", help="Baseline JSON para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Piora relativa tolerada na comparação")
+    return parser.parse_args()
+
+
+def configure_environment(args) -> str:
+    """Definir as variáveis de ambiente antes de importar a aplicação"""
+    database_url = args.database_url
+    if not database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_chat_"), "bench.db")
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    for name in ("POSTGRES_SERVER", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ["LOCAL_PROVIDER_ENABLED"] = "true"
+    os.environ["LOCAL_PROVIDER_PROFILE"] = args.profile
+    os.environ["LOCAL_PROVIDER_CASSETTE"] = args.cassette
+    os.environ["LOCAL_PROVIDER_SEED"] = "42"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.cache else "false"
+    return database_url
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RequestResult:
+    def __init__(self, status: int, body: bytes, duration: float, first_chunk: Optional[float], queries: int):
+        self.status = status
+        self.body = body
+        self.duration = duration
+        self.first_chunk = first_chunk
+        self.queries = queries
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Metrics:
+    """Amostras por endpoint"""
+
+    def __init__(self):
+        self.samples: Dict[str, Dict[str, List[float]]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, endpoint: str, result: RequestResult, ok: bool):
+        entry = self.samples.setdefault(endpoint, {"latency": [], "ttft": [], "queries": []})
+        entry["latency"].append(result.duration)
+        entry["queries"].append(result.queries)
+        if result.first_chunk is not None:
+            entry["ttft"].append(result.first_chunk)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, wall_time: float) -> Dict[str, Dict[str, object]]:
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        report = {}
+        for endpoint, entry in self.samples.items():
+            latencies = entry["latency"]
+            report[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(latencies) / wall_time, 2) if wall_time else None,
+                "p50_ms": ms(percentile(latencies, 0.50)),
+                "p95_ms": ms(percentile(latencies, 0.95)),
+                "p99_ms": ms(percentile(latencies, 0.99)),
+                "ttft_p50_ms": ms(percentile(entry["ttft"], 0.50)),
+                "ttft_p95_ms": ms(percentile(entry["ttft"], 0.95)),
+                "queries_per_request": round(statistics.mean(entry["queries"]), 2),
+                "max_queries": max(entry["queries"]),
+            }
+        return report
+
+
+async def asgi_request(
+    app,
+    method: str,
+    path: str,
+    token: Optional[str] = None,
+    json_body: Optional[dict] = None,
+    form: Optional[dict] = None
+) -> RequestResult:
+    """Chamar a aplicação ASGI diretamente, medindo o tempo até o primeiro trecho do corpo"""
+    headers = [(b"host", b"benchmark")]
+    body = b""
+    if json_body is not None:
+        body = json.dumps(json_body).encode("utf-8")
+        headers.append((b"content-type", b"application/json"))
+    elif form is not None:
+        body = urlencode(form).encode("utf-8")
+        headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = 0
+    chunks: List[bytes] = []
+    first_chunk_at: Optional[float] = None
+
+    async def send(message):
+        nonlocal status, first_chunk_at
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            data = message.get("body", b"")
+            if data:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                chunks.append(data)
+
+    counter = [0]
+    reset = current_queries.set(counter)
+    started = time.perf_counter()
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+        current_queries.reset(reset)
+    finished = time.perf_counter()
+    first_chunk = first_chunk_at - started if first_chunk_at is not None else None
+    return RequestResult(status, b"".join(chunks), finished - started, first_chunk, counter[0])
+
+
+def install_query_counter(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = current_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def seed_database(users: int) -> List[str]:
+    """Criar as tabelas e os usuários do benchmark; retorna os e-mails"""
+    from app.core.security import get_password_hash
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.usage import Usage
+    from app.models.user import User
+
+    Base.metadata.create_all(bind=engine)
+    hashed_password = get_password_hash(PASSWORD)
+    plans = ["basic", "pro"]
+
+    db = SessionLocal()
+    try:
+        emails = []
+        for index in range(users):
+            email = f"bench{index}@example.com"
+            emails.append(email)
+            if db.query(User).filter(User.email == email).first():
+                continue
+            user = User(
+                email=email,
+                hashed_password=hashed_password,
+                first_name="Bench",
+                last_name=str(index),
+                cpf_cnpj=f"bench-{index:08d}",
+                plan=plans[index % len(plans)],
+                token_credits=1_000_000,
+                available_credits=1_000_000,
+                is_active=True,
+                is_verified=True,
+            )
+            db.add(user)
+            db.flush()
+            db.add(Usage(user_id=user.id, total_tokens=0))
+        db.commit()
+        return emails
+    finally:
+        db.close()
+
+
+async def virtual_user(app, api: str, email: str, index: int, args, metrics: Metrics):
+    result = await asgi_request(app, "POST", f"{api}/auth/login", form={"username": email, "password": PASSWORD})
+    metrics.add("POST /auth/login", result, result.status == 200)
+    if result.status != 200:
+        return
+    token = result.json()["access_token"]
+
+    result = await asgi_request(app, "POST", f"{api}/chat/", token=token, json_body={"title": f"Bench {index}"})
+    metrics.add("POST /chat/", result, result.status == 200)
+    if result.status != 200:
+        return
+    session_id = result.json()["id"]
+
+    for turn in range(args.turns):
+        payload = {
+            "message": f"{PROMPTS[(index + turn) % len(PROMPTS)]} (usuário {index}, turno {turn})",
+            "session_id": session_id,
+            "provider": "local",
+        }
+        stream = args.scenario == "stream" or (args.scenario == "mixed" and (index + turn) % 2 == 1)
+        if stream:
+            result = await asgi_request(app, "POST", f"{api}/chat/stream", token=token, json_body=payload)
+            ok = result.status == 200 and b'"error"' not in result.body
+            metrics.add("POST /chat/stream", result, ok)
+        else:
+            result = await asgi_request(app, "POST", f"{api}/chat/message", token=token, json_body=payload)
+            metrics.add("POST /chat/message", result, result.status == 200)
+
+    result = await asgi_request(app, "GET", f"{api}/chat/{session_id}", token=token)
+    metrics.add("GET /chat/{session_id}", result, result.status == 200)
+
+
+def compare(report: dict, baseline_path: str, tolerance: float) -> bool:
+    """Imprimir as diferenças em relação à baseline; False se houver regressão"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    ok = True
+    print(f"\nComparação com {baseline_path} ({baseline.get('name')}, tolerância {tolerance:.0%})")
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "ttft_p95_ms", "queries_per_request", "throughput_rps"):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            # Vazão: menor é pior; demais métricas: maior é pior
+            worse = -change if metric == "throughput_rps" else change
+            flag = "REGRESSÃO" if worse > tolerance else ""
+            if flag:
+                ok = False
+            print(f"  {endpoint:<24} {metric:<20} {before:>10} -> {after:>10} ({change:+.1%}) {flag}")
+    return ok
+
+
+async def run(args) -> dict:
+    from app.core.config import settings
+    from app.db.session import engine, pool_monitor
+    from app.main import app
+    from app.services.usage_aggregator import usage_aggregator
+
+    install_query_counter(engine)
+    emails = seed_database(args.users)
+    metrics = Metrics()
+
+    # Os eventos de startup/shutdown não rodam sem servidor: iniciar o flush de uso aqui
+    usage_aggregator.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        virtual_user(app, settings.API_V1_STR, email, index, args, metrics)
+        for index, email in enumerate(emails)
+    ])
+    wall_time = time.perf_counter() - started
+    await usage_aggregator.stop()
+
+    turns = args.users * args.turns
+    return {
+        "name": args.name or settings.VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.url.get_backend_name(),
+        },
+        "config": {
+            "users": args.users,
+            "turns": args.turns,
+            "scenario": args.scenario,
+            "profile": args.profile,
+            "cassette": args.cassette or None,
+            "cache": args.cache,
+        },
+        "wall_time_s": round(wall_time, 3),
+        "chat_turns_per_s": round(turns / wall_time, 2) if wall_time else None,
+        "endpoints": metrics.summary(wall_time),
+        "db_pool": pool_monitor.stats(),
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{report['name']}: {report['config']['users']} usuários x {report['config']['turns']} turnos "
+          f"({report['config']['scenario']}, perfil {report['config']['profile']})")
+    print(f"Tempo total: {report['wall_time_s']}s, turnos de chat/s: {report['chat_turns_per_s']}")
+    pool = report["db_pool"]
+    print(f"Pool do banco: pico {pool['peak_checked_out']} conexões em uso, "
+          f"retenção p95 {pool['hold_p95_ms']}ms, máx {pool['hold_max_ms']}ms\n")
+    header = f"{'endpoint':<24} {'req':>5} {'err':>4} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'ttft95':>9} {'q/req':>6}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in report["endpoints"].items():
+        print(
+            f"{endpoint:<24} {stats['requests']:>5} {stats['errors']:>4} {stats['throughput_rps']:>8} "
+            f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9} "
+            f"{str(stats['ttft_p95_ms'] if stats['ttft_p95_ms'] is not None else '-'):>9} "
+            f"{stats['queries_per_request']:>6}"
+        )
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline salva em {args.output}")
+
+    if args.compare and not compare(report, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
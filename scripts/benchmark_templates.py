@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark da renderização de templates de petição.
+
+Compara, sobre o acervo real de petições, a renderização antiga (um
+`str.replace` por variável) com o template compilado de app.utils.templates:
+compilação a frio (análise + render) e render com o template já em cache. As
+duas saídas são comparadas para cada template.
+
+O acervo vem do CSV de petições (coluna TEXTO) ou, com --database, da
+tabela `templates` do banco configurado.
+
+Uso:
+    python scripts/benchmark_templates.py
+    python scripts/benchmark_templates.py --csv data/peticoes.csv --repeat 20
+    python scripts/benchmark_templates.py --database --limit 200
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+# Add the parent directory to the path so we can import app modules
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from app.utils.templates import PLACEHOLDER_PATTERN, parse_template
+
+CSV_FILE = os.path.join(ROOT_DIR, 'data', 'peticoes.csv')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmark da renderização de templates")
+    parser.add_argument("--csv", default=CSV_FILE, help="CSV de petições (coluna TEXTO)")
+    parser.add_argument("--database", action="store_true", help="Ler os templates do banco em vez do CSV")
+    parser.add_argument("--limit", type=int, default=0, help="Usar só os N primeiros templates")
+    parser.add_argument("--repeat", type=int, default=10, help="Renderizações por template e abordagem")
+    parser.add_argument("--fill", type=float, default=1.0, help="Fração das variáveis preenchidas (0 a 1)")
+    return parser.parse_args()
+
+
+def load_csv(path: str) -> List[str]:
+    csv.field_size_limit(1024 * 1024 * 10)
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["TEXTO"] for row in csv.DictReader(f) if row.get("TEXTO")]
+
+
+def load_database() -> List[str]:
+    from app.db.session import SessionLocal
+    from app.models.document import Template
+
+    db = SessionLocal()
+    try:
+        return [content for (content,) in db.query(Template.content).all() if content]
+    finally:
+        db.close()
+
+
+def legacy_render(text: str, values: Dict[str, str]) -> str:
+    """Renderização anterior de generate_document/preview_document"""
+    for var_name, var_value in values.items():
+        if var_value:
+            text = text.replace(f"[{var_name}]", var_value)
+    return text
+
+
+def sample_values(text: str, fill: float) -> Dict[str, str]:
+    variables = list(dict.fromkeys(PLACEHOLDER_PATTERN.findall(text)))
+    filled = variables[:round(len(variables) * fill)]
+    return {name: f"Valor de {name.lower()}" for name in filled}
+
+
+def timed(fn: Callable[[], object], repeat: int) -> float:
+    """Melhor tempo de uma execução, em segundos"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    args = parse_args()
+    if args.database:
+        corpus = load_database()
+        source = "banco de dados"
+    else:
+        if not os.path.exists(args.csv):
+            print(f"Arquivo não encontrado: {args.csv} (use --csv ou --database)")
+            sys.exit(1)
+        corpus = load_csv(args.csv)
+        source = args.csv
+    if args.limit:
+        corpus = corpus[:args.limit]
+    if not corpus:
+        print("Nenhum template encontrado")
+        sys.exit(1)
+
+    legacy_times, cold_times, warm_times = [], [], []
+    mismatches = 0
+    for text in corpus:
+        values = sample_values(text, args.fill)
+        compiled = parse_template(text)
+        if compiled.render(values).text != legacy_render(text, values):
+            # Só difere em textos com marcadores aninhados ou valores que contêm outros marcadores
+            mismatches += 1
+        legacy_times.append(timed(lambda: legacy_render(text, values), args.repeat))
+        cold_times.append(timed(lambda: parse_template(text).render(values), args.repeat))
+        warm_times.append(timed(lambda: compiled.render(values), args.repeat))
+
+    sizes = [len(text) for text in corpus]
+    variable_counts = [len(parse_template(text).variables) for text in corpus]
+    print(f"Templates: {len(corpus)} ({source})")
+    print(f"Tamanho: mediana {statistics.median(sizes):.0f} caracteres, máximo {max(sizes)}")
+    print(f"Variáveis: mediana {statistics.median(variable_counts):.0f}, máximo {max(variable_counts)}")
+    print(f"Saídas diferentes: {mismatches}")
+    print()
+    print(f"{'abordagem':<22}{'total (ms)':>12}{'p50 (µs)':>12}{'p95 (µs)':>12}{'máx (µs)':>12}")
+    for name, times in (
+        ("replace por variável", legacy_times),
+        ("compilado (a frio)", cold_times),
+        ("compilado (em cache)", warm_times),
+    ):
+        print(
+            f"{name:<22}{sum(times) * 1000:>12.2f}{percentile(times, 0.5) * 1e6:>12.1f}"
+            f"{percentile(times, 0.95) * 1e6:>12.1f}{max(times) * 1e6:>12.1f}"
+        )
+    print()
+    print(f"Ganho em cache: {sum(legacy_times) / max(sum(warm_times), 1e-12):.1f}x")
+    print(f"Ganho a frio: {sum(legacy_times) / max(sum(cold_times), 1e-12):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
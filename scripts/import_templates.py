@@ -8,7 +8,6 @@ import os
 import sys
 import csv
 import uuid
-import json
 import logging
 import sqlite3
 from datetime import datetime
@@ -17,6 +16,7 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.core.config import settings
+from app.utils.templates import serialize_variables
 
 # Configuração de logging
 logging.basicConfig(
@@ -97,8 +97,8 @@ def import_templates():
                     # Gera descrição
                     description = f"Template de {doc_type if doc_type else category}"
                     
-                    # Inicializa as variáveis como um objeto vazio
-                    variables = json.dumps({})
+                    # Extrai as variáveis do texto (com metadados), uma vez na importação
+                    variables = serialize_variables(content)
                     
                     # Timestamp atual
                     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
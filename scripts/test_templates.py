@@ -5,7 +5,6 @@ Script para testar templates e variáveis no banco de dados.
 
 import os
 import sys
-import json
 import sqlite3
 import logging
 import re
@@ -19,6 +18,8 @@ logging.basicConfig(
 # Adiciona o diretório raiz ao path para poder importar os módulos do projeto
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app.utils.templates import load_variables
+
 # Caminho para o banco de dados
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.db')
 
@@ -63,12 +64,10 @@ def test_template_variables():
                 extracted_vars.append(var)
         
         # Variáveis armazenadas no banco
-        stored_vars = []
-        if variables_raw and variables_raw.strip():
-            try:
-                stored_vars = json.loads(variables_raw)
-            except json.JSONDecodeError:
-                logging.error(f"Erro ao decodificar variáveis para o template {name}")
+        stored = load_variables(variables_raw)
+        if stored is None and variables_raw and variables_raw.strip():
+            logging.error(f"Erro ao decodificar variáveis para o template {name}")
+        stored_vars = [entry["name"] for entry in stored or []]
         
         logging.info(f"Variáveis extraídas do conteúdo: {extracted_vars}")
         logging.info(f"Variáveis armazenadas no banco: {stored_vars}")
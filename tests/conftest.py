@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+# Banco SQLite descartável: definido antes de importar app.core.config, para
+# que os testes nunca usem o banco configurado no .env
+_DB_DIR = tempfile.mkdtemp(prefix="advogada-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+for _name in ("POSTGRES_SERVER", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"):
+    os.environ.setdefault(_name, "test")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Sessão em um banco com as tabelas recém-criadas (apagadas ao final do teste)"""
+    from app.db.base import Base, engine
+    from app.db.session import SessionLocal
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def user(db):
+    """Usuário do plano pro com 1000 créditos"""
+    from app.models.user import User
+
+    user = User(
+        email="advogada@example.com",
+        hashed_password="x",
+        cpf_cnpj="12345678900",
+        plan="pro",
+        token_credits=1000,
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def chat_session(db, user):
+    from app.models.chat_session import ChatSession
+
+    chat_session = ChatSession(user_id=user.id, title="Contestação trabalhista")
+    db.add(chat_session)
+    db.commit()
+    return chat_session
+
+
+@pytest.fixture
+def migrate(db):
+    """Executar upgrade()/downgrade() de uma revisão do alembic no banco de teste"""
+    pytest.importorskip("alembic")
+    import importlib.util
+    from pathlib import Path
+
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    from app.db.base import engine
+
+    versions = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+    def run(revision: str, step: str = "upgrade"):
+        path = next(versions.glob(f"{revision}_*.py"))
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        # A sessão do teste não pode segurar a escrita no SQLite durante a migração
+        db.commit()
+        with engine.begin() as connection:
+            with Operations.context(MigrationContext.configure(connection)):
+                getattr(module, step)()
+        db.expire_all()
+
+    return run
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.core.config import settings
+
+
+async def drain(controller, holder, waiters):
+    """Liberar a vaga ocupada e esperar todos os waiters passarem por ela"""
+    await asyncio.sleep(0)
+    controller.release(holder)
+    await asyncio.gather(*waiters)
+
+
+def waiter(controller, order, user_id, plan):
+    async def run():
+        async with controller.slot(user_id, plan):
+            order.append(plan)
+            await asyncio.sleep(0)
+
+    return asyncio.ensure_future(run())
+
+
+def test_lanes_share_slots_by_weight():
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        order = []
+        holder = await controller.acquire("holder", "gratuito")
+        waiters = [waiter(controller, order, f"free-{i}", "gratuito") for i in range(10)]
+        waiters += [waiter(controller, order, f"pro-{i}", "pro") for i in range(10)]
+        await drain(controller, holder, waiters)
+        return order
+
+    order = asyncio.run(scenario())
+    # Peso 4 contra 1: a cada cinco vagas, quatro vão para o pro
+    assert order[:10].count("pro") == 8
+    assert len(order) == 20
+
+
+def test_returning_idle_lane_does_not_starve_busy_lane():
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        order = []
+        # O pro usa uma vaga e fica ocioso enquanto o gratuito acumula tempo virtual
+        async with controller.slot("pro-0", "pro"):
+            pass
+        for i in range(40):
+            async with controller.slot(f"free-{i}", "gratuito"):
+                pass
+
+        holder = await controller.acquire("holder", "gratuito")
+        waiters = [waiter(controller, order, f"free-{i}", "gratuito") for i in range(10)]
+        await asyncio.sleep(0)
+        waiters += [waiter(controller, order, f"pro-{i}", "pro") for i in range(10)]
+        await drain(controller, holder, waiters)
+        return order
+
+    order = asyncio.run(scenario())
+    assert "gratuito" in order[:5]
+
+
+def test_full_queue_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "AI_ADMISSION_MAX_QUEUE", 1)
+
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        holder = await controller.acquire("holder", "pro")
+        queued = asyncio.ensure_future(controller.acquire("queued", "pro"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("late", "pro")
+        controller.release(holder)
+        controller.release(await queued)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.lanes["pro"].rejected == 1
+    assert controller.active == 0
+
+
+def test_wait_timeout_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "AI_ADMISSION_MAX_WAIT_SECONDS", 0.01)
+
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        holder = await controller.acquire("holder", "pro")
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("waiting", "pro")
+        controller.release(holder)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.queue_depth() == 0
+    assert controller.active == 0
+    assert controller.lanes["pro"].rejected == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        holder = await controller.acquire("holder", "pro")
+        queued = asyncio.ensure_future(controller.acquire("queued", "pro"))
+        await asyncio.sleep(0)
+        assert controller.queue_depth() == 1
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert controller.queue_depth() == 0
+        controller.release(holder)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.active == 0
+    assert controller.active_by_user == {}
+
+
+def test_cancelled_call_releases_its_slot():
+    async def scenario():
+        controller = AdmissionController(capacity=1, per_user=100)
+        entered = asyncio.Event()
+
+        async def call():
+            async with controller.slot("user", "pro"):
+                entered.set()
+                await asyncio.sleep(5)
+
+        task = asyncio.ensure_future(call())
+        await entered.wait()
+        assert controller.active == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # A vaga liberada atende o próximo na hora
+        async with controller.slot("next", "pro"):
+            pass
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.active == 0
+    assert controller.active_by_user == {}
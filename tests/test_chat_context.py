@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.ai_providers import AIProvider, ai_manager
+from app.core.config import settings
+from app.db.session import pool_monitor
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.user import User
+from app.services.chat_context import (
+    ChatContextBuilder,
+    estimate_tokens,
+    refresh_summary,
+    summary_cache,
+)
+
+START = datetime(2026, 1, 5, 9, 0)
+
+
+@pytest.fixture(autouse=True)
+def clear_summary_cache():
+    summary_cache._entries.clear()
+    yield
+    summary_cache._entries.clear()
+
+
+def add_messages(db, chat_session, count, content="x" * 400):
+    messages = []
+    for index in range(count):
+        message = ChatMessage(
+            session_id=chat_session.id,
+            role="user" if index % 2 == 0 else "assistant",
+            content=f"{index}:{content}",
+            created_at=START + timedelta(minutes=index),
+        )
+        db.add(message)
+        messages.append(message)
+    db.commit()
+    return messages
+
+
+def test_history_in_chronological_order_when_it_fits(db, chat_session):
+    messages = add_messages(db, chat_session, 5, content="curta")
+
+    context = ChatContextBuilder(batch_size=2).build(db, chat_session, "Nova pergunta", AIProvider.OPENAI)
+
+    assert [m["content"] for m in context.messages] == [m.content for m in messages]
+    assert context.overflow is False
+    assert context.window_start == messages[0].created_at
+    assert context.tokens == sum(estimate_tokens(m.content) for m in messages)
+
+
+def test_oldest_messages_fall_out_of_the_budget(db, chat_session, monkeypatch):
+    messages = add_messages(db, chat_session, 6)
+    cost = estimate_tokens(messages[0].content)
+    user_message = "Nova pergunta"
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_TOKEN_BUDGET", 3 * cost + estimate_tokens(user_message) + 1)
+
+    context = ChatContextBuilder(batch_size=4).build(db, chat_session, user_message, AIProvider.OPENAI)
+
+    assert [m["content"] for m in context.messages] == [m.content for m in messages[3:]]
+    assert context.overflow is True
+    assert context.window_start == messages[3].created_at
+
+
+def test_summary_replaces_messages_it_covers(db, chat_session):
+    messages = add_messages(db, chat_session, 4, content="curta")
+    chat_session.summary = "Cliente demitido sem justa causa em março."
+    chat_session.summary_until = messages[1].created_at
+    db.commit()
+
+    context = ChatContextBuilder().build(db, chat_session, "Nova pergunta", AIProvider.OPENAI)
+
+    assert context.messages[0]["role"] == "system"
+    assert "Cliente demitido sem justa causa em março." in context.messages[0]["content"]
+    assert [m["content"] for m in context.messages[1:]] == [m.content for m in messages[2:]]
+
+
+def test_refresh_summary_bills_user_without_holding_a_connection(db, chat_session, user, monkeypatch):
+    messages = add_messages(db, chat_session, 4, content="curta")
+    held_connections = []
+
+    async def fake_completion(messages, provider, max_tokens=None, **kwargs):
+        held_connections.append(pool_monitor.checked_out)
+        return "  Resumo: cliente pede verbas rescisórias.  ", 200
+
+    monkeypatch.setattr(ai_manager, "complete_chat", fake_completion)
+    session_id, window_start, covered_until = chat_session.id, messages[2].created_at, messages[1].created_at
+    # Devolver ao pool a conexão da sessão do teste
+    db.commit()
+
+    asyncio.run(refresh_summary(session_id, window_start, AIProvider.OPENAI))
+
+    assert held_connections == [0]
+    db.expire_all()
+    refreshed = db.get(ChatSession, session_id)
+    assert refreshed.summary == "Resumo: cliente pede verbas rescisórias."
+    assert refreshed.summary_until == covered_until
+    assert summary_cache.get(session_id) == (refreshed.summary, refreshed.summary_until)
+    # 200 tokens = 10 créditos, cobrados pelo ledger
+    assert db.get(User, user.id).token_credits == 990
+    charged = db.query(CreditLedgerEntry).filter(CreditLedgerEntry.kind == "summary").one()
+    assert charged.amount == -10
+
+
+def test_refresh_summary_skipped_without_credits(db, chat_session, user, monkeypatch):
+    messages = add_messages(db, chat_session, 4, content="curta")
+    user.token_credits = 0
+    db.commit()
+
+    async def fake_completion(*args, **kwargs):
+        raise AssertionError("o provedor não deve ser chamado sem saldo")
+
+    monkeypatch.setattr(ai_manager, "complete_chat", fake_completion)
+
+    asyncio.run(refresh_summary(chat_session.id, messages[2].created_at, AIProvider.OPENAI))
+
+    db.expire_all()
+    assert db.get(ChatSession, chat_session.id).summary is None
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.dependencies import get_current_user
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.api.v1.endpoints import chat
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.services.chat_turn import PREVIEW_LENGTH, ChatTurn, message_preview
+
+START = datetime(2026, 1, 5, 9, 0)
+
+
+def client_for(user):
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/chat")
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
+
+
+def test_preview_collapses_whitespace_and_truncates():
+    assert message_preview("  Prazo\n\nde   15 dias ") == "Prazo de 15 dias"
+    preview = message_preview("palavra " * 100)
+    assert len(preview) == PREVIEW_LENGTH
+    assert preview.endswith("...")
+
+
+def test_turn_updates_list_fields(db, user, chat_session):
+    ChatTurn(chat_session.id, user.id, "Qual o prazo da contestação trabalhista?").commit(
+        db, "O prazo é de 15 dias.", 40, "openai"
+    )
+    ChatTurn(chat_session.id, user.id, "E no rito sumaríssimo?").commit(
+        db, "Também   15 dias,\nem audiência.", 60, "openai"
+    )
+
+    db.expire_all()
+    refreshed = db.get(ChatSession, chat_session.id)
+    assert refreshed.message_count == 4
+    assert refreshed.total_tokens == 100
+    assert refreshed.last_message_preview == "Também 15 dias, em audiência."
+    assert refreshed.last_message_at is not None
+    # Título só no primeiro turno
+    assert refreshed.title == "Qual o prazo da contestação tr..."
+
+
+def test_session_list_returns_summaries_by_keyset(db, user):
+    for index in range(3):
+        db.add(ChatSession(
+            id=f"session-{index}",
+            user_id=user.id,
+            title=f"Caso {index}",
+            updated_at=START + timedelta(hours=index),
+            message_count=index * 2,
+            total_tokens=index * 100,
+            last_message_preview=f"Última mensagem {index}",
+        ))
+    db.commit()
+    client = client_for(user)
+
+    first = client.get("/chat/", params={"limit": 2})
+    assert first.status_code == 200
+    assert [s["id"] for s in first.json()] == ["session-2", "session-1"]
+    assert first.json()[0]["message_count"] == 4
+    assert first.json()[0]["total_tokens"] == 200
+    assert first.json()[0]["last_message_preview"] == "Última mensagem 2"
+    assert "messages" not in first.json()[0]
+
+    second = client.get("/chat/", params={"limit": 2, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+    assert [s["id"] for s in second.json()] == ["session-0"]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+def test_invalid_cursor_is_rejected(db, user):
+    assert client_for(user).get("/chat/", params={"cursor": "não-é-cursor"}).status_code == 400
+
+
+def test_migration_backfills_existing_sessions(db, user, chat_session, migrate):
+    session_id = chat_session.id
+    migrate("d2a7f4c9b813", "downgrade")
+    for index, (content, tokens) in enumerate([("Pergunta", 0), ("Resposta antiga", 30), ("Resposta final", 45)]):
+        db.add(ChatMessage(
+            session_id=session_id,
+            role="user" if index == 0 else "assistant",
+            content=content,
+            tokens_used=tokens,
+            created_at=START + timedelta(minutes=index),
+        ))
+    db.commit()
+
+    migrate("d2a7f4c9b813")
+
+    backfilled = db.get(ChatSession, session_id)
+    assert backfilled.message_count == 3
+    assert backfilled.total_tokens == 75
+    assert backfilled.last_message_preview == "Resposta final"
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.core.ai_providers import AIProvider, ai_manager
+from app.core.token_estimator import TokenEstimate
+from app.models.chat_message import ChatMessage
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.user import User
+from app.services.chat_context import refresh_summary
+from app.services.credit_ledger import InsufficientCredits, credit_ledger
+
+
+def balance(db, user):
+    db.expire_all()
+    return db.get(User, user.id).token_credits
+
+
+def entries(db, user):
+    rows = db.query(CreditLedgerEntry).filter(CreditLedgerEntry.user_id == user.id)
+    return sorted((entry.kind, entry.amount) for entry in rows)
+
+
+def test_settle_below_reservation_refunds_the_rest(db, user):
+    reservation = credit_ledger.reserve(user.id, 50)
+    assert balance(db, user) == 950
+
+    charged = credit_ledger.settle(db, reservation, 20, "chat", "message-1")
+    db.commit()
+
+    assert charged == 20
+    assert balance(db, user) == 980
+    assert entries(db, user) == [("chat", -20), ("release", 50), ("reserve", -50)]
+
+
+def test_settle_above_reservation_charges_the_difference(db, user):
+    reservation = credit_ledger.reserve(user.id, 10)
+
+    charged = credit_ledger.settle(db, reservation, 30, "chat", "message-1")
+    db.commit()
+
+    assert charged == 30
+    assert balance(db, user) == 970
+    assert sum(amount for _, amount in entries(db, user)) == -30
+
+
+def test_settle_above_balance_charges_what_is_left(db, user):
+    reservation = credit_ledger.reserve(user.id, 990)
+
+    charged = credit_ledger.settle(db, reservation, 1200, "chat", "message-1")
+    db.commit()
+
+    assert charged == 1000
+    assert balance(db, user) == 0
+
+
+def test_release_returns_reservation_once(db, user):
+    reservation = credit_ledger.reserve(user.id, 50)
+
+    credit_ledger.release(reservation)
+    credit_ledger.release(reservation)
+
+    assert balance(db, user) == 1000
+    assert entries(db, user) == [("release", 50), ("reserve", -50)]
+
+
+def test_provider_error_releases_reservation(db, chat_session, user, monkeypatch):
+    start = datetime(2026, 1, 5, 9, 0)
+    for index in range(3):
+        db.add(ChatMessage(session_id=chat_session.id, role="user", content="Pergunta", created_at=start + timedelta(minutes=index)))
+    session_id = chat_session.id
+    db.commit()
+
+    reserved_balance = []
+
+    async def failing_completion(*args, **kwargs):
+        reserved_balance.append(credit_ledger.balance(user.id))
+        raise RuntimeError("provedor fora do ar")
+
+    monkeypatch.setattr(ai_manager, "complete_chat", failing_completion)
+
+    asyncio.run(refresh_summary(session_id, start + timedelta(minutes=2), AIProvider.OPENAI))
+
+    assert reserved_balance[0] < 1000
+    assert balance(db, user) == 1000
+    assert sum(amount for _, amount in entries(db, user)) == 0
+
+
+def test_overdraft_is_refused(db, user):
+    with pytest.raises(InsufficientCredits):
+        credit_ledger.reserve(user.id, 1001)
+
+    assert not credit_ledger._try_debit(db, user.id, 1001)
+    assert credit_ledger._try_debit(db, user.id, 1000)
+    db.commit()
+    assert balance(db, user) == 0
+    assert entries(db, user) == []
+
+
+def test_reservation_trims_completion_to_balance(db, user):
+    user.token_credits = 30
+    db.commit()
+
+    # 600 tokens cabem em 30 créditos: 100 de prompt + 500 de resposta
+    reservation = credit_ledger.reserve_tokens(user.id, TokenEstimate(prompt_tokens=100, max_tokens=1000))
+
+    assert reservation.max_tokens == 500
+    assert balance(db, user) == 0
+
+    credit_ledger.release(reservation)
+    with pytest.raises(InsufficientCredits):
+        # Menos que AI_MIN_COMPLETION_TOKENS de resposta: nem chama o provedor
+        credit_ledger.reserve_tokens(user.id, TokenEstimate(prompt_tokens=500, max_tokens=1000))
+
+
+def test_migration_folds_purchased_credits(db, user, migrate):
+    migrate("a8e41c7d2f95", "downgrade")
+    db.execute(
+        text("UPDATE users SET token_credits = 100, available_credits = 25.7 WHERE id = :id"),
+        {"id": user.id}
+    )
+    db.commit()
+
+    migrate("a8e41c7d2f95")
+
+    folded = db.get(User, user.id)
+    assert folded.token_credits == 125
+    assert folded.available_credits == 0
+    assert entries(db, user) == [("opening", 25), ("opening", 100)]
+
+    migrate("a8e41c7d2f95", "downgrade")
+
+    restored = db.execute(
+        text("SELECT token_credits, available_credits FROM users WHERE id = :id"), {"id": user.id}
+    ).one()
+    assert tuple(restored) == (100, 25)
+    # Tabela de volta para o drop_all do fixture
+    migrate("a8e41c7d2f95")
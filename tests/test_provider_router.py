@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.core.ai_providers import AIProvider, AIProviderManager, provider_router
+from app.core.config import settings
+from app.core.provider_router import ProviderRouter
+
+MESSAGES = [{"role": "user", "content": "Qual o prazo para apresentar contestação?"}]
+
+
+class EchoProvider:
+    """Simulador que responde na hora, registrando as chamadas"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, messages, model=None, max_tokens=None):
+        self.calls += 1
+        return "Resposta simulada", 42
+
+
+def test_local_is_never_failed_over():
+    assert provider_router.candidates(AIProvider.LOCAL) == [AIProvider.LOCAL]
+
+
+def test_real_providers_never_fail_over_to_local():
+    for provider in (AIProvider.OPENAI, AIProvider.CLAUDE, AIProvider.DEEPSEEK):
+        candidates = provider_router.candidates(provider)
+        assert candidates[0] == provider
+        assert AIProvider.LOCAL not in candidates
+
+
+def test_local_completion_reaches_simulator():
+    async def scenario():
+        manager = AIProviderManager()
+        simulator = EchoProvider()
+        manager._local_provider = lambda: simulator
+        try:
+            result = await manager.complete_chat(MESSAGES, provider=AIProvider.LOCAL, use_cache=False)
+        finally:
+            await manager.aclose()
+        return simulator, result
+
+    simulator, result = asyncio.run(scenario())
+    assert simulator.calls == 1
+    assert result == ("Resposta simulada", 42)
+
+
+class ProviderDown(Exception):
+    pass
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "AI_HEDGING_ENABLED", True)
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "AI_HEDGE_MAX_DELAY_SECONDS", 0.01)
+
+
+def test_failover_records_failure(monkeypatch):
+    monkeypatch.setattr(settings, "AI_HEDGING_ENABLED", False)
+    router = ProviderRouter(["openai", "claude"])
+
+    async def call(provider):
+        if provider == "openai":
+            raise ProviderDown("503")
+        return f"resposta de {provider}"
+
+    assert asyncio.run(router.call("openai", call)) == ("claude", "resposta de claude")
+    assert router.health["openai"].consecutive_failures == 1
+    assert router.health["claude"].stats()["requests"] == 1
+
+
+def test_hedge_answers_when_preferred_is_slow(hedging):
+    router = ProviderRouter(["openai", "claude"])
+    cancelled = []
+
+    async def call(provider):
+        if provider == "openai":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(provider)
+                raise
+        return f"resposta de {provider}"
+
+    async def scenario():
+        result = await router.call("openai", call)
+        # Deixar o cancelamento do perdedor chegar à task
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(scenario()) == ("claude", "resposta de claude")
+    assert cancelled == ["openai"]
+    # O perdedor cancelado não conta como falha
+    assert router.health["openai"].stats()["requests"] == 0
+
+
+def test_losers_finishing_with_the_winner_are_recorded(hedging):
+    router = ProviderRouter(["openai", "claude"])
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        gate = loop.create_future()
+        loop.call_later(0.05, gate.set_result, None)
+
+        async def call(provider):
+            # Os dois provedores terminam na mesma volta do event loop
+            await gate
+            if provider == "openai":
+                raise ProviderDown("503")
+            return f"resposta de {provider}"
+
+        return await router.call("openai", call)
+
+    assert asyncio.run(scenario()) == ("claude", "resposta de claude")
+    assert router.health["openai"].consecutive_failures == 1
+    assert router.health["openai"].error_rate() == 1.0
+    assert router.health["claude"].error_rate() == 0.0
@@ -0,0 +1,121 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.dependencies import get_admin_user
+from app.api.v1.endpoints import admin
+from app.core import response_cache as response_cache_module
+from app.core.ai_providers import AIProvider, ai_manager, provider_router
+from app.core.response_cache import ResponseCache, response_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def question(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache_module.time, "monotonic", clock)
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    cache.set(question("Qual o prazo da contestação?"), "openai", "gpt-4o", "15 dias úteis", 42)
+
+    clock.now += 59
+    assert cache.get(question("qual o prazo da contestação"), "openai", "gpt-4o") == ("15 dias úteis", 42)
+
+    clock.now += 2
+    assert cache.get(question("Qual o prazo da contestação?"), "openai", "gpt-4o") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set(question("primeira"), "openai", "gpt-4o", "1", 1)
+    cache.set(question("segunda"), "openai", "gpt-4o", "2", 1)
+    # Leitura torna a primeira a mais recente
+    assert cache.get(question("primeira"), "openai", "gpt-4o") is not None
+
+    cache.set(question("terceira"), "openai", "gpt-4o", "3", 1)
+
+    assert cache.get(question("segunda"), "openai", "gpt-4o") is None
+    assert cache.get(question("primeira"), "openai", "gpt-4o") == ("1", 1)
+    assert cache.get(question("terceira"), "openai", "gpt-4o") == ("3", 1)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_tokens_is_part_of_the_key():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, semantic_enabled=True, semantic_threshold=0.5)
+    cache.set(question("Qual o prazo da contestação?"), "openai", "gpt-4o", "resposta curta", 10, max_tokens=50)
+
+    assert cache.get(question("Qual o prazo da contestação?"), "openai", "gpt-4o", 1000) is None
+    assert cache.get(question("Qual o prazo da contestação?"), "openai", "gpt-4o", 50) == ("resposta curta", 10)
+
+
+def test_semantic_match_respects_threshold():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, semantic_enabled=True, semantic_threshold=0.6)
+    cache.set(
+        question("Qual o prazo para apresentar contestação no processo trabalhista?"),
+        "openai", "gpt-4o", "15 dias úteis", 42
+    )
+
+    similar = question("Prazo para apresentar contestação no processo civil")
+    assert cache.get(similar, "openai", "gpt-4o") == ("15 dias úteis", 42)
+    assert cache.stats()["semantic_hits"] == 1
+
+    unrelated = question("Como calcular pensão alimentícia?")
+    assert cache.get(unrelated, "openai", "gpt-4o") is None
+
+    strict = ResponseCache(max_entries=10, ttl_seconds=60, semantic_enabled=True, semantic_threshold=0.9)
+    strict.set(
+        question("Qual o prazo para apresentar contestação no processo trabalhista?"),
+        "openai", "gpt-4o", "15 dias úteis", 42
+    )
+    assert strict.get(similar, "openai", "gpt-4o") is None
+
+
+def test_semantic_match_ignores_follow_up_turns():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, semantic_enabled=True, semantic_threshold=0.5)
+    cache.set(question("Prazo da contestação trabalhista"), "openai", "gpt-4o", "15 dias úteis", 42)
+
+    follow_up = [
+        {"role": "user", "content": "Olá"},
+        {"role": "assistant", "content": "Olá! Como posso ajudar?"},
+        {"role": "user", "content": "Prazo da contestação trabalhista"},
+    ]
+    assert cache.get(follow_up, "openai", "gpt-4o") is None
+
+
+def test_admin_endpoint_clears_cache():
+    app = FastAPI()
+    app.include_router(admin.router, prefix="/admin")
+    app.dependency_overrides[get_admin_user] = lambda: None
+    response_cache.set(question("Qual o prazo da contestação?"), "openai", "gpt-4o", "15 dias úteis", 42)
+    assert response_cache.stats()["size"] >= 1
+
+    response = TestClient(app).delete("/admin/ai/cache")
+
+    assert response.status_code == 200
+    assert response_cache.stats()["size"] == 0
+    assert response_cache.get(question("Qual o prazo da contestação?"), "openai", "gpt-4o") is None
+
+
+def test_fallback_answers_are_not_cached(monkeypatch):
+    async def fallback_call(preferred, call):
+        return AIProvider.CLAUDE, ("resposta do Claude", 30)
+
+    monkeypatch.setattr(provider_router, "call", fallback_call)
+    response_cache.clear()
+    messages = question("Qual o prazo da contestação?")
+
+    result = asyncio.run(ai_manager.complete_chat(messages, AIProvider.OPENAI, max_tokens=100))
+
+    assert result == ("resposta do Claude", 30)
+    assert response_cache.stats()["size"] == 0
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from app.core.single_flight import run_once
+
+
+def test_failed_execution_is_not_replayed():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("provedor indisponível")
+        return {"status": "success"}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await run_once("user-1:test.flaky", {"a": 1}, flaky, "key-1")
+        assert await run_once("user-1:test.flaky", {"a": 1}, flaky, "key-1") == {"status": "success"}
+        # Agora guardado: a terceira tentativa não executa de novo
+        assert await run_once("user-1:test.flaky", {"a": 1}, flaky, "key-1") == {"status": "success"}
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_result_rejected_by_store_if_is_not_replayed():
+    calls = []
+
+    async def process():
+        calls.append(1)
+        return {"failed": len(calls) == 1}
+
+    async def scenario():
+        for _ in range(3):
+            await run_once(
+                "user-1:test.store-if", {"a": 1}, process, "key-1",
+                store_if=lambda result: not result["failed"]
+            )
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
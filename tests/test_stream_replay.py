@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.dependencies import get_current_user
+from app.api.v1.endpoints import chat
+from app.services.stream_replay import (
+    ReplayStream,
+    ResumeUnavailable,
+    StreamRegistry,
+    parse_event_id,
+    stream_registry,
+)
+
+
+def finished_stream(user_id, contents, max_events=10):
+    stream = ReplayStream("stream-1", user_id, max_events=max_events, grace_seconds=1)
+    for content in contents:
+        stream.append({"content": content, "done": False})
+    stream.append({"content": "", "done": True})
+    stream.finish()
+    return stream
+
+
+async def collect(stream, after):
+    return [(seq, data["content"]) async for seq, data in stream.follow(after)]
+
+
+@pytest.fixture
+def client(db, user):
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/chat")
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    stream_registry._streams.clear()
+
+
+def test_parse_event_id():
+    assert parse_event_id("abc123:7") == ("abc123", 7)
+    assert parse_event_id(" abc123:0 ") == ("abc123", 0)
+    for invalid in ("", "abc123", "abc123:", ":7", "abc123:-1", "abc123:sete"):
+        assert parse_event_id(invalid) is None
+
+
+def test_follow_resumes_after_last_seen_event():
+    stream = finished_stream("1", ["Prazo ", "de 15 ", "dias"])
+
+    assert asyncio.run(collect(stream, 2)) == [(3, "dias"), (4, "")]
+    assert asyncio.run(collect(stream, 4)) == []
+
+
+def test_evicted_events_cannot_be_resumed():
+    stream = finished_stream("1", ["a", "b", "c", "d", "e"], max_events=3)
+
+    assert stream.can_resume(3)
+    assert not stream.can_resume(1)
+    with pytest.raises(ResumeUnavailable):
+        asyncio.run(collect(stream, 1))
+
+
+def test_generation_aborted_when_nobody_reconnects():
+    registry = StreamRegistry(max_streams=10, max_events=10, ttl_seconds=60, grace_seconds=0.01)
+
+    async def produce(stream):
+        stream.append({"content": "Prazo ", "done": False})
+        await asyncio.sleep(5)
+
+    async def scenario():
+        stream = registry.start("1", produce)
+        async for seq, data in stream.follow(0):
+            # Cliente desconecta depois do primeiro trecho
+            break
+        await asyncio.wait_for(stream.producer, timeout=1)
+        return stream
+
+    stream = asyncio.run(scenario())
+    assert stream.done
+    assert registry.abandoned == 1
+
+
+def test_reconnect_replays_missed_events(client, user):
+    stream = finished_stream(user.id, ["Prazo ", "de 15 ", "dias"])
+    stream_registry._streams[stream.stream_id] = stream
+
+    response = client.post(
+        "/chat/stream",
+        json={"message": "Qual o prazo?"},
+        headers={"Last-Event-ID": "stream-1:1"}
+    )
+
+    assert response.status_code == 200
+    assert "stream-1:1\n" not in response.text
+    assert "id: stream-1:2\n" in response.text
+    assert "id: stream-1:4\n" in response.text
+    assert '"done": true' in response.text
+
+
+def test_invalid_last_event_id_is_rejected(client):
+    response = client.post("/chat/stream", json={"message": "Qual o prazo?"}, headers={"Last-Event-ID": "lixo"})
+    assert response.status_code == 400
+
+
+def test_unknown_or_foreign_stream_is_gone(client):
+    stream_registry._streams["stream-1"] = finished_stream("outro-usuario", ["Prazo"])
+    for event_id in ("desconhecido:3", "stream-1:1"):
+        response = client.post("/chat/stream", json={"message": "Qual o prazo?"}, headers={"Last-Event-ID": event_id})
+        assert response.status_code == 410
+
+
+def test_evicted_events_are_gone(client, user):
+    stream = finished_stream(user.id, ["a", "b", "c", "d", "e"], max_events=3)
+    stream_registry._streams[stream.stream_id] = stream
+
+    response = client.post("/chat/stream", json={"message": "Qual o prazo?"}, headers={"Last-Event-ID": "stream-1:1"})
+
+    assert response.status_code == 410
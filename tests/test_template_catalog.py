@@ -0,0 +1,160 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.dependencies import get_current_user
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.api.v1.endpoints import documents
+from app.models.document import Template
+from app.services.template_catalog import TemplateCatalog, index_after, template_catalog
+
+
+def add_template(db, id, name, category, type, content="Texto do [NOME]", variables=None):
+    db.add(Template(id=id, name=name, category=category, type=type, content=content, variables=variables))
+
+
+@pytest.fixture
+def library(db):
+    add_template(db, "t1", "Reclamação trabalhista", "Trabalhista", "Inicial")
+    add_template(db, "t2", "Contestação", "Trabalhista", "Defesa")
+    add_template(db, "t3", "Divórcio consensual", "Família", "Inicial")
+    add_template(db, "t4", "Alimentos", "Família", "Inicial")
+    add_template(db, "t5", "Agravo", "Cível", "Recurso")
+    db.commit()
+
+
+@pytest.fixture
+def client(db, user, library, monkeypatch):
+    monkeypatch.setattr(template_catalog, "check_seconds", 0)
+    template_catalog.invalidate()
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/documents")
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    template_catalog.invalidate()
+
+
+def test_snapshot_orders_and_indexes_templates(db, library):
+    snapshot = TemplateCatalog(check_seconds=60).snapshot(db)
+
+    assert [t.id for t in snapshot.templates] == ["t5", "t4", "t3", "t2", "t1"]
+    assert [t.id for t in snapshot.filter("Família")] == ["t4", "t3"]
+    assert [t.id for t in snapshot.filter(template_type="Inicial")] == ["t4", "t3", "t1"]
+    assert [t.id for t in snapshot.filter("Trabalhista", "Inicial")] == ["t1"]
+    assert snapshot.filter("Tributário") == []
+    assert snapshot.categories == {
+        "categorias": ["Cível", "Família", "Trabalhista"],
+        "subcategorias": {"Cível": ["Recurso"], "Família": ["Inicial"], "Trabalhista": ["Defesa", "Inicial"]},
+    }
+
+
+def test_find_by_id_or_name(db, library):
+    catalog = TemplateCatalog(check_seconds=60)
+
+    assert catalog.find(db, "t2").name == "Contestação"
+    assert catalog.find(db, "Contestação").id == "t2"
+    assert catalog.find(db, "inexistente") is None
+
+
+def test_stored_variables_are_used_and_missing_ones_parsed(db):
+    add_template(db, "a", "Com variáveis", "Cível", "Inicial", content="[IGNORADO]",
+                 variables=json.dumps([{"name": "AUTOR", "occurrences": 2, "first_position": 0}]))
+    add_template(db, "b", "Formato antigo", "Cível", "Inicial", content="[IGNORADO]", variables='["RÉU"]')
+    add_template(db, "c", "Sem variáveis", "Cível", "Inicial", content="[VARA] de [CIDADE], [VARA]")
+    db.commit()
+
+    snapshot = TemplateCatalog(check_seconds=60).snapshot(db)
+
+    assert snapshot.by_id["a"].variables == ["AUTOR"]
+    assert snapshot.by_id["b"].variables == ["RÉU"]
+    assert snapshot.by_id["c"].variable_metadata == [
+        {"name": "VARA", "occurrences": 2, "first_position": 0},
+        {"name": "CIDADE", "occurrences": 1, "first_position": 10},
+    ]
+
+
+def test_snapshot_is_reused_until_the_table_changes(db, library):
+    catalog = TemplateCatalog(check_seconds=0)
+    first = catalog.snapshot(db)
+    assert catalog.snapshot(db) is first
+    assert catalog.loads == 1
+
+    add_template(db, "t6", "Mandado de segurança", "Cível", "Inicial")
+    db.commit()
+
+    second = catalog.snapshot(db)
+    assert second is not first
+    assert second.version == first.version + 1
+    assert "t6" in second.by_id
+
+
+def test_snapshot_not_rechecked_within_interval(db, library):
+    catalog = TemplateCatalog(check_seconds=60)
+    first = catalog.snapshot(db)
+    add_template(db, "t6", "Mandado de segurança", "Cível", "Inicial")
+    db.commit()
+
+    assert catalog.snapshot(db) is first
+
+    catalog.invalidate()
+    assert "t6" in catalog.snapshot(db).by_id
+
+
+def test_contents_are_cached_per_version(db, library):
+    catalog = TemplateCatalog(check_seconds=60, content_cache_size=1)
+    snapshot = catalog.snapshot(db)
+
+    catalog.content(db, snapshot.by_id["t1"])
+    catalog.content(db, snapshot.by_id["t1"])
+    catalog.content(db, snapshot.by_id["t2"])
+    catalog.content(db, snapshot.by_id["t1"])
+
+    assert (catalog.content_hits, catalog.content_misses) == (1, 3)
+    catalog.invalidate()
+    assert catalog.stats()["cached_contents"] == 0
+
+
+def test_index_after_finds_position_past_key(db, library):
+    templates = TemplateCatalog(check_seconds=60).snapshot(db).templates
+
+    assert index_after(templates, templates[1].sort_key) == 2
+    assert index_after(templates, ("", "", "", "")) == 0
+    assert index_after(templates, ("Família", "Inicial", "B", "")) == 2
+    assert index_after(templates, ("Zzz",)) == len(templates)
+
+
+def test_cursor_pages_cover_catalog_once(client):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/documents/templates", params=params).json()
+        assert body["total"] == 5
+        seen += [item["id"] for item in body["data"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["t5", "t4", "t3", "t2", "t1"]
+
+
+def test_cursor_is_stable_when_templates_are_added(client, db):
+    first = client.get("/documents/templates", params={"limit": 2})
+    assert [item["id"] for item in first.json()["data"]] == ["t5", "t4"]
+
+    # Entra antes do cursor: com OFFSET, "t4" apareceria de novo na próxima página
+    add_template(db, "t0", "Ação anulatória", "Cível", "Inicial")
+    db.commit()
+
+    second = client.get("/documents/templates", params={"limit": 2, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+    assert [item["id"] for item in second.json()["data"]] == ["t3", "t2"]
+    assert second.json()["total"] == 6
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get("/documents/templates", params={"cursor": "não-é-cursor"})
+    assert response.status_code == 400
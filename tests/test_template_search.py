@@ -0,0 +1,126 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.api.dependencies import get_current_user, get_db
+from app.api.v1.endpoints import documents
+from app.db.base import engine
+from app.models.document import Template
+from app.services.template_search import SQLITE_DROP_DDL, fts5_query, template_search
+
+
+@pytest.fixture
+def library(db):
+    template_search.ensure_index(engine)
+    templates = [
+        Template(
+            id="contestacao", name="Contestação trabalhista", description="Defesa do reclamado",
+            content="O reclamado vem apresentar contestação aos pedidos de horas extras.",
+            category="Trabalhista", type="Defesa"
+        ),
+        Template(
+            id="recurso", name="Recurso ordinário", description="Recurso contra sentença",
+            content="Inconformado, o recorrente interpõe recurso; a contestação não foi apreciada.",
+            category="Trabalhista", type="Recurso"
+        ),
+        Template(
+            id="divorcio", name="Divórcio consensual", description="Família",
+            content="As partes requerem a homologação do divórcio.",
+            category="Família", type="Inicial"
+        ),
+    ]
+    db.add_all(templates)
+    db.commit()
+    yield templates
+    db.close()
+    with engine.begin() as connection:
+        for statement in SQLITE_DROP_DDL:
+            connection.execute(text(statement))
+
+
+def test_query_terms_are_quoted_prefixes():
+    assert fts5_query('contestação "OR" horas*') == '"contestação"* "OR"* "horas"*'
+    assert fts5_query("!!") == ""
+
+
+def test_name_matches_rank_above_content_matches(db, library):
+    results = template_search.search(db, "contestacao")
+
+    assert [r["id"] for r in results] == ["contestacao", "recurso"]
+    assert results[0]["rank"] > results[1]["rank"]
+
+
+def test_snippet_highlights_matched_terms(db, library):
+    result = template_search.search(db, "horas extra")[0]
+
+    assert result["id"] == "contestacao"
+    assert "<mark>horas</mark> <mark>extras</mark>" in result["snippet"]
+
+
+def test_filters_and_pagination(db, library):
+    assert [r["id"] for r in template_search.search(db, "contest", template_type="Recurso")] == ["recurso"]
+    assert [r["id"] for r in template_search.search(db, "contest", skip=1, limit=1)] == ["recurso"]
+    assert template_search.search(db, "contest", category="Família") == []
+
+
+def test_index_follows_updates_and_deletes(db, library):
+    db.delete(db.get(Template, "contestacao"))
+    db.get(Template, "divorcio").content = "Contestação ao pedido de divórcio."
+    db.commit()
+
+    assert sorted(r["id"] for r in template_search.search(db, "contestacao")) == ["divorcio", "recurso"]
+
+
+def test_results_survive_vacuum(db, library):
+    # Sem INTEGER PRIMARY KEY, o VACUUM pode renumerar o rowid de templates
+    db.delete(db.get(Template, "contestacao"))
+    db.commit()
+    db.close()
+    with engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+
+    results = template_search.search(db, "divorcio")
+
+    assert [r["id"] for r in results] == ["divorcio"]
+    assert results[0]["document_name"] == "Divórcio consensual"
+
+
+def test_ensure_index_replaces_rowid_index(db, library):
+    with engine.begin() as connection:
+        for statement in SQLITE_DROP_DDL:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE templates_fts USING fts5("
+            "name, description, content, content='templates', content_rowid='rowid')"
+        ))
+    db.close()
+
+    template_search.ensure_index(engine)
+
+    assert [r["id"] for r in template_search.search(db, "divorcio")] == ["divorcio"]
+
+
+class UnsupportedSession:
+    """Sessão de um banco sem busca textual"""
+
+    def get_bind(self):
+        return type("Bind", (), {"dialect": type("Dialect", (), {"name": "mysql"})()})()
+
+
+def test_unsupported_database_returns_501(user):
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/documents")
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_db] = UnsupportedSession
+
+    response = TestClient(app).get("/documents/templates/search", params={"q": "contestação"})
+
+    assert response.status_code == 501
+
+
+def test_migration_indexes_existing_templates(db, library, migrate):
+    migrate("c3f9d1a7e264", "downgrade")
+    migrate("c3f9d1a7e264")
+
+    assert [r["id"] for r in template_search.search(db, "divorcio")] == ["divorcio"]
@@ -0,0 +1,78 @@
+from app.utils import templates
+from app.utils.templates import compile_template, render_template
+
+PETICAO = (
+    "EXCELENTÍSSIMO SENHOR DOUTOR JUIZ DA [VARA] VARA DO TRABALHO DE [CIDADE]\n\n"
+    "[NOME_DO_AUTOR], inscrito no CPF sob o nº [CPF], vem propor RECLAMAÇÃO TRABALHISTA "
+    "em face de [NOME_DA_RÉ]. Nestes termos, [NOME_DO_AUTOR] pede deferimento."
+)
+
+
+def replace_each(content, values):
+    """Renderização por str.replace, uma variável por vez (comportamento original)"""
+    for name, value in values.items():
+        if value:
+            content = content.replace(f"[{name}]", str(value))
+    return content
+
+
+def test_filled_variables_match_str_replace():
+    values = {
+        "VARA": "2ª",
+        "CIDADE": "Campinas",
+        "NOME_DO_AUTOR": "Maria da Silva",
+        "CPF": "123.456.789-00",
+        "NOME_DA_RÉ": "Empresa Ltda.",
+    }
+
+    rendered = render_template(PETICAO, values)
+
+    assert rendered.text == replace_each(PETICAO, values)
+    assert rendered.unfilled == []
+
+
+def test_unfilled_variables_keep_their_markers():
+    values = {"VARA": "2ª", "CIDADE": "", "NOME_DO_AUTOR": "Maria da Silva"}
+
+    rendered = render_template(PETICAO, values)
+
+    assert rendered.text == replace_each(PETICAO, values)
+    assert "[CIDADE]" in rendered.text
+    assert rendered.unfilled == ["CIDADE", "CPF", "NOME_DA_RÉ"]
+
+
+def test_values_are_inserted_literally():
+    values = {
+        "NOME_DO_AUTOR": "[CPF]",
+        "CPF": r"\1 $0 .* \n",
+        "NOME_DA_RÉ": "Empresa [Filial] & Cia <Ltda>",
+    }
+
+    text = render_template(PETICAO, values).text
+
+    # Um valor com cara de marcador não é substituído de novo
+    assert "[CPF], inscrito no CPF sob o nº \\1 $0 .* \\n," in text
+    assert "em face de Empresa [Filial] & Cia <Ltda>." in text
+
+
+def test_text_without_markers_is_unchanged():
+    for content in ("", "Sem marcadores.", "Colchete solto [ no meio", "Vazio [] fica"):
+        assert render_template(content, {"X": "valor"}).text == content
+
+
+def test_compiled_templates_are_cached_by_digest(monkeypatch):
+    monkeypatch.setattr(templates, "COMPILED_CACHE_SIZE", 2)
+    templates._compiled.clear()
+
+    first = compile_template(PETICAO)
+    # Mesmo conteúdo em outro objeto str: mesma forma compilada
+    assert compile_template("".join(list(PETICAO))) is first
+    assert all(len(key) == 40 for key in templates._compiled)
+
+    compile_template("Outro [TEXTO]")
+    compile_template(PETICAO)
+    compile_template("Terceiro [TEXTO]")
+
+    # O menos usado recentemente sai
+    assert compile_template(PETICAO) is first
+    assert len(templates._compiled) == 2